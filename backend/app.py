@@ -1,8 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
+import json
+import click
 from datetime import timedelta
 import logging
 
@@ -12,14 +17,36 @@ from models.product import Product
 from models.recommendation import Recommendation
 
 # Import services
-from services.skin_analysis import analyze_quiz_results, analyze_skin_image
+from services.skin_analysis import analyze_quiz_results
 from services.recommendation_engine import get_personalized_recommendations, filter_products
-from services.chatbot_service import process_user_query
-from services.image_processing import preprocess_image, detect_skin_concerns
+from services.chatbot_service import process_user_query, stream_user_query
+from services.knowledge_base import init_knowledge_base
+from services.chatbot_cache import init_chatbot_cache, get_chatbot_cache_stats
+from services.product_index import init_product_index, get_product_index_stats
+from services.user_context import init_user_context, get_user_context, get_user_context_stats
+from services.routine_conflicts import find_routine_conflicts, routine_products
+from services.image_processing import configure_inference, get_inference_stats, get_model_version
+from services.analysis_cache import init_analysis_cache, get_analysis_cache_stats
+from services.storage import (
+    init_storage, read_upload, detect_image_extension, decode_preview, store_image, thumbnail_urls,
+    LocalStorageBackend, S3StorageBackend, PREVIEW_THUMBNAIL, UploadTooLarge, UnsupportedImage
+)
+from services.analysis_pool import (
+    init_analysis_pool, run_analysis, get_analysis_pool_stats, AnalysisPoolBusy, AnalysisTimeout
+)
+from services.reanalysis import reanalyze_progress_images
+from services.feedback_mining import mine_feedback_concerns
+from services.dedupe import perceptual_hash, find_near_duplicate, index_progress_image
+from services.analysis_jobs import (
+    init_analysis_jobs, submit_analysis_job, get_analysis_job, get_analysis_job_stats, IdempotencyConflict
+)
+
+# Import ML
+from ml.model_registry import model_registry
 
 # Import utils
 from utils.database import db, init_db
-from utils.helpers import validate_email, generate_response
+from utils.helpers import validate_email, generate_response, extract_concerns_from_feedback
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,18 +63,169 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+app.config['S3_PUBLIC_URL'] = os.environ.get('S3_PUBLIC_URL')
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+# Leave room for the other multipart fields around the image
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
+app.config['SKIN_MODEL_BACKEND'] = os.environ.get('SKIN_MODEL_BACKEND', 'mock')
+app.config['SKIN_MODEL_PATH'] = os.environ.get('SKIN_MODEL_PATH')
+app.config['SKIN_MODEL_VERSION'] = os.environ.get('SKIN_MODEL_VERSION')
+app.config['INFERENCE_THREADS'] = int(os.environ.get('INFERENCE_THREADS', 1))
+app.config['INFERENCE_MAX_BATCH_SIZE'] = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 16))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 5))
+app.config['INPUT_BUFFER_SLOTS'] = int(os.environ.get('INPUT_BUFFER_SLOTS', 8))
+# Batch sizes run once at boot so the first requests skip model loading and graph optimization; empty disables
+app.config['MODEL_WARM_UP_BATCH_SIZES'] = [
+    int(size) for size in os.environ.get('MODEL_WARM_UP_BATCH_SIZES', f"1,{app.config['INFERENCE_MAX_BATCH_SIZE']}").split(',')
+    if size.strip()
+]
+app.config['ANALYSIS_POOL_WORKERS'] = int(os.environ.get('ANALYSIS_POOL_WORKERS', 2))
+app.config['ANALYSIS_POOL_MAX_PENDING'] = int(os.environ.get('ANALYSIS_POOL_MAX_PENDING', 8))
+app.config['ANALYSIS_TIMEOUT'] = float(os.environ.get('ANALYSIS_TIMEOUT', 30))
+app.config['ANALYSIS_RETRY_AFTER'] = int(os.environ.get('ANALYSIS_RETRY_AFTER', 5))
+app.config['ANALYSIS_CACHE_SIZE'] = int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024))
+app.config['ANALYSIS_CACHE_DIR'] = os.environ.get('ANALYSIS_CACHE_DIR')
+app.config['ANALYSIS_JOB_DISPATCHERS'] = int(os.environ.get('ANALYSIS_JOB_DISPATCHERS', app.config['ANALYSIS_POOL_WORKERS']))
+app.config['ANALYSIS_JOB_MAX_ATTEMPTS'] = int(os.environ.get('ANALYSIS_JOB_MAX_ATTEMPTS', 3))
+app.config['ANALYSIS_JOB_RETRY_BACKOFF'] = float(os.environ.get('ANALYSIS_JOB_RETRY_BACKOFF', 2))
+app.config['ANALYSIS_JOB_LEASE'] = int(os.environ.get('ANALYSIS_JOB_LEASE', 120))
+# Largest perceptual hash distance (of 64 bits, at most 7) at which a progress photo reuses an earlier one; -1 disables
+app.config['PROGRESS_DEDUPE_MAX_DISTANCE'] = int(os.environ.get('PROGRESS_DEDUPE_MAX_DISTANCE', 4))
+# Only photos taken this close together count as retakes of each other; 0 disables
+app.config['PROGRESS_DEDUPE_WINDOW_MINUTES'] = int(os.environ.get('PROGRESS_DEDUPE_WINDOW_MINUTES', 30))
+# Chatbot FAQ, ingredient and compatibility knowledge; the bundled data/knowledge_base.json if unset
+app.config['CHATBOT_KNOWLEDGE_BASE'] = os.environ.get('CHATBOT_KNOWLEDGE_BASE')
+app.config['CHATBOT_CACHE_SIZE'] = int(os.environ.get('CHATBOT_CACHE_SIZE', 2048))
+# Writes invalidate cached responses in the process that made them; other processes catch up within this
+app.config['CHATBOT_CACHE_TTL'] = float(os.environ.get('CHATBOT_CACHE_TTL', 300))
+# Seconds before the top-rated product index is rebuilt to pick up catalog writes from other processes
+app.config['PRODUCT_INDEX_MAX_AGE'] = float(os.environ.get('PRODUCT_INDEX_MAX_AGE', 300))
+app.config['USER_CONTEXT_CACHE_SIZE'] = int(os.environ.get('USER_CONTEXT_CACHE_SIZE', 10000))
+# Writes drop a user's cached context in the process that made them; other processes reload within this
+app.config['USER_CONTEXT_TTL'] = float(os.environ.get('USER_CONTEXT_TTL', 60))
 
 # Ensure upload directory exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Configure upload storage
+if app.config['STORAGE_BACKEND'] == 's3':
+    init_storage(S3StorageBackend(
+        bucket=app.config['S3_BUCKET'],
+        endpoint_url=app.config['S3_ENDPOINT_URL'],
+        public_url=app.config['S3_PUBLIC_URL']
+    ))
+else:
+    init_storage(LocalStorageBackend(app.config['UPLOAD_FOLDER'], base_url='/uploads'))
+
 # Initialize extensions
 db.init_app(app)
 jwt = JWTManager(app)
 
-# Initialize database
-with app.app_context():
-    init_db()
+# Create tables and add new columns at import, so every entry point (a
+# server loading app:app, flask run, the CLI commands) sees the current
+# schema. Spawned analysis workers re-import this file as __mp_main__
+# under `python app.py` and never touch the database, so they skip it.
+if __name__ != '__mp_main__':
+    with app.app_context():
+        init_db()
+
+# Configure the image model and batched inference
+inference_config = {
+    'max_batch_size': app.config['INFERENCE_MAX_BATCH_SIZE'],
+    'max_wait_ms': app.config['INFERENCE_MAX_WAIT_MS'],
+    'backend': app.config['SKIN_MODEL_BACKEND'],
+    'model_path': app.config['SKIN_MODEL_PATH'],
+    'threads': app.config['INFERENCE_THREADS'],
+    'model_version': app.config['SKIN_MODEL_VERSION'],
+    'warm_up_batch_sizes': app.config['MODEL_WARM_UP_BATCH_SIZES'],
+    'input_buffer_slots': app.config['INPUT_BUFFER_SLOTS']
+}
+# Other services are started by create_app, not at import: analysis pool
+# workers are spawned, and a spawned process re-imports the main module, so
+# under `python app.py` each worker would otherwise start a pool of its own
+_services_started = False
+
+def create_app(start_dispatchers=True, start_pool=True):
+    """
+    Load the models and start the pools and caches behind the app, once
+    per process.
+    
+    Args:
+        start_dispatchers (bool): Start analysis job dispatcher threads; a
+            preloading server master passes False so only its workers run jobs
+        start_pool (bool): Start the analysis worker pool; a preloading server
+            master passes False so only its workers own one
+    
+    Returns:
+        Flask: The app, ready to serve
+    """
+    global _services_started
+    if _services_started:
+        return app
+    _services_started = True
+    
+    configure_inference(**inference_config)
+    
+    # Decode and measure images in worker processes so they do not block fast
+    # routes; the skin model runs here, batching concurrent requests
+    init_analysis_pool(
+        workers=app.config['ANALYSIS_POOL_WORKERS'],
+        max_pending=app.config['ANALYSIS_POOL_MAX_PENDING'],
+        timeout=app.config['ANALYSIS_TIMEOUT'],
+        retry_after=app.config['ANALYSIS_RETRY_AFTER'],
+        start=start_pool
+    )
+    
+    # Reuse results for repeated uploads of the same image
+    init_analysis_cache(
+        max_entries=app.config['ANALYSIS_CACHE_SIZE'],
+        disk_dir=app.config['ANALYSIS_CACHE_DIR'],
+        model_version=get_model_version()
+    )
+    
+    # Index the chatbot knowledge base once, before workers fork
+    init_knowledge_base(app.config['CHATBOT_KNOWLEDGE_BASE'])
+    
+    # Reuse chatbot responses for repeated questions
+    init_chatbot_cache(
+        max_entries=app.config['CHATBOT_CACHE_SIZE'],
+        ttl=app.config['CHATBOT_CACHE_TTL']
+    )
+    
+    # Serve chatbot recommendations from an in-memory top-rated product index
+    init_product_index(max_age=app.config['PRODUCT_INDEX_MAX_AGE'])
+    
+    # Share each signed-in user's decoded profile, routine and ratings across personalized endpoints
+    init_user_context(
+        max_entries=app.config['USER_CONTEXT_CACHE_SIZE'],
+        ttl=app.config['USER_CONTEXT_TTL']
+    )
+    
+    # Run queued analysis jobs in the background; the queue lives in the database
+    init_analysis_jobs(
+        app,
+        dispatchers=app.config['ANALYSIS_JOB_DISPATCHERS'],
+        max_attempts=app.config['ANALYSIS_JOB_MAX_ATTEMPTS'],
+        retry_backoff=app.config['ANALYSIS_JOB_RETRY_BACKOFF'],
+        lease_seconds=app.config['ANALYSIS_JOB_LEASE'],
+        start_dispatchers=start_dispatchers
+    )
+    
+    return app
+
+def wants_async_analysis():
+    """Clients opt in to job mode with ?async=1 or a Prefer: respond-async header."""
+    return (request.args.get('async', '').lower() in ('1', 'true', 'yes')
+            or 'respond-async' in request.headers.get('Prefer', ''))
+
+def job_accepted_response(job, **extra):
+    body = job.to_dict()
+    body.update(extra)
+    return jsonify(body), 202, {'Location': f'/api/analysis-jobs/{job.id}'}
 
 # Authentication routes
 @app.route('/api/auth/register', methods=['POST'])
@@ -228,14 +406,13 @@ def update_password():
 def get_user_profile():
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        context = get_user_context(current_user_id)
+        user = context.user
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
             
-        profile = UserProfile.query.filter_by(user_id=current_user_id).first()
-        
-        if not profile:
+        if not context.has_profile:
             # Create profile if it doesn't exist
             profile = UserProfile(user_id=current_user_id)
             db.session.add(profile)
@@ -243,13 +420,14 @@ def get_user_profile():
             
         return jsonify({
             'user': {
-                'id': user.id,
-                'email': user.email,
-                'name': user.name,
-                'created_at': user.created_at.isoformat()
+                'id': user['id'],
+                'email': user['email'],
+                'name': user['name'],
+                'created_at': user['created_at'].isoformat()
             },
-            'allergies': profile.allergies or [],
-            'lifestyle': profile.lifestyle_factors or {}
+            'allergies': context.allergies or [],
+            'lifestyle': context.lifestyle or {},
+            'ratingSummary': context.rating_summary
         }), 200
         
     except Exception as e:
@@ -373,12 +551,46 @@ def analyze_skin_image_route():
         if image_file.filename == '':
             return jsonify({'error': 'No image selected'}), 400
             
-        # Process and analyze the image
-        preprocessed_image = preprocess_image(image_file)
-        analysis_results = analyze_skin_image(preprocessed_image)
+        image_bytes = read_upload(image_file, app.config['MAX_UPLOAD_BYTES'])
+        detect_image_extension(image_bytes)
+        
+        if wants_async_analysis():
+            # Signed-in users get idempotency keys and job visibility; anonymous keys are ignored.
+            # A bad token is rejected rather than silently submitting an unowned job.
+            try:
+                verify_jwt_in_request(optional=True)
+            except (JWTExtendedException, PyJWTError):
+                return jsonify({'error': 'Invalid or expired token'}), 401
+            job, _ = submit_analysis_job(
+                image_bytes,
+                kind='image',
+                user_id=get_jwt_identity(),
+                idempotency_key=request.headers.get('Idempotency-Key')
+            )
+            return job_accepted_response(job)
+        
+        # Process and analyze the image in the worker pool
+        analysis_results = run_analysis(image_bytes)
         
         return jsonify(analysis_results), 200
         
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return jsonify({'error': 'Image file is too large'}), 413
+        
+    except UnsupportedImage as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except IdempotencyConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+        
+    except AnalysisPoolBusy as e:
+        return jsonify({'error': 'Image analysis is busy, please retry shortly'}), 503, {'Retry-After': str(e.retry_after)}
+        
+    except AnalysisTimeout:
+        logger.error("Skin image analysis timed out")
+        return jsonify({'error': 'Image analysis timed out'}), 504
+        
     except Exception as e:
         logger.error(f"Skin image analysis error: {str(e)}")
         return jsonify({'error': 'Failed to analyze skin image'}), 500
@@ -389,6 +601,24 @@ def get_recommendations():
     try:
         filter_data = request.json or {}
         
+        # With useProfile, a signed-in user's saved profile fills in only the fields
+        # the request leaves out; an expired or invalid token gets the request as sent
+        current_user_id = None
+        if filter_data.pop('useProfile', False):
+            try:
+                verify_jwt_in_request(optional=True)
+                current_user_id = get_jwt_identity()
+            except (JWTExtendedException, PyJWTError):
+                pass
+        if current_user_id:
+            context = get_user_context(current_user_id)
+            if context.skin_type:
+                filter_data.setdefault('skinType', context.skin_type)
+            if context.concerns:
+                filter_data.setdefault('skinConcerns', context.concerns)
+            if context.allergies:
+                filter_data.setdefault('allergies', context.allergies)
+        
         # Get personalized product recommendations
         recommendations = get_personalized_recommendations(filter_data)
         
@@ -418,17 +648,17 @@ def get_product_details(product_id):
 def get_user_routine():
     try:
         current_user_id = get_jwt_identity()
-        routine = UserRoutine.query.filter_by(user_id=current_user_id).first()
+        context = get_user_context(current_user_id)
         
-        if not routine:
+        if not context.has_routine:
             return jsonify({
                 'morning': {},
                 'evening': {}
             }), 200
             
         return jsonify({
-            'morning': routine.morning_routine or {},
-            'evening': routine.evening_routine or {}
+            'morning': context.morning_routine or {},
+            'evening': context.evening_routine or {}
         }), 200
         
     except Exception as e:
@@ -455,10 +685,22 @@ def save_user_routine():
             
         db.session.commit()
         
+        # Checked on every save so the planner can flag clashing actives right away;
+        # the routine is already saved, so a failed check must not report an error
+        try:
+            conflicts = find_routine_conflicts({
+                'morning': routine_products(routine.morning_routine),
+                'evening': routine_products(routine.evening_routine)
+            })['conflicts']
+        except Exception as e:
+            logger.error(f"Routine conflict check error: {str(e)}")
+            conflicts = []
+        
         return jsonify({
             'message': 'Routine saved successfully',
             'morning': routine.morning_routine,
-            'evening': routine.evening_routine
+            'evening': routine.evening_routine,
+            'conflicts': conflicts
         }), 200
         
     except Exception as e:
@@ -466,6 +708,36 @@ def save_user_routine():
         db.session.rollback()
         return jsonify({'error': 'Failed to save user routine'}), 500
 
+@app.route('/api/routine/conflicts', methods=['POST'])
+def check_routine_conflicts():
+    try:
+        data = request.json or {}
+        
+        # Either a list of product ids, a routine as the planner sends it, or the signed-in user's saved routine
+        if 'productIds' in data:
+            routines = {'routine': data['productIds']}
+        elif 'morning' in data or 'evening' in data:
+            routines = {
+                'morning': routine_products(data.get('morning')),
+                'evening': routine_products(data.get('evening'))
+            }
+        else:
+            verify_jwt_in_request(optional=True)
+            current_user_id = get_jwt_identity()
+            if not current_user_id:
+                return jsonify({'error': 'Product IDs or a routine are required'}), 400
+            context = get_user_context(current_user_id)
+            routines = {
+                'morning': routine_products(context.morning_routine),
+                'evening': routine_products(context.evening_routine)
+            }
+        
+        return jsonify(find_routine_conflicts(routines)), 200
+        
+    except Exception as e:
+        logger.error(f"Routine conflict check error: {str(e)}")
+        return jsonify({'error': 'Failed to check routine conflicts'}), 500
+
 # Progress tracking routes
 @app.route('/api/user/progress', methods=['GET'])
 @jwt_required()
@@ -474,17 +746,23 @@ def get_progress_history():
         current_user_id = get_jwt_identity()
         progress_images = ProgressImage.query.filter_by(user_id=current_user_id).order_by(ProgressImage.date.desc()).all()
         
+        preview_size, preview_extension = PREVIEW_THUMBNAIL
+        
         results = []
         for image in progress_images:
+            thumbnails = thumbnail_urls(image.image_digest) if image.image_digest else {}
             results.append({
                 'id': image.id,
                 'date': image.date.isoformat(),
                 'imageUrl': image.image_url,
+                'thumbnailUrl': thumbnails.get(str(preview_size), {}).get(preview_extension, image.image_url),
+                'thumbnails': thumbnails,
                 'notes': image.notes,
                 'concerns': image.concerns,
                 'mood': image.mood,
                 'skinScore': image.skin_score,
-                'skinAnalysis': image.skin_analysis
+                'skinAnalysis': image.skin_analysis,
+                'deduplicated': image.duplicate_of_id is not None
             })
             
         return jsonify(results), 200
@@ -514,33 +792,102 @@ def upload_progress_image():
         from datetime import datetime
         date = datetime.fromisoformat(date_str) if date_str else datetime.now()
         
-        # Process image and save to storage
-        import uuid
-        import os
-        filename = f"{uuid.uuid4()}.jpg"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image_file.save(filepath)
+        # Read the upload once; the same bytes feed analysis and storage
+        image_bytes = read_upload(image_file, app.config['MAX_UPLOAD_BYTES'])
+        extension = detect_image_extension(image_bytes)
+        
+        # Decode once at preview size for the perceptual hash and the thumbnails; the
+        # analysis worker decodes at full resolution in its own process
+        preview = decode_preview(image_bytes)
+        
+        # Near-identical photos taken moments apart (burst shots, retakes) reuse the
+        # earlier photo's analysis; the new photo itself is always stored
+        image_hash = perceptual_hash(preview)
+        duplicate = find_near_duplicate(
+            current_user_id,
+            image_hash,
+            app.config['PROGRESS_DEDUPE_MAX_DISTANCE'],
+            taken_at=date,
+            window=timedelta(minutes=app.config['PROGRESS_DEDUPE_WINDOW_MINUTES'])
+        )
+        if duplicate is not None:
+            stored = store_image(image_bytes, extension, preview=preview)
+            progress_image = ProgressImage(
+                user_id=current_user_id,
+                date=date,
+                image_url=stored['url'],
+                image_digest=stored['digest'],
+                notes=notes,
+                concerns=concerns,
+                mood=mood,
+                skin_score=duplicate.skin_score,
+                skin_analysis=duplicate.skin_analysis,
+                analysis_version=duplicate.analysis_version,
+                duplicate_of_id=duplicate.duplicate_of_id or duplicate.id
+            )
+            db.session.add(progress_image)
+            db.session.flush()
+            index_progress_image(progress_image, image_hash)
+            db.session.commit()
+            
+            return jsonify({
+                'message': 'Progress image matched an earlier photo',
+                'id': progress_image.id,
+                'date': progress_image.date.isoformat(),
+                'imageUrl': progress_image.image_url,
+                'thumbnails': stored['thumbnails'],
+                'skinScore': progress_image.skin_score,
+                'deduplicated': True,
+                'duplicateOf': progress_image.duplicate_of_id
+            }), 201
+        
+        if wants_async_analysis():
+            # Save the record now; the job fills in the analysis when it finishes
+            stored = store_image(image_bytes, extension, preview=preview)
+            progress_image = ProgressImage(
+                user_id=current_user_id,
+                date=date,
+                image_url=stored['url'],
+                image_digest=stored['digest'],
+                notes=notes,
+                concerns=concerns,
+                mood=mood
+            )
+            job, created = submit_analysis_job(
+                image_bytes,
+                kind='progress',
+                user_id=current_user_id,
+                idempotency_key=request.headers.get('Idempotency-Key'),
+                progress_image=progress_image
+            )
+            if created:
+                index_progress_image(progress_image, image_hash)
+                db.session.commit()
+            return job_accepted_response(job, imageUrl=stored['url'], thumbnails=stored['thumbnails'], deduplicated=False)
         
-        # In a production app, you would upload to cloud storage
-        image_url = f"/uploads/{filename}"
+        # Analyze skin in the image before storing it, so a busy pool rejects cheaply
+        analysis_results = run_analysis(image_bytes)
         
-        # Analyze skin in the image
-        preprocessed_image = preprocess_image(filepath)
-        analysis_results = analyze_skin_image(preprocessed_image)
+        # Store the original and its thumbnails under the content hash
+        stored = store_image(image_bytes, extension, preview=preview)
         
         # Create progress image record
         progress_image = ProgressImage(
             user_id=current_user_id,
             date=date,
-            image_url=image_url,
+            image_url=stored['url'],
+            image_digest=stored['digest'],
             notes=notes,
             concerns=concerns,
             mood=mood,
             skin_score=analysis_results.get('skinScore'),
-            skin_analysis=analysis_results.get('skinHealthMetrics')
+            skin_analysis=analysis_results.get('skinHealthMetrics'),
+            analysis_version=get_model_version()
         )
         
         db.session.add(progress_image)
+        db.session.flush()
+        index_progress_image(progress_image, image_hash)
         db.session.commit()
         
         return jsonify({
@@ -548,14 +895,64 @@ def upload_progress_image():
             'id': progress_image.id,
             'date': progress_image.date.isoformat(),
             'imageUrl': progress_image.image_url,
-            'skinScore': progress_image.skin_score
+            'thumbnails': stored['thumbnails'],
+            'skinScore': progress_image.skin_score,
+            'deduplicated': False
         }), 201
         
+    except (UploadTooLarge, RequestEntityTooLarge):
+        db.session.rollback()
+        return jsonify({'error': 'Image file is too large'}), 413
+        
+    except UnsupportedImage as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+        
+    except IdempotencyConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+        
+    except AnalysisPoolBusy as e:
+        db.session.rollback()
+        return jsonify({'error': 'Image analysis is busy, please retry shortly'}), 503, {'Retry-After': str(e.retry_after)}
+        
+    except AnalysisTimeout:
+        logger.error("Progress image analysis timed out")
+        db.session.rollback()
+        return jsonify({'error': 'Image analysis timed out'}), 504
+        
     except Exception as e:
         logger.error(f"Upload progress image error: {str(e)}")
         db.session.rollback()
         return jsonify({'error': 'Failed to upload progress image'}), 500
 
+@app.route('/api/analysis-jobs/<job_id>', methods=['GET'])
+def get_analysis_job_status(job_id):
+    try:
+        try:
+            verify_jwt_in_request(optional=True)
+        except (JWTExtendedException, PyJWTError):
+            return jsonify({'error': 'Invalid or expired token'}), 401
+        
+        # ?wait=N long-polls for up to N seconds until the job finishes
+        wait = request.args.get('wait', 0, type=float)
+        job = get_analysis_job(job_id, wait=wait)
+        
+        # Jobs submitted by a signed-in user are only visible to them
+        if job is None or (job.user_id is not None and str(job.user_id) != str(get_jwt_identity())):
+            return jsonify({'error': 'Analysis job not found'}), 404
+            
+        return jsonify(job.to_dict()), 200
+        
+    except Exception as e:
+        logger.error(f"Get analysis job error: {str(e)}")
+        return jsonify({'error': 'Failed to get analysis job'}), 500
+
+@app.route('/uploads/<path:key>', methods=['GET'])
+def serve_upload(key):
+    # Blobs are content addressed and never change, so let clients cache them indefinitely
+    return send_from_directory(app.config['UPLOAD_FOLDER'], key, max_age=31536000)
+
 # Feedback routes
 @app.route('/api/feedback', methods=['POST'])
 @jwt_required()
@@ -582,6 +979,7 @@ def submit_feedback():
             # Update existing feedback
             existing_feedback.rating = data['rating']
             existing_feedback.feedback_text = data.get('feedback', '')
+            existing_feedback.concern_tags = extract_concerns_from_feedback(existing_feedback.feedback_text)
         else:
             # Create new feedback
             feedback = UserFeedback(
@@ -590,6 +988,8 @@ def submit_feedback():
                 rating=data['rating'],
                 feedback_text=data.get('feedback', '')
             )
+            # Tagged as it is written; per product counts are refreshed by mine-feedback-concerns
+            feedback.concern_tags = extract_concerns_from_feedback(feedback.feedback_text)
             db.session.add(feedback)
             
         db.session.commit()
@@ -632,6 +1032,14 @@ def chatbot():
                 user_id = decoded['sub']
             except:
                 pass
+        
+        # Server-sent events, one per response fragment, for clients that ask for a stream
+        if data.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+            return Response(
+                stream_with_context(chatbot_events(data['message'], user_id)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
                 
         response = process_user_query(data['message'], user_id)
         
@@ -643,7 +1051,76 @@ def chatbot():
         logger.error(f"Chatbot error: {str(e)}")
         return jsonify({'error': 'Failed to process message'}), 500
 
+def chatbot_events(message, user_id):
+    """Encode a streamed chatbot response as server-sent events, ending with a done or error event"""
+    # Fragments span lines, so each is sent as a JSON string
+    try:
+        for fragment in stream_user_query(message, user_id):
+            yield f"data: {json.dumps(fragment)}\n\n"
+    except Exception:
+        # Fragments already sent may be part of an answer; let the client discard them
+        error = "I'm having trouble processing your question right now. Please try again later."
+        yield f"event: error\ndata: {json.dumps({'error': error})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+# Metrics route
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        return jsonify({
+            'inference': get_inference_stats(),
+            'models': model_registry.stats(),
+            'analysisPool': get_analysis_pool_stats(),
+            'analysisCache': get_analysis_cache_stats(),
+            'analysisJobs': get_analysis_job_stats(),
+            'chatbotCache': get_chatbot_cache_stats(),
+            'productIndex': get_product_index_stats(),
+            'userContext': get_user_context_stats()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Metrics error: {str(e)}")
+        return jsonify({'error': 'Failed to get metrics'}), 500
+
+# Maintenance commands
+@app.cli.command('reanalyze-progress')
+@click.option('--batch-size', default=32, show_default=True, help='Rows per inference batch and write transaction')
+@click.option('--workers', default=2, show_default=True, help='Processes decoding images')
+@click.option('--max-rows-per-second', default=10.0, show_default=True, help='Throttle; 0 runs at full speed')
+@click.option('--after-id', default=0, show_default=True, help='Resume after this progress image id')
+@click.option('--force', is_flag=True, help='Also re-analyze rows already at the current model version')
+def reanalyze_progress_command(batch_size, workers, max_rows_per_second, after_id, force):
+    """Recompute stored progress image analyses with the current skin model."""
+    configure_inference(**inference_config)
+    summary = reanalyze_progress_images(
+        batch_size=batch_size,
+        workers=workers,
+        max_rows_per_second=max_rows_per_second,
+        after_id=after_id,
+        force=force,
+        upload_folder=app.config['UPLOAD_FOLDER']
+    )
+    click.echo(json.dumps(summary, indent=2))
+
+@app.cli.command('mine-feedback-concerns')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per read and write transaction')
+@click.option('--workers', default=2, show_default=True, help='Processes extracting concerns')
+@click.option('--max-rows-per-second', default=0.0, show_default=True, help='Throttle; 0 runs at full speed')
+@click.option('--after-id', default=0, show_default=True, help='Resume after this feedback id')
+@click.option('--force', is_flag=True, help='Also re-tag feedback that already has concern tags')
+def mine_feedback_concerns_command(batch_size, workers, max_rows_per_second, after_id, force):
+    """Tag feedback with the skin concerns in its text and count them per product."""
+    summary = mine_feedback_concerns(
+        batch_size=batch_size,
+        workers=workers,
+        max_rows_per_second=max_rows_per_second,
+        after_id=after_id,
+        force=force
+    )
+    click.echo(json.dumps(summary, indent=2))
+
 # Main entry point
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    create_app().run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,211 @@
+"""
+Benchmark chatbot throughput and routing accuracy on a labelled message corpus.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_chatbot
+
+Every message in the fixture corpus is first routed once against its label,
+which also warms the knowledge base, product index and user contexts, and
+then replayed through process_user_query against a seeded SQLite database.
+Reports messages per second, latency percentiles per labelled intent, SQL
+statements per message and routing accuracy as JSON. Exits non-zero if
+throughput, p95 latency or accuracy is outside its budget, so it can gate
+changes to the chatbot's routing and knowledge base.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from models.user import User, UserProfile, UserRoutine
+from models.product import Product
+from services.chatbot_cache import init_chatbot_cache
+from services.chatbot_service import process_user_query, answer_query
+from services.knowledge_base import init_knowledge_base
+from services.product_index import init_product_index
+from services.user_context import init_user_context
+from utils.database import db, seed_products
+
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'chatbot_messages.json')
+
+def load_corpus(path=DEFAULT_CORPUS_PATH):
+    """
+    Load labelled messages.
+
+    Args:
+        path (str): JSON file with a 'messages' list of {message, intent, signedIn}
+
+    Returns:
+        list: Message dicts
+    """
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['messages']
+
+def create_app(database_url):
+    """
+    Build a minimal app on a database seeded with the product catalog and
+    one user who has a profile and a saved routine.
+
+    Args:
+        database_url (str): SQLAlchemy database URL
+
+    Returns:
+        tuple: (Flask app, benchmark user id)
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_products()
+
+        user = User(email='benchmark@example.com', password_hash=generate_password_hash('benchmark'), name='Benchmark')
+        db.session.add(user)
+        db.session.flush()
+
+        profile = UserProfile(user_id=user.id, skin_type='oily')
+        profile.concerns = ['acne', 'oiliness']
+        profile.allergies = []
+        profile.lifestyle_factors = {}
+
+        products = {p.product_type.lower(): {'id': p.id, 'name': p.name, 'brand': p.brand}
+                    for p in Product.query.order_by(Product.id)}
+        routine = UserRoutine(user_id=user.id)
+        routine.morning_routine = {step: products[step] for step in ('cleanser', 'serum', 'moisturizer', 'sunscreen')
+                                   if step in products}
+        routine.evening_routine = {step: products[step] for step in ('cleanser', 'treatment', 'moisturizer')
+                                   if step in products}
+
+        db.session.add_all([profile, routine])
+        db.session.commit()
+        user_id = user.id
+
+    return app, user_id
+
+def _percentiles(timings):
+    timings = np.array(timings)
+    return {
+        'count': len(timings),
+        'p50Ms': round(float(np.percentile(timings, 50)), 3),
+        'p95Ms': round(float(np.percentile(timings, 95)), 3),
+        'p99Ms': round(float(np.percentile(timings, 99)), 3),
+        'maxMs': round(float(timings.max()), 3)
+    }
+
+def run(corpus, passes=5, cache_size=0, database_url='sqlite://',
+        min_messages_per_second=1000.0, max_p95_ms=5.0, min_accuracy=0.85):
+    """
+    Route and replay the corpus through the chatbot.
+
+    Args:
+        corpus (list): Labelled messages from load_corpus
+        passes (int): Times the corpus is replayed for timing
+        cache_size (int): Chatbot response cache size; 0 times every answer
+        database_url (str): SQLAlchemy database URL to seed and query
+        min_messages_per_second (float): Allowed minimum throughput
+        max_p95_ms (float): Allowed p95 milliseconds per message of any intent
+        min_accuracy (float): Allowed minimum share of correctly routed messages
+
+    Returns:
+        dict: Throughput, latency per intent, SQL statements per message,
+        routing accuracy with the misrouted messages, and whether every
+        budget was met
+    """
+    app, user_id = create_app(database_url)
+
+    with app.app_context():
+        init_knowledge_base()
+        init_chatbot_cache(max_entries=cache_size)
+        init_product_index()
+        init_user_context()
+
+        statements = [0]
+
+        def count_statement(*args):
+            statements[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+        # Routing pass, which also loads everything that is built on first use
+        misrouted = []
+        for item in corpus:
+            _, intent = answer_query(item['message'], user_id if item.get('signedIn') else None)
+            if intent != item['intent']:
+                misrouted.append({'message': item['message'], 'expected': item['intent'], 'routed': intent})
+            db.session.remove()
+        cold_statements = statements[0]
+
+        timings = {}
+        total_seconds = 0.0
+        statements[0] = 0
+        for _ in range(passes):
+            for item in corpus:
+                started = time.perf_counter()
+                process_user_query(item['message'], user_id if item.get('signedIn') else None)
+                elapsed = time.perf_counter() - started
+                total_seconds += elapsed
+                timings.setdefault(item['intent'] or 'general', []).append(elapsed * 1000)
+                # Request teardown, outside the timing
+                db.session.remove()
+
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+    replayed = len(corpus) * passes
+    intents = {intent: _percentiles(values) for intent, values in sorted(timings.items())}
+    messages_per_second = replayed / total_seconds if total_seconds else float('inf')
+    worst_p95 = max(stats['p95Ms'] for stats in intents.values())
+    accuracy = 1 - len(misrouted) / len(corpus)
+    return {
+        'messages': len(corpus),
+        'passes': passes,
+        'cacheSize': cache_size,
+        'messagesPerSecond': round(messages_per_second, 1),
+        'intents': intents,
+        'dbQueriesPerMessage': round(statements[0] / replayed, 3),
+        'coldDbQueriesPerMessage': round(cold_statements / len(corpus), 3),
+        'routingAccuracy': round(accuracy, 4),
+        'misrouted': misrouted,
+        'budgets': {
+            'minMessagesPerSecond': min_messages_per_second,
+            'maxP95Ms': max_p95_ms,
+            'minAccuracy': min_accuracy
+        },
+        'withinBudget': (messages_per_second >= min_messages_per_second and worst_p95 <= max_p95_ms
+                         and accuracy >= min_accuracy)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_PATH)
+    parser.add_argument('--passes', type=int, default=5)
+    parser.add_argument('--cache-size', type=int, default=0)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--min-messages-per-second', type=float, default=1000.0)
+    parser.add_argument('--max-p95-ms', type=float, default=5.0)
+    parser.add_argument('--min-accuracy', type=float, default=0.85)
+    args = parser.parse_args()
+
+    results = run(
+        load_corpus(args.corpus),
+        passes=args.passes,
+        cache_size=args.cache_size,
+        database_url=args.database_url,
+        min_messages_per_second=args.min_messages_per_second,
+        max_p95_ms=args.max_p95_ms,
+        min_accuracy=args.min_accuracy
+    )
+    print(json.dumps(results, indent=2))
+    return 0 if results['withinBudget'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Compare latency and accuracy of skin model exports across inference backends.
+
+Run from the backend directory, pointing at the exported models:
+
+    python -m benchmarks.bench_inference_backends \\
+        --reference tensorflow:models/skin_model.keras \\
+        --candidate onnx:models/skin_model.onnx \\
+        --candidate onnx:models/skin_model.int8.onnx \\
+        --candidate tflite:models/skin_model.int8.tflite
+
+Every candidate is scored against the reference backend on the same
+inputs: skin type and tone top-1 agreement, and mean absolute error over
+all head outputs. Results are printed as JSON.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from ml.inference_backends import load_backend
+from ml.skin_model import HEAD_LAYOUT
+
+def _head_slices():
+    slices = {}
+    offset = 0
+    for name, size in HEAD_LAYOUT.items():
+        slices[name] = slice(offset, offset + size)
+        offset += size
+    return slices
+
+def make_inputs(count, batch_size, seed=0):
+    """
+    Build preprocessed input batches in [-1, 1].
+
+    Args:
+        count (int): Number of batches
+        batch_size (int): Images per batch
+        seed (int): Random seed
+
+    Returns:
+        list: float32 arrays shaped (batch_size, 224, 224, 3)
+    """
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(-1, 1, (batch_size, 224, 224, 3)).astype(np.float32) for _ in range(count)]
+
+def time_backend(backend, batches):
+    """
+    Run every batch through a backend.
+
+    Args:
+        backend: Loaded InferenceBackend
+        batches (list): Input batches
+
+    Returns:
+        tuple: (stacked outputs, per-batch latencies in ms)
+    """
+    backend.predict(batches[0])  # Warm up
+
+    outputs = []
+    latencies = []
+    for batch in batches:
+        started = time.perf_counter()
+        outputs.append(backend.predict(batch))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.concatenate(outputs, axis=0), np.array(latencies)
+
+def compare(reference, candidate):
+    """
+    Score candidate outputs against the reference outputs.
+
+    Args:
+        reference (numpy.ndarray): Reference backend outputs
+        candidate (numpy.ndarray): Candidate backend outputs
+
+    Returns:
+        dict: Top-1 agreement per classification head and mean absolute error
+    """
+    slices = _head_slices()
+    return {
+        'skinTypeAgreement': round(float(np.mean(
+            reference[:, slices['skin_type']].argmax(axis=1) == candidate[:, slices['skin_type']].argmax(axis=1)
+        )), 4),
+        'toneAgreement': round(float(np.mean(
+            reference[:, slices['tone']].argmax(axis=1) == candidate[:, slices['tone']].argmax(axis=1)
+        )), 4),
+        'meanAbsError': round(float(np.mean(np.abs(reference - candidate))), 6)
+    }
+
+def _parse_spec(spec):
+    kind, _, path = spec.partition(':')
+    if not path:
+        raise argparse.ArgumentTypeError(f"Expected backend:path, got {spec}")
+    return kind, path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reference', type=_parse_spec, default=None,
+                        help='backend:path of the reference model, usually tensorflow')
+    parser.add_argument('--candidate', type=_parse_spec, action='append', default=[],
+                        help='backend:path of a model to compare; repeatable')
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    if not args.reference or not args.candidate:
+        parser.error('a --reference and at least one --candidate are required')
+
+    batches = make_inputs(args.batches, args.batch_size)
+    images = args.batches * args.batch_size
+
+    results = []
+    reference_outputs = None
+    for role, (kind, path) in [('reference', args.reference)] + [('candidate', c) for c in args.candidate]:
+        backend = load_backend(kind, path, threads=args.threads)
+        outputs, latencies = time_backend(backend, batches)
+
+        result = {
+            'role': role,
+            'backend': kind,
+            'model': path,
+            'p50BatchMs': round(float(np.percentile(latencies, 50)), 3),
+            'p95BatchMs': round(float(np.percentile(latencies, 95)), 3),
+            'imagesPerSecond': round(images / (latencies.sum() / 1000), 1)
+        }
+        if reference_outputs is None:
+            reference_outputs = outputs
+        else:
+            result.update(compare(reference_outputs, outputs))
+        results.append(result)
+
+    print(json.dumps({'batchSize': args.batch_size, 'threads': args.threads, 'results': results}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
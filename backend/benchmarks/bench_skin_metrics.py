@@ -0,0 +1,96 @@
+"""
+Benchmark the colorimetric skin metrics on 224x224 face crops.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_skin_metrics
+
+Exits non-zero if the p95 time for all metrics on one crop exceeds the
+budget, so it can gate changes to services/image_processing.py.
+"""
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from services.image_processing import compute_skin_metrics
+
+def make_face_crops(count, size=224, seed=0):
+    """
+    Build synthetic skin-toned crops with texture, spots and line features.
+
+    Args:
+        count (int): Number of crops
+        size (int): Crop side in pixels
+        seed (int): Random seed
+
+    Returns:
+        list: uint8 RGB arrays
+    """
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(count):
+        base = rng.uniform([170, 120, 100], [230, 170, 140]).astype(np.float32)
+        crop = np.tile(base, (size, size, 1))
+        crop += rng.normal(0, 6, crop.shape).astype(np.float32)
+
+        for _ in range(rng.integers(5, 25)):
+            center = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.circle(crop, center, int(rng.integers(2, 6)), tuple(float(v) for v in base * 0.7), -1)
+        for _ in range(rng.integers(0, 6)):
+            y = int(rng.integers(0, size))
+            cv2.line(crop, (0, y), (size - 1, y + int(rng.integers(-10, 10))), tuple(float(v) for v in base * 0.85), 1)
+
+        crops.append(np.clip(crop, 0, 255).astype(np.uint8))
+    return crops
+
+def run(iterations=200, budget_ms=50.0):
+    """
+    Time compute_skin_metrics on one CPU thread.
+
+    Args:
+        iterations (int): Number of crops to time
+        budget_ms (float): Allowed p95 milliseconds per crop
+
+    Returns:
+        dict: Timing percentiles and whether the budget was met
+    """
+    cv2.setNumThreads(1)
+    crops = make_face_crops(iterations)
+
+    # Warm up OpenCV's lazily initialized code paths
+    compute_skin_metrics(crops[0])
+
+    timings = []
+    for crop in crops:
+        started = time.perf_counter()
+        compute_skin_metrics(crop)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings = np.array(timings)
+    p95 = float(np.percentile(timings, 95))
+    return {
+        'iterations': iterations,
+        'meanMs': round(float(timings.mean()), 3),
+        'p50Ms': round(float(np.percentile(timings, 50)), 3),
+        'p95Ms': round(p95, 3),
+        'maxMs': round(float(timings.max()), 3),
+        'budgetMs': budget_ms,
+        'withinBudget': p95 <= budget_ms
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--budget-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    results = run(iterations=args.iterations, budget_ms=args.budget_ms)
+    print(json.dumps(results, indent=2))
+    return 0 if results['withinBudget'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
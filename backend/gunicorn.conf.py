@@ -0,0 +1,41 @@
+import gc
+import os
+
+# Run with: gunicorn -c gunicorn.conf.py
+
+# The app factory loads the models and starts the pools behind the app. The
+# master only preloads; the analysis pool and job dispatchers are started in
+# each worker.
+wsgi_app = 'app:create_app(start_dispatchers=False, start_pool=False)'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+
+# Import the app, and with it load and warm up the models, once in the master.
+# Forked workers then share the model weights copy-on-write instead of each
+# loading their own copy.
+preload_app = True
+
+def when_ready(server):
+    # Stop the garbage collector from touching (and so copying) every object
+    # the preloaded app created when it runs in the workers
+    gc.freeze()
+
+def post_fork(server, worker):
+    from app import app
+    from services.analysis_jobs import ensure_job_dispatchers
+    from services.analysis_pool import ensure_analysis_pool
+    from utils.database import db
+
+    # Drop the pooled connections inherited from the master before this worker
+    # touches the database; close=False leaves the master's sockets alone
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    # Each worker owns its analysis pool and shared input buffers
+    ensure_analysis_pool()
+
+    # Threads do not survive fork; start this worker's analysis job dispatchers
+    ensure_job_dispatchers()
@@ -0,0 +1,195 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class _PendingRequest:
+    """A single image waiting in a batcher queue."""
+    __slots__ = ('inputs', 'future', 'enqueued_at')
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Collect concurrent inference requests into batches for a single model.
+
+    Requests are queued by the calling threads and picked up by one worker
+    thread, which waits until either max_batch_size rows are available or
+    the oldest request has waited max_wait_ms, then runs one forward pass
+    and hands each caller its slice of the output.
+    """
+
+    def __init__(self, model, name='model', max_batch_size=16, max_wait_ms=5.0):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        # Reused by the worker thread to assemble multi-request batches
+        self._batch_buffer = None
+        self._reset_stats()
+
+    def configure(self, max_batch_size=None, max_wait_ms=None):
+        """
+        Update batching limits. Takes effect from the next batch.
+
+        Args:
+            max_batch_size (int, optional): Maximum rows per forward pass
+            max_wait_ms (float, optional): Maximum time the oldest request may wait
+        """
+        if max_batch_size is not None:
+            self.max_batch_size = max(1, int(max_batch_size))
+        if max_wait_ms is not None:
+            self.max_wait_ms = max(0.0, float(max_wait_ms))
+
+    def predict(self, image, timeout=30):
+        """
+        Run the model on one preprocessed image through the batch queue.
+
+        Args:
+            image (numpy.ndarray): Model input with a leading batch axis
+            timeout (float, optional): Seconds to wait for the result
+
+        Returns:
+            numpy.ndarray: Model output rows for this image
+        """
+        self._ensure_worker()
+        pending = _PendingRequest(np.asarray(image))
+        self._queue.put(pending)
+        return pending.future.result(timeout=timeout)
+
+    def stats(self):
+        """
+        Get batching metrics for this model.
+
+        Returns:
+            dict: Request and batch counts, batch size and timing averages
+        """
+        with self._lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                'model': self.name,
+                'maxBatchSize': self.max_batch_size,
+                'maxWaitMs': self.max_wait_ms,
+                'queueDepth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'avgBatchSize': round(self._rows / batches, 2),
+                'largestBatch': self._largest_batch,
+                'avgQueueWaitMs': round(self._queue_wait_ms / requests, 3),
+                'maxQueueWaitMs': round(self._max_queue_wait_ms, 3),
+                'avgModelTimeMs': round(self._model_time_ms / batches, 3),
+            }
+
+    def _reset_stats(self):
+        self._requests = 0
+        self._batches = 0
+        self._rows = 0
+        self._errors = 0
+        self._largest_batch = 0
+        self._queue_wait_ms = 0.0
+        self._max_queue_wait_ms = 0.0
+        self._model_time_ms = 0.0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so a worker process inherits a dead
+        # worker handle from the master; start a fresh one per process
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(
+                target=self._run, name=f'batcher-{self.name}', daemon=True
+            )
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        rows = len(first.inputs)
+        deadline = first.enqueued_at + self.max_wait_ms / 1000.0
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    pending = self._queue.get(timeout=remaining)
+                else:
+                    pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(pending)
+            rows += len(pending.inputs)
+
+        return batch, rows
+
+    def _assemble(self, batch, rows):
+        """Copy queued inputs into the reused batch buffer and return a view of the filled rows."""
+        sample = batch[0].inputs
+        buffer = self._batch_buffer
+        if (buffer is None or len(buffer) < rows or buffer.shape[1:] != sample.shape[1:]
+                or buffer.dtype != sample.dtype):
+            buffer = np.empty((max(rows, self.max_batch_size),) + sample.shape[1:], dtype=sample.dtype)
+            self._batch_buffer = buffer
+
+        offset = 0
+        for pending in batch:
+            count = len(pending.inputs)
+            buffer[offset:offset + count] = pending.inputs
+            offset += count
+        return buffer[:rows]
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect_batch()
+            started = time.perf_counter()
+
+            try:
+                inputs = batch[0].inputs if len(batch) == 1 else self._assemble(batch, rows)
+                outputs = self.model.predict(inputs)
+            except Exception as e:
+                logger.error(f"Batched inference error in {self.name}: {str(e)}")
+                for pending in batch:
+                    pending.future.set_exception(e)
+                with self._lock:
+                    self._errors += len(batch)
+                continue
+
+            finished = time.perf_counter()
+
+            offset = 0
+            for pending in batch:
+                count = len(pending.inputs)
+                pending.future.set_result(outputs[offset:offset + count])
+                offset += count
+
+            with self._lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._rows += rows
+                self._largest_batch = max(self._largest_batch, rows)
+                self._model_time_ms += (finished - started) * 1000
+                for pending in batch:
+                    wait_ms = (started - pending.enqueued_at) * 1000
+                    self._queue_wait_ms += wait_ms
+                    self._max_queue_wait_ms = max(self._max_queue_wait_ms, wait_ms)
@@ -7,12 +7,18 @@ logger = logging.getLogger(__name__)
 # In a real application, this would be a trained model
 # For this example, we'll simulate the model's behavior
 
-def detect_concerns(image):
+CONCERN_NAMES = [
+    "acne", "wrinkles", "dark_spots", "redness", "dryness",
+    "oiliness", "large_pores", "dullness", "dark_circles", "sensitivity"
+]
+
+def detect_concerns(image, scores=None):
     """
     Detect skin concerns from image.
     
     Args:
         image: Preprocessed image data
+        scores (numpy.ndarray, optional): Concern model output, one score per CONCERN_NAMES entry
         
     Returns:
         dict: Detected concerns with confidence scores
@@ -20,22 +26,11 @@ def detect_concerns(image):
     try:
         logger.info("Detecting skin concerns")
         
-        # In a real application, this would use a trained model
-        # For this example, we'll simulate detection results
-        
-        # Define possible concerns
-        all_concerns = {
-            "acne": detect_acne(image),
-            "wrinkles": detect_wrinkles(image),
-            "dark_spots": detect_dark_spots(image),
-            "redness": detect_redness(image),
-            "dryness": detect_dryness(image),
-            "oiliness": detect_oiliness(image),
-            "large_pores": detect_large_pores(image),
-            "dullness": detect_dullness(image),
-            "dark_circles": detect_dark_circles(image),
-            "sensitivity": detect_sensitivity(image)
-        }
+        # Use the concern model output when available, otherwise simulate
+        if scores is not None:
+            all_concerns = {name: float(score) for name, score in zip(CONCERN_NAMES, scores)}
+        else:
+            all_concerns = _simulate_concerns(image)
         
         # Filter to include only concerns with confidence above threshold
         threshold = 0.4
@@ -48,6 +43,21 @@ def detect_concerns(image):
         logger.error(f"Error detecting concerns: {str(e)}")
         return {}
 
+def _simulate_concerns(image):
+    """Score every concern with the per-concern detectors."""
+    return {
+        "acne": detect_acne(image),
+        "wrinkles": detect_wrinkles(image),
+        "dark_spots": detect_dark_spots(image),
+        "redness": detect_redness(image),
+        "dryness": detect_dryness(image),
+        "oiliness": detect_oiliness(image),
+        "large_pores": detect_large_pores(image),
+        "dullness": detect_dullness(image),
+        "dark_circles": detect_dark_circles(image),
+        "sensitivity": detect_sensitivity(image)
+    }
+
 def detect_acne(image):
     """
     Detect acne in image.
@@ -160,20 +170,34 @@ def detect_dullness(image):
     # In a real application, this would analyze brightness and contrast
     return random.uniform(0.2, 0.7)
 
-def detect_dark_circles(image):
+# Under-eye skin this many luma levels darker than the cheek scores 1.0
+DARK_CIRCLE_FULL_CONTRAST = 30.0
+
+def detect_dark_circles(image, under_eye=None, cheek=None):
     """
     Detect dark circles in image.
     
+    With under-eye and cheek crops, the score is how much darker the
+    under-eye skin is than the cheek of the same face.
+    
     Args:
         image: Preprocessed image data
+        under_eye (numpy.ndarray, optional): RGB crop of the under-eye regions
+        cheek (numpy.ndarray, optional): RGB crop of the cheek regions
         
     Returns:
         float: Confidence score (0-1)
     """
-    # Simulate detection with random confidence
-    # In a real application, this would focus on the under-eye area
+    if under_eye is not None and cheek is not None:
+        contrast = _mean_luma(cheek) - _mean_luma(under_eye)
+        return float(np.clip(contrast / DARK_CIRCLE_FULL_CONTRAST, 0.0, 1.0))
+    
+    # Simulate detection with random confidence when no face regions are available
     return random.uniform(0.1, 0.6)
 
+def _mean_luma(rgb):
+    return float(np.mean(np.asarray(rgb, dtype=np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)))
+
 def detect_sensitivity(image):
     """
     Detect skin sensitivity in image.
@@ -188,13 +212,14 @@ def detect_sensitivity(image):
     # In a real application, this would look for signs of irritation
     return random.uniform(0.1, 0.5)
 
-def analyze_concern_severity(image, concern_type):
+def analyze_concern_severity(image, concern_type, score=None):
     """
     Analyze the severity of a specific concern.
     
     Args:
         image: Preprocessed image data
         concern_type: Type of concern to analyze
+        score (float, optional): Severity head output for this concern (0-1)
         
     Returns:
         str: Severity level (low, medium, high)
@@ -202,11 +227,8 @@ def analyze_concern_severity(image, concern_type):
     try:
         logger.info(f"Analyzing severity of {concern_type}")
         
-        # In a real application, this would use specialized analysis
-        # For this example, we'll return a random severity
-        
-        # Simulate severity analysis
-        severity_score = random.uniform(0, 1)
+        # Use the severity head output when available, otherwise simulate
+        severity_score = score if score is not None else random.uniform(0, 1)
         
         if severity_score < 0.3:
             severity = "low"
@@ -0,0 +1,161 @@
+import abc
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Backends are imported lazily so a worker only loads the runtime it uses;
+# onnxruntime and tflite-runtime are far lighter than full TensorFlow
+
+class InferenceBackend(abc.ABC):
+    """
+    Interface for a loaded model. predict takes a float32 batch shaped
+    (N, 224, 224, 3) and returns the model's output rows.
+    """
+
+    name = 'base'
+
+    # Runtimes own native thread pools and sessions that do not survive fork;
+    # the model registry reloads these in each forked worker
+    fork_safe = False
+
+    @abc.abstractmethod
+    def predict(self, images):
+        raise NotImplementedError
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Run an ONNX export, fp32 or int8-quantized, on the CPU execution provider."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, threads=1):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def predict(self, images):
+        # Quantized ONNX models keep float inputs and outputs (QDQ format)
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        return self.session.run([self.output_name], {self.input_name: images})[0]
+
+class TFLiteBackend(InferenceBackend):
+    """
+    Run a TFLite export. Full-integer (int8) models are handled by quantizing
+    inputs and dequantizing outputs with the tensors' own parameters.
+
+    Resizing an interpreter's input reallocates all of its tensors, so
+    rather than resizing to every batch size the batcher produces, batches
+    are zero-padded up to the next power of two and each of those sizes
+    gets its own interpreter, created the first time it is needed.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, threads=1):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self._interpreter_class = Interpreter
+        self.model_path = model_path
+        self.threads = threads
+        # Batch size -> (interpreter, input detail, output detail, padded input buffer)
+        self._buckets = {}
+        self._bucket(1)
+
+    @staticmethod
+    def bucket_size(batch_size):
+        """Smallest power of two holding batch_size rows."""
+        return 1 << max(0, int(batch_size) - 1).bit_length()
+
+    def _bucket(self, size):
+        bucket = self._buckets.get(size)
+        if bucket is not None:
+            return bucket
+
+        # Loading from a path memory-maps the flatbuffer, so every interpreter shares the weights
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.threads)
+        input_detail = interpreter.get_input_details()[0]
+        if int(input_detail['shape'][0]) != size:
+            interpreter.resize_tensor_input(input_detail['index'], [size] + list(input_detail['shape'][1:]))
+        interpreter.allocate_tensors()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+
+        padded = np.zeros(tuple(input_detail['shape']), dtype=input_detail['dtype'])
+        bucket = (interpreter, input_detail, output_detail, padded)
+        self._buckets[size] = bucket
+        logger.info(f"Allocated TFLite interpreter for batch size {size}")
+        return bucket
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        rows = len(images)
+        interpreter, input_detail, output_detail, padded = self._bucket(self.bucket_size(rows))
+
+        input_dtype = input_detail['dtype']
+        if input_dtype != np.float32:
+            scale, zero_point = input_detail['quantization']
+            info = np.iinfo(input_dtype)
+            images = np.clip(np.round(images / scale + zero_point), info.min, info.max)
+
+        # Rows past the batch keep whatever the last larger batch left; their outputs are dropped
+        padded[:rows] = images
+        interpreter.set_tensor(input_detail['index'], padded)
+        interpreter.invoke()
+        outputs = interpreter.get_tensor(output_detail['index'])[:rows]
+
+        if output_detail['dtype'] != np.float32:
+            scale, zero_point = output_detail['quantization']
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+class TensorFlowBackend(InferenceBackend):
+    """Run a Keras SavedModel or .keras file with full TensorFlow."""
+
+    name = 'tensorflow'
+
+    def __init__(self, model_path, threads=1):
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+    def predict(self, images):
+        return np.asarray(self.model(np.asarray(images, dtype=np.float32), training=False))
+
+BACKENDS = {
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    TensorFlowBackend.name: TensorFlowBackend
+}
+
+def load_backend(kind, model_path, threads=1):
+    """
+    Load an exported model with the requested runtime.
+
+    Args:
+        kind (str): One of BACKENDS ('onnx', 'tflite', 'tensorflow')
+        model_path (str): Path to the exported model file
+        threads (int, optional): Intra-op threads for the runtime
+
+    Returns:
+        InferenceBackend: Loaded model
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {kind}")
+    if not model_path:
+        raise ValueError(f"The {kind} backend requires a model path")
+
+    logger.info(f"Loading {kind} model from {model_path} with {threads} threads")
+    return BACKENDS[kind](model_path, threads=threads)
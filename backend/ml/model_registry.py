@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class _RegisteredModel:
+    """Loader, version and load state for one named model."""
+    __slots__ = ('name', 'loader', 'version', 'model', 'pid', 'load_ms', 'warm_up_ms', 'loads')
+
+    def __init__(self, name, loader, version):
+        self.name = name
+        self.loader = loader
+        self.version = version
+        self.model = None
+        self.pid = None
+        self.load_ms = None
+        self.warm_up_ms = None
+        self.loads = 0
+
+class ModelHandle:
+    """
+    Stable reference to a registered model. Calls go to whichever instance
+    the registry currently holds for this process, so holders such as a
+    MicroBatcher see reloads, version swaps and post-fork reloads.
+    """
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def predict(self, images):
+        return self.registry.get(self.name).predict(images)
+
+class ModelRegistry:
+    """
+    Load named, versioned models once per process and share them.
+
+    Models load lazily on first use, or eagerly with preload. Preloading in
+    a pre-fork server master (gunicorn preload_app) lets forked workers
+    share the weight pages copy-on-write. Models whose runtime is not fork
+    safe (it owns thread pools or native sessions) set fork_safe = False
+    and are reloaded the first time they are used in a forked child.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.RLock()
+        if hasattr(os, 'register_at_fork'):
+            # A lock held by another thread at fork time would never be released in the child
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, version):
+        """
+        Register or replace a model. A replaced model is unloaded and the new
+        one loads on next use.
+
+        Args:
+            name (str): Model name
+            loader (callable): Returns a loaded model with a predict(batch) method
+            version (str): Version recorded with results produced by this model
+        """
+        with self._lock:
+            self._models[name] = _RegisteredModel(name, loader, str(version))
+
+    def get(self, name):
+        """
+        Get a loaded model, loading it in this process if needed.
+
+        Args:
+            name (str): Model name
+
+        Returns:
+            object: Loaded model
+        """
+        entry = self._entry(name)
+        model = entry.model
+        if model is not None and (entry.pid == os.getpid() or getattr(model, 'fork_safe', False)):
+            return model
+
+        with self._lock:
+            if entry.model is None or (entry.pid != os.getpid() and not getattr(entry.model, 'fork_safe', False)):
+                started = time.perf_counter()
+                entry.model = entry.loader()
+                entry.load_ms = round((time.perf_counter() - started) * 1000, 1)
+                entry.pid = os.getpid()
+                entry.loads += 1
+                logger.info(f"Loaded model {name} version {entry.version} in {entry.load_ms}ms")
+            return entry.model
+
+    def handle(self, name):
+        """
+        Get a handle that always calls the current instance of a model.
+
+        Args:
+            name (str): Model name
+
+        Returns:
+            ModelHandle: Handle with a predict method
+        """
+        return ModelHandle(self, name)
+
+    def version(self, name):
+        """
+        Get the registered version of a model.
+
+        Args:
+            name (str): Model name
+
+        Returns:
+            str: Model version
+        """
+        return self._entry(name).version
+
+    def preload(self, names=None):
+        """
+        Load models now rather than on first request.
+
+        Args:
+            names (list, optional): Models to load; all registered models if None
+        """
+        for name in names or list(self._models):
+            self.get(name)
+
+    def warm_up(self, name, input_shape, batch_sizes=(1,)):
+        """
+        Run inference on zero inputs so one-time costs (graph optimization,
+        tensor allocation, lazy kernel initialization) are paid at boot.
+
+        Args:
+            name (str): Model name
+            input_shape (tuple): Shape of one input, without the batch axis
+            batch_sizes (tuple): Batch sizes to run; each may allocate its own buffers
+        """
+        model = self.get(name)
+        started = time.perf_counter()
+        for batch_size in batch_sizes:
+            model.predict(np.zeros((batch_size,) + tuple(input_shape), dtype=np.float32))
+        self._entry(name).warm_up_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Warmed up model {name} for batch sizes {list(batch_sizes)}")
+
+    def stats(self):
+        """
+        Get load state for every registered model.
+
+        Returns:
+            dict: Version, load state and timings per model
+        """
+        pid = os.getpid()
+        return {
+            entry.name: {
+                'version': entry.version,
+                'loaded': entry.model is not None,
+                'loadedInThisProcess': entry.pid == pid,
+                'forkSafe': bool(getattr(entry.model, 'fork_safe', False)),
+                'loads': entry.loads,
+                'loadMs': entry.load_ms,
+                'warmUpMs': entry.warm_up_ms
+            }
+            for entry in list(self._models.values())
+        }
+
+    def _entry(self, name):
+        try:
+            return self._models[name]
+        except KeyError:
+            raise KeyError(f"Model {name} is not registered")
+
+# Process-wide registry used by the services
+model_registry = ModelRegistry()
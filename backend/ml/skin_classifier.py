@@ -7,12 +7,16 @@ logger = logging.getLogger(__name__)
 # In a real application, this would be a trained model
 # For this example, we'll simulate the model's behavior
 
-def classify_skin_type(image):
+SKIN_TYPES = ["dry", "oily", "combination", "normal", "sensitive"]
+SKIN_TONES = ["very fair", "fair", "medium", "olive", "tan", "deep"]
+
+def classify_skin_type(image, scores=None):
     """
     Classify skin type from image.
     
     Args:
         image: Preprocessed image data
+        scores (numpy.ndarray, optional): Skin type model output, one score per SKIN_TYPES entry
         
     Returns:
         str: Classified skin type (dry, oily, combination, normal, sensitive)
@@ -20,10 +24,15 @@ def classify_skin_type(image):
     try:
         logger.info("Classifying skin type")
         
+        if scores is not None:
+            skin_type = SKIN_TYPES[int(np.argmax(scores))]
+            logger.info(f"Classified skin type: {skin_type}")
+            return skin_type
+        
         # In a real application, this would use a trained model
         # For this example, we'll return a random skin type
         
-        skin_types = ["dry", "oily", "combination", "normal", "sensitive"]
+        skin_types = SKIN_TYPES
         weights = [0.25, 0.25, 0.3, 0.15, 0.05]  # Weighted probabilities
         
         # Simulate model prediction
@@ -36,12 +45,13 @@ def classify_skin_type(image):
         logger.error(f"Error classifying skin type: {str(e)}")
         return "normal"  # Default to normal if classification fails
 
-def predict_skin_age(image):
+def predict_skin_age(image, value=None):
     """
     Predict skin age from image.
     
     Args:
         image: Preprocessed image data
+        value (float, optional): Age head output from the skin model
         
     Returns:
         int: Predicted skin age
@@ -49,6 +59,9 @@ def predict_skin_age(image):
     try:
         logger.info("Predicting skin age")
         
+        if value is not None:
+            return int(round(value))
+        
         # In a real application, this would use a trained model
         # For this example, we'll return a random age between 20 and 50
         
@@ -62,12 +75,13 @@ def predict_skin_age(image):
         logger.error(f"Error predicting skin age: {str(e)}")
         return 30  # Default age if prediction fails
 
-def analyze_skin_tone(image):
+def analyze_skin_tone(image, scores=None):
     """
     Analyze skin tone from image.
     
     Args:
         image: Preprocessed image data
+        scores (numpy.ndarray, optional): Tone head output, one score per SKIN_TONES entry
         
     Returns:
         str: Skin tone category
@@ -75,10 +89,13 @@ def analyze_skin_tone(image):
     try:
         logger.info("Analyzing skin tone")
         
+        if scores is not None:
+            return SKIN_TONES[int(np.argmax(scores))]
+        
         # In a real application, this would use color analysis
         # For this example, we'll return a random skin tone
         
-        skin_tones = ["very fair", "fair", "medium", "olive", "tan", "deep"]
+        skin_tones = SKIN_TONES
         
         # Simulate analysis
         skin_tone = random.choice(skin_tones)
@@ -90,12 +107,13 @@ def analyze_skin_tone(image):
         logger.error(f"Error analyzing skin tone: {str(e)}")
         return "medium"  # Default tone if analysis fails
 
-def estimate_hydration_level(image):
+def estimate_hydration_level(image, value=None):
     """
     Estimate skin hydration level from image.
     
     Args:
         image: Preprocessed image data
+        value (float, optional): Hydration head output from the skin model
         
     Returns:
         float: Estimated hydration level (0-100)
@@ -103,6 +121,9 @@ def estimate_hydration_level(image):
     try:
         logger.info("Estimating hydration level")
         
+        if value is not None:
+            return float(value)
+        
         # In a real application, this would use texture and reflection analysis
         # For this example, we'll return a random hydration level
         
@@ -116,12 +137,13 @@ def estimate_hydration_level(image):
         logger.error(f"Error estimating hydration level: {str(e)}")
         return 60.0  # Default level if estimation fails
 
-def estimate_oil_production(image):
+def estimate_oil_production(image, value=None):
     """
     Estimate skin oil production from image.
     
     Args:
         image: Preprocessed image data
+        value (float, optional): Oil head output from the skin model
         
     Returns:
         float: Estimated oil production level (0-100)
@@ -129,6 +151,9 @@ def estimate_oil_production(image):
     try:
         logger.info("Estimating oil production")
         
+        if value is not None:
+            return float(value)
+        
         # In a real application, this would use shine and texture analysis
         # For this example, we'll return a random oil level
         
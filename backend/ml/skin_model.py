@@ -0,0 +1,155 @@
+import numpy as np
+import logging
+import os
+from collections import OrderedDict
+from ml.skin_classifier import SKIN_TYPES, SKIN_TONES
+from ml.concern_detector import CONCERN_NAMES
+
+logger = logging.getLogger(__name__)
+
+# In a real application, the backbone would be a trained CNN (e.g. MobileNetV2
+# without its classifier) and the heads would be trained linear layers.
+# For this example, the backbone is a fixed random projection of pooled
+# pixels, so outputs are random but deterministic for a given image.
+
+FEATURE_DIM = 256
+
+# Output layout of the combined model: every head's outputs are concatenated
+# into one row per image, in this order, so batches can be sliced per request
+HEAD_LAYOUT = OrderedDict([
+    ('skin_type', len(SKIN_TYPES)),
+    ('concerns', len(CONCERN_NAMES)),
+    ('severity', len(CONCERN_NAMES)),
+    ('tone', len(SKIN_TONES)),
+    ('age', 1),
+    ('hydration', 1),
+    ('oil', 1)
+])
+
+OUTPUT_DIM = sum(HEAD_LAYOUT.values())
+
+# Heads whose outputs are a probability distribution over classes
+SOFTMAX_HEADS = ('skin_type', 'tone')
+# Heads with one independent probability per output
+SIGMOID_HEADS = ('concerns', 'severity')
+# Regression heads and the range their sigmoid output is scaled to
+SCALED_HEADS = {
+    'age': (15, 70),
+    'hydration': (0, 100),
+    'oil': (0, 100)
+}
+
+class MockBackbone:
+    """Feature extractor stand-in: average-pools the image to 8x8 and projects it."""
+
+    def __init__(self, feature_dim=FEATURE_DIM, seed=0, weights=None):
+        self.pool_size = 8
+        if weights is None:
+            rng = np.random.default_rng(seed)
+            weights = rng.normal(0, 1 / np.sqrt(self.pool_size * self.pool_size * 3),
+                                 (self.pool_size * self.pool_size * 3, feature_dim)).astype(np.float32)
+        self.weights = weights
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        n, h, w, c = images.shape
+        # Average-pool each image to pool_size x pool_size
+        pooled = images[:, :h - h % self.pool_size, :w - w % self.pool_size, :].reshape(
+            n, self.pool_size, h // self.pool_size, self.pool_size, w // self.pool_size, c
+        ).mean(axis=(2, 4))
+        return np.tanh(pooled.reshape(n, -1) @ self.weights)
+
+class SkinAnalysisModel:
+    """
+    One backbone pass per image feeding lightweight heads for every reported
+    attribute. predict returns the concatenated head outputs described by
+    HEAD_LAYOUT.
+    """
+
+    # Plain numpy weights: safe to inherit across fork and share copy-on-write
+    fork_safe = True
+
+    # Weight files written by save and read by load, one .npy array each
+    WEIGHT_FILES = ('backbone.npy', 'head_weights.npy', 'head_bias.npy')
+
+    def __init__(self, backbone=None, seed=1, head_weights=None, head_bias=None):
+        self.backbone = backbone or MockBackbone()
+        if head_weights is None:
+            rng = np.random.default_rng(seed)
+            head_weights = rng.normal(0, 1.5 / np.sqrt(FEATURE_DIM), (FEATURE_DIM, OUTPUT_DIM)).astype(np.float32)
+        self.head_weights = head_weights
+        self.head_bias = np.zeros(OUTPUT_DIM, dtype=np.float32) if head_bias is None else head_bias
+
+    def save(self, directory):
+        """
+        Write the weights as uncompressed .npy files.
+
+        Args:
+            directory (str): Output directory, created if missing
+        """
+        os.makedirs(directory, exist_ok=True)
+        for filename, array in zip(self.WEIGHT_FILES, (self.backbone.weights, self.head_weights, self.head_bias)):
+            np.save(os.path.join(directory, filename), np.ascontiguousarray(array))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load weights written by save.
+
+        With mmap, the arrays are read-only views of the files, so every
+        process using the same files shares one copy in the page cache and
+        nothing is read until a page is touched.
+
+        Args:
+            directory (str): Directory written by save
+            mmap (bool): Memory-map the weight files instead of reading them
+
+        Returns:
+            SkinAnalysisModel: Loaded model
+        """
+        backbone, head_weights, head_bias = (
+            np.load(os.path.join(directory, filename), mmap_mode='r' if mmap else None)
+            for filename in cls.WEIGHT_FILES
+        )
+        return cls(backbone=MockBackbone(weights=backbone), head_weights=head_weights, head_bias=head_bias)
+
+    def predict(self, images):
+        features = self.backbone.predict(images)
+        # All heads are linear, so they run as a single matrix multiply
+        logits = features @ self.head_weights + self.head_bias
+        return _activate(logits)
+
+def _activate(logits):
+    outputs = np.empty_like(logits)
+    offset = 0
+    for name, size in HEAD_LAYOUT.items():
+        block = logits[:, offset:offset + size]
+        if name in SOFTMAX_HEADS:
+            exp = np.exp(block - block.max(axis=1, keepdims=True))
+            block = exp / exp.sum(axis=1, keepdims=True)
+        else:
+            block = 1 / (1 + np.exp(-block))
+            if name in SCALED_HEADS:
+                low, high = SCALED_HEADS[name]
+                block = low + block * (high - low)
+        outputs[:, offset:offset + size] = block
+        offset += size
+    return outputs
+
+def decode_heads(row):
+    """
+    Split one image's model output into per-head values.
+
+    Args:
+        row (numpy.ndarray): One row of SkinAnalysisModel output
+
+    Returns:
+        dict: Arrays for classification heads, floats for scalar heads
+    """
+    heads = {}
+    offset = 0
+    for name, size in HEAD_LAYOUT.items():
+        values = row[offset:offset + size]
+        heads[name] = float(values[0]) if size == 1 else values
+        offset += size
+    return heads
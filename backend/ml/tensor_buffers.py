@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pixel scaling to [-1, 1] as MobileNetV2-style models expect
+_INPUT_SCALE = np.float32(1 / 127.5)
+_INPUT_OFFSET = np.float32(1.0)
+
+def to_model_input(pixels, out):
+    """
+    Convert uint8 RGB pixels to model input in [-1, 1], writing into out.
+
+    Every step runs in place on out, so nothing is allocated.
+
+    Args:
+        pixels (numpy.ndarray): uint8 array shaped like out, or like out without its batch axis
+        out (numpy.ndarray): float32 destination
+
+    Returns:
+        numpy.ndarray: out
+    """
+    np.copyto(out.reshape(pixels.shape), pixels, casting='unsafe')
+    out *= _INPUT_SCALE
+    out -= _INPUT_OFFSET
+    return out
+
+class InputSlot:
+    """One reusable model input: a uint8 staging image and its float32 batch-of-one view."""
+    __slots__ = ('index', 'pixels', 'tensor')
+
+    def __init__(self, index, pixels, tensor):
+        self.index = index
+        self.pixels = pixels
+        self.tensor = tensor
+
+class TensorBufferPool:
+    """
+    Preallocated input buffers for one process.
+
+    Each slot holds a uint8 image, for the resized crop, and a float32
+    tensor shaped (1, *shape) for the normalized model input. Both are
+    views into two contiguous arrays allocated once, so in steady state
+    preprocessing allocates nothing per image. When every slot is in use,
+    a temporary slot is allocated rather than blocking the caller.
+    """
+
+    def __init__(self, shape, slots=8):
+        self.shape = tuple(shape)
+        self.slots = max(1, int(slots))
+        self._pixels, self._tensors = self._allocate()
+        self._free = list(range(self.slots))
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._overflows = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _allocate(self):
+        return (np.empty((self.slots,) + self.shape, dtype=np.uint8),
+                np.empty((self.slots,) + self.shape, dtype=np.float32))
+
+    def _reset_after_fork(self):
+        # Slots held by other threads in the parent are never released in the child
+        self._lock = threading.Lock()
+        self._free = list(range(self.slots))
+
+    @contextmanager
+    def slot(self):
+        """
+        Borrow a slot for the duration of a with block.
+
+        Yields:
+            InputSlot: Buffers owned by the caller until the block exits
+        """
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def acquire(self):
+        """
+        Borrow a slot until release is called with it.
+
+        Returns:
+            InputSlot: A pool slot, or a temporary one with index None if every slot is in use
+        """
+        with self._lock:
+            self._acquired += 1
+            index = self._free.pop() if self._free else None
+            if index is None:
+                self._overflows += 1
+
+        if index is None:
+            return InputSlot(None, np.empty(self.shape, dtype=np.uint8), np.empty((1,) + self.shape, dtype=np.float32))
+        return self.slot_at(index)
+
+    def release(self, slot):
+        """Return a slot from acquire to the pool."""
+        if slot.index is not None:
+            with self._lock:
+                self._free.append(slot.index)
+
+    def slot_at(self, index):
+        """
+        Get the buffers of a slot by index, without borrowing it.
+
+        Args:
+            index (int): Slot index
+
+        Returns:
+            InputSlot: Views into the pool's buffers
+        """
+        return InputSlot(index, self._pixels[index], self._tensors[index:index + 1])
+
+    def stats(self):
+        """
+        Get slot usage.
+
+        Returns:
+            dict: Slot count, slots in use, acquisitions and overflow allocations
+        """
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'inUse': self.slots - len(self._free),
+                'acquired': self._acquired,
+                'overflows': self._overflows,
+                'bytes': int(self._pixels.nbytes + self._tensors.nbytes)
+            }
+
+class SharedTensorBufferPool(TensorBufferPool):
+    """
+    TensorBufferPool whose buffers live in shared memory, so a worker
+    process can fill a slot that the owning process then reads in place.
+
+    The owner creates the segments, borrows and returns slots, and passes
+    a slot's index to the worker, which opens the same segments with
+    attach and writes through slot_at. Nothing but the index crosses the
+    process boundary.
+    """
+
+    def __init__(self, shape, slots=8, names=None):
+        # Segment names when attaching to a pool created by another process
+        self._names = names
+        self._segments = ()
+        self._owner_pid = None
+        super().__init__(shape, slots)
+
+    @classmethod
+    def attach(cls, shape, slots, names):
+        """
+        Open a pool created by another process.
+
+        Args:
+            shape (tuple): Input shape the pool was created with
+            slots (int): Slot count the pool was created with
+            names (tuple): The owner's SharedTensorBufferPool.names
+
+        Returns:
+            SharedTensorBufferPool: Views onto the owner's buffers
+        """
+        return cls(shape, slots, names=names)
+
+    @property
+    def owner(self):
+        """True in the process that created the segments; a forked child only inherits them."""
+        return self._owner_pid == os.getpid()
+
+    @property
+    def names(self):
+        """Shared memory segment names, for attach in another process."""
+        return tuple(segment.name for segment in self._segments)
+
+    def _allocate(self):
+        pixel_shape = (self.slots,) + self.shape
+        pixel_bytes = int(np.prod(pixel_shape))
+        if self._names is None:
+            self._owner_pid = os.getpid()
+            self._segments = (
+                shared_memory.SharedMemory(create=True, size=pixel_bytes),
+                shared_memory.SharedMemory(create=True, size=pixel_bytes * np.dtype(np.float32).itemsize)
+            )
+        else:
+            self._segments = tuple(shared_memory.SharedMemory(name=name) for name in self._names)
+        return (np.ndarray(pixel_shape, dtype=np.uint8, buffer=self._segments[0].buf),
+                np.ndarray(pixel_shape, dtype=np.float32, buffer=self._segments[1].buf))
+
+    def close(self):
+        """Unmap the buffers, and free the segments if this process created them."""
+        # Views must go before the mapping can be closed
+        self._pixels = self._tensors = None
+        owner = self.owner
+        for segment in self._segments:
+            try:
+                segment.close()
+            except BufferError:
+                # A slot view is still referenced; the mapping goes with it
+                pass
+            if owner:
+                segment.unlink()
+        self._segments = ()
@@ -0,0 +1,59 @@
+from utils.database import db
+from datetime import datetime
+import json
+
+class AnalysisJob(db.Model):
+    __tablename__ = 'analysis_jobs'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_analysis_jobs_user_idempotency_key'),
+        db.Index('ix_analysis_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # Random hex, safe to hand to clients
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)  # image, progress
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    idempotency_key = db.Column(db.String(255), nullable=True)
+    image_digest = db.Column(db.String(64), nullable=False)  # SHA-256 of the input image
+    image_data = db.Column(db.LargeBinary, nullable=True)  # Input image, cleared once the job finishes
+    progress_image_id = db.Column(db.Integer, db.ForeignKey('progress_images.id'), nullable=True)
+    _result = db.Column(db.Text, nullable=True)  # JSON string
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # Not claimed before this time
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # A running job past this is reclaimed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def result(self):
+        if self._result:
+            return json.loads(self._result)
+        return None
+
+    @result.setter
+    def result(self, value):
+        self._result = json.dumps(value)
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'progressImageId': self.progress_image_id,
+            'result': self.result,
+            'error': self.error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} {self.status}>'
@@ -20,6 +20,8 @@ class Product(db.Model):
     _concerns = db.Column(db.Text, nullable=True)  # JSON string
     rating = db.Column(db.Float, default=0.0)
     review_count = db.Column(db.Integer, default=0)
+    _review_concerns = db.Column(db.Text, nullable=True)  # JSON string: concern -> reviews mentioning it
+    mined_review_count = db.Column(db.Integer, default=0)  # Reviews review_concerns was mined from
     
     # Relationships
     feedbacks = db.relationship('UserFeedback', backref='product', lazy=True)
@@ -74,6 +76,16 @@ class Product(db.Model):
     def concerns(self, value):
         self._concerns = json.dumps(value)
     
+    @property
+    def review_concerns(self):
+        if self._review_concerns:
+            return json.loads(self._review_concerns)
+        return {}
+    
+    @review_concerns.setter
+    def review_concerns(self, value):
+        self._review_concerns = json.dumps(value)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -91,7 +103,8 @@ class Product(db.Model):
             'keyIngredients': self.key_ingredients,
             'concerns': self.concerns,
             'rating': self.rating,
-            'reviewCount': self.review_count
+            'reviewCount': self.review_count,
+            'reviewConcerns': self.review_concerns
         }
     
     def __repr__(self):
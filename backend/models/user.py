@@ -72,10 +72,21 @@ class UserFeedback(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     feedback_text = db.Column(db.Text, nullable=True)
+    _concern_tags = db.Column(db.Text, nullable=True)  # JSON list of concerns mined from feedback_text, None until mined
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship to product is defined in the Product model
     
+    @property
+    def concern_tags(self):
+        if self._concern_tags:
+            return json.loads(self._concern_tags)
+        return []
+    
+    @concern_tags.setter
+    def concern_tags(self, value):
+        self._concern_tags = json.dumps(value)
+    
     def __repr__(self):
         return f'<UserFeedback user_id={self.user_id} product_id={self.product_id} rating={self.rating}>'
 
@@ -119,11 +130,15 @@ class ProgressImage(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     image_url = db.Column(db.String(255), nullable=False)
+    image_digest = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 content address
     notes = db.Column(db.Text, nullable=True)
     _concerns = db.Column(db.Text, nullable=True)  # JSON string
     mood = db.Column(db.String(50), nullable=True)  # happy, neutral, sad
     skin_score = db.Column(db.Integer, nullable=True)  # 0-100
     _skin_analysis = db.Column(db.Text, nullable=True)  # JSON string
+    analysis_version = db.Column(db.String(100), nullable=True, index=True)  # Model version of skin_analysis
+    phash = db.Column(db.String(16), nullable=True)  # 64-bit perceptual hash, hex
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('progress_images.id'), nullable=True)  # Near-duplicate reused
     
     @property
     def concerns(self):
@@ -147,3 +162,19 @@ class ProgressImage(db.Model):
     
     def __repr__(self):
         return f'<ProgressImage user_id={self.user_id} date={self.date}>'
+
+class ProgressImageHashBand(db.Model):
+    """One band of a progress image's perceptual hash, for near-duplicate lookup."""
+    __tablename__ = 'progress_image_hash_bands'
+    __table_args__ = (
+        db.Index('ix_progress_image_hash_bands_lookup', 'user_id', 'band', 'value'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    progress_image_id = db.Column(db.Integer, db.ForeignKey('progress_images.id'), nullable=False)
+    band = db.Column(db.Integer, nullable=False)  # Band position in the hash
+    value = db.Column(db.Integer, nullable=False)  # Band bits
+    
+    def __repr__(self):
+        return f'<ProgressImageHashBand image_id={self.progress_image_id} band={self.band}>'
@@ -0,0 +1,165 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache state, configured once per process by init_analysis_cache
+_entries = OrderedDict()
+_lock = threading.Lock()
+_settings = {
+    'max_entries': 1024,
+    'disk_dir': None,
+    'model_version': 'unversioned'
+}
+_stats = {
+    'memoryHits': 0,
+    'diskHits': 0,
+    'misses': 0
+}
+
+def init_analysis_cache(max_entries=1024, disk_dir=None, model_version='unversioned'):
+    """
+    Configure the image analysis result cache.
+
+    Args:
+        max_entries (int): Results kept in memory before the least recently used is evicted
+        disk_dir (str, optional): Directory for the on-disk tier; disabled if None
+        model_version (str): Version of the analysis models, part of every cache key
+    """
+    with _lock:
+        _entries.clear()
+        _settings.update({
+            'max_entries': max(0, int(max_entries)),
+            'disk_dir': disk_dir,
+            'model_version': str(model_version)
+        })
+
+    if disk_dir and not os.path.exists(disk_dir):
+        os.makedirs(disk_dir)
+
+    logger.info(f"Analysis cache configured for model version {model_version}")
+
+def analysis_cache_key(image_bytes):
+    """
+    Build the cache key for an encoded image.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+
+    Returns:
+        str: Model version and SHA-256 of the image bytes
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{_settings['model_version']}:{digest}"
+
+def get_cached_analysis(key):
+    """
+    Look up a previous analysis result.
+
+    Args:
+        key (str): Key from analysis_cache_key
+
+    Returns:
+        dict: Copy of the cached analysis, or None on a miss
+    """
+    with _lock:
+        result = _entries.get(key)
+        if result is not None:
+            _entries.move_to_end(key)
+            _stats['memoryHits'] += 1
+            return copy.deepcopy(result)
+
+    result = _read_from_disk(key)
+    if result is not None:
+        with _lock:
+            _stats['diskHits'] += 1
+            _store_in_memory(key, result)
+        return copy.deepcopy(result)
+
+    with _lock:
+        _stats['misses'] += 1
+    return None
+
+def cache_analysis(key, result):
+    """
+    Store an analysis result.
+
+    Args:
+        key (str): Key from analysis_cache_key
+        result (dict): Analysis results to cache
+    """
+    result = copy.deepcopy(result)
+    with _lock:
+        _store_in_memory(key, result)
+    _write_to_disk(key, result)
+
+def get_analysis_cache_stats():
+    """
+    Get cache metrics.
+
+    Returns:
+        dict: Hit, miss and size counters with the overall hit rate
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_entries)
+
+    lookups = stats['memoryHits'] + stats['diskHits'] + stats['misses']
+    stats.update({
+        'maxEntries': _settings['max_entries'],
+        'diskEnabled': bool(_settings['disk_dir']),
+        'modelVersion': _settings['model_version'],
+        'hitRate': round((stats['memoryHits'] + stats['diskHits']) / lookups, 4) if lookups else 0.0
+    })
+    return stats
+
+def _store_in_memory(key, result):
+    # Caller holds _lock
+    if _settings['max_entries'] == 0:
+        return
+    _entries[key] = result
+    _entries.move_to_end(key)
+    while len(_entries) > _settings['max_entries']:
+        _entries.popitem(last=False)
+
+def _disk_path(key):
+    version, digest = key.split(':', 1)
+    safe_version = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in version)
+    return os.path.join(_settings['disk_dir'], safe_version, digest[:2], f"{digest}.json")
+
+def _read_from_disk(key):
+    if not _settings['disk_dir']:
+        return None
+    try:
+        with open(_disk_path(key), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error reading cached analysis: {str(e)}")
+        return None
+
+def _write_to_disk(key, result):
+    if not _settings['disk_dir']:
+        return
+    try:
+        path = _disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f, default=_json_default)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error writing cached analysis: {str(e)}")
+
+def _json_default(value):
+    # Analysis results may carry numpy scalars
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,336 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func
+from sqlalchemy.exc import IntegrityError
+from models.analysis_job import AnalysisJob
+from models.user import ProgressImage
+from services.analysis_cache import analysis_cache_key, get_cached_analysis
+from services.analysis_pool import run_analysis, AnalysisPoolBusy
+from services.image_processing import get_model_version
+from services.storage import content_digest
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+# Longest a status request may block waiting for a job to finish
+MAX_WAIT_SECONDS = 30
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different image."""
+
+# Job runner state, configured once per process by init_analysis_jobs.
+# Jobs live in the database, so any process can claim them and a job
+# survives a restart; dispatcher threads are per process.
+_app = None
+_dispatchers = []
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+_wakeup = threading.Event()
+_finished = threading.Condition()
+_lock = threading.Lock()
+_settings = {
+    'dispatchers': 2,
+    'max_attempts': 3,
+    'retry_backoff': 2.0,
+    'lease_seconds': 120,
+    'poll_interval': 1.0
+}
+_stats = {
+    'submitted': 0,
+    'replayed': 0,
+    'succeeded': 0,
+    'failed': 0,
+    'retried': 0
+}
+
+def init_analysis_jobs(app, dispatchers=2, max_attempts=3, retry_backoff=2.0, lease_seconds=120, poll_interval=1.0,
+                       start_dispatchers=True):
+    """
+    Configure asynchronous analysis jobs and start the dispatcher threads.
+
+    Args:
+        app (Flask): Application whose database holds the job queue
+        dispatchers (int): Threads per process feeding jobs to the analysis pool
+        max_attempts (int): Attempts before a job is marked failed
+        retry_backoff (float): Seconds before the first retry, doubled for each further attempt
+        lease_seconds (int): A running job not finished within this is assumed lost and retried
+        poll_interval (float): Seconds between queue checks when idle
+        start_dispatchers (bool): Start the threads now; a pre-fork server master
+            passes False and each worker calls ensure_job_dispatchers after forking
+    """
+    global _app
+    _app = app
+    _settings.update({
+        'dispatchers': max(1, int(dispatchers)),
+        'max_attempts': max(1, int(max_attempts)),
+        'retry_backoff': float(retry_backoff),
+        'lease_seconds': int(lease_seconds),
+        'poll_interval': float(poll_interval)
+    })
+    if start_dispatchers:
+        ensure_job_dispatchers()
+
+    logger.info(f"Analysis jobs configured with {_settings['dispatchers']} dispatchers")
+
+def submit_analysis_job(image_bytes, kind='image', user_id=None, idempotency_key=None, progress_image=None):
+    """
+    Queue an image for analysis and return without waiting for it.
+
+    Must be called inside an application context.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+        kind (str): 'image' for a standalone analysis, 'progress' to fill in a ProgressImage
+        user_id (int, optional): Owner of the job; only they can read its status
+        idempotency_key (str, optional): Client key; resubmitting it returns the original job.
+            Ignored without a user_id, since anonymous clients would share one key namespace
+        progress_image (ProgressImage, optional): Unsaved record that receives the result
+
+    Returns:
+        tuple: (AnalysisJob, bool created)
+
+    Raises:
+        IdempotencyConflict: If the key was already used for a different image
+    """
+    digest = content_digest(image_bytes)
+
+    if user_id is None:
+        idempotency_key = None
+
+    if idempotency_key:
+        existing = _find_idempotent_job(user_id, idempotency_key, digest)
+        if existing is not None:
+            return existing, False
+
+    job = AnalysisJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        kind=kind,
+        idempotency_key=idempotency_key,
+        image_digest=digest,
+        max_attempts=_settings['max_attempts']
+    )
+
+    # A result already cached for these bytes completes the job immediately
+    cached = get_cached_analysis(analysis_cache_key(image_bytes))
+    if cached is not None:
+        _complete(job, cached, progress_image)
+    else:
+        job.image_data = image_bytes
+
+    try:
+        if progress_image is not None:
+            db.session.add(progress_image)
+            db.session.flush()
+            job.progress_image_id = progress_image.id
+        db.session.add(job)
+        db.session.commit()
+    except IntegrityError:
+        # Another request with the same key won the race
+        db.session.rollback()
+        existing = _find_idempotent_job(user_id, idempotency_key, digest) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing, False
+
+    _count('submitted')
+    if cached is not None:
+        _count('succeeded')
+        _notify_finished()
+    else:
+        ensure_job_dispatchers()
+        _wakeup.set()
+
+    return job, True
+
+def get_analysis_job(job_id, wait=0):
+    """
+    Get a job, optionally long-polling until it finishes.
+
+    Must be called inside an application context.
+
+    Args:
+        job_id (str): Job id from submit_analysis_job
+        wait (float, optional): Seconds to wait for the job to finish, capped at MAX_WAIT_SECONDS
+
+    Returns:
+        AnalysisJob: The job, or None if it does not exist
+    """
+    deadline = time.monotonic() + min(max(0.0, float(wait)), MAX_WAIT_SECONDS)
+
+    while True:
+        # Read fresh state; the job may have been finished by another process
+        db.session.expire_all()
+        job = db.session.get(AnalysisJob, job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job.finished or remaining <= 0:
+            return job
+
+        with _finished:
+            _finished.wait(min(remaining, _settings['poll_interval']))
+
+def get_analysis_job_stats():
+    """
+    Get analysis job metrics.
+
+    Must be called inside an application context.
+
+    Returns:
+        dict: Queue depth, running jobs and outcome counters
+    """
+    by_status = dict(
+        db.session.query(AnalysisJob.status, func.count(AnalysisJob.id))
+        .filter(AnalysisJob.status.in_(('queued', 'running')))
+        .group_by(AnalysisJob.status)
+        .all()
+    )
+
+    with _lock:
+        stats = dict(_stats)
+
+    stats.update({
+        'queueDepth': by_status.get('queued', 0),
+        'running': by_status.get('running', 0),
+        'dispatchers': _settings['dispatchers'],
+        'maxAttempts': _settings['max_attempts']
+    })
+    return stats
+
+def _find_idempotent_job(user_id, idempotency_key, digest):
+    existing = AnalysisJob.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+    if existing is None:
+        return None
+    if existing.image_digest != digest:
+        raise IdempotencyConflict('Idempotency key was already used for a different image')
+    _count('replayed')
+    return existing
+
+def ensure_job_dispatchers():
+    """Start dispatcher threads in this process; threads do not survive a fork."""
+    global _dispatchers, _dispatcher_pid
+
+    if _app is None:
+        return
+
+    with _dispatcher_lock:
+        pid = os.getpid()
+        if _dispatcher_pid == pid and all(t.is_alive() for t in _dispatchers):
+            return
+
+        _dispatchers = [t for t in _dispatchers if _dispatcher_pid == pid and t.is_alive()]
+        while len(_dispatchers) < _settings['dispatchers']:
+            thread = threading.Thread(
+                target=_dispatch_loop,
+                name=f"analysis-job-{len(_dispatchers)}",
+                daemon=True
+            )
+            thread.start()
+            _dispatchers.append(thread)
+        _dispatcher_pid = pid
+
+def _dispatch_loop():
+    while True:
+        try:
+            with _app.app_context():
+                job_id = _claim_next_job()
+                if job_id is not None:
+                    _execute(job_id)
+                    continue
+        except Exception as e:
+            logger.error(f"Analysis job dispatcher error: {str(e)}")
+
+        _wakeup.wait(_settings['poll_interval'])
+        _wakeup.clear()
+
+def _claim_next_job():
+    """
+    Claim the oldest runnable job with a conditional update, so concurrent
+    dispatchers in any process never run the same job twice.
+    """
+    now = datetime.utcnow()
+    runnable = or_(
+        and_(AnalysisJob.status == 'queued', AnalysisJob.run_after <= now),
+        and_(AnalysisJob.status == 'running', AnalysisJob.lease_expires_at < now)
+    )
+
+    candidates = (
+        db.session.query(AnalysisJob.id)
+        .filter(runnable)
+        .order_by(AnalysisJob.run_after)
+        .limit(_settings['dispatchers'])
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = AnalysisJob.query.filter(AnalysisJob.id == job_id, runnable).update({
+            'status': 'running',
+            'attempts': AnalysisJob.attempts + 1,
+            'started_at': now,
+            'lease_expires_at': now + timedelta(seconds=_settings['lease_seconds'])
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return job_id
+    return None
+
+def _execute(job_id):
+    job = db.session.get(AnalysisJob, job_id)
+
+    try:
+        result = run_analysis(job.image_data)
+
+    except AnalysisPoolBusy as e:
+        # Not the job's fault; put it back without spending an attempt
+        job.status = 'queued'
+        job.attempts -= 1
+        job.run_after = datetime.utcnow() + timedelta(seconds=e.retry_after)
+        db.session.commit()
+        return
+
+    except Exception as e:
+        logger.error(f"Analysis job {job_id} attempt {job.attempts} failed: {str(e)}")
+        job.error = str(e)
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.image_data = None
+            job.finished_at = datetime.utcnow()
+            _count('failed')
+        else:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=_settings['retry_backoff'] * 2 ** (job.attempts - 1)
+            )
+            _count('retried')
+        db.session.commit()
+        if job.finished:
+            _notify_finished()
+        return
+
+    progress_image = db.session.get(ProgressImage, job.progress_image_id) if job.progress_image_id else None
+    _complete(job, result, progress_image)
+    db.session.commit()
+    _count('succeeded')
+    _notify_finished()
+
+def _complete(job, result, progress_image=None):
+    job.result = result
+    job.status = 'succeeded'
+    job.error = None
+    job.image_data = None
+    job.finished_at = datetime.utcnow()
+
+    if progress_image is not None:
+        progress_image.skin_score = result.get('skinScore')
+        progress_image.skin_analysis = result.get('skinHealthMetrics')
+        progress_image.analysis_version = get_model_version()
+
+def _notify_finished():
+    with _finished:
+        _finished.notify_all()
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
@@ -0,0 +1,319 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from ml.tensor_buffers import SharedTensorBufferPool
+from services.analysis_cache import analysis_cache_key, get_cached_analysis, cache_analysis
+
+logger = logging.getLogger(__name__)
+
+class AnalysisPoolBusy(Exception):
+    """Raised when the analysis queue is full and the request should be retried later."""
+
+    def __init__(self, retry_after):
+        super().__init__('Image analysis queue is full')
+        self.retry_after = retry_after
+
+class AnalysisTimeout(Exception):
+    """Raised when an image analysis does not finish within the configured timeout."""
+
+# Pool state, configured once per process by init_analysis_pool
+_executor = None
+_pool_pid = None
+_slots = None
+# Model inputs shared with the workers, one per pending analysis
+_buffers = None
+# In a worker process, the parent's _buffers
+_worker_buffers = None
+_lock = threading.Lock()
+_settings = {
+    'workers': 0,
+    'max_pending': 8,
+    'timeout': 30.0,
+    'retry_after': 5
+}
+_stats = {
+    'submitted': 0,
+    'completed': 0,
+    'failed': 0,
+    'rejected': 0,
+    'timeouts': 0,
+    'inFlight': 0
+}
+
+def init_analysis_pool(workers=2, max_pending=8, timeout=30.0, retry_after=5, start=True):
+    """
+    Configure the worker pool used for CPU-bound image analysis.
+
+    Workers decode, crop and measure images, writing each model input
+    into a shared memory slot; the skin model reads it there in the
+    calling process, so concurrent requests share its micro-batches.
+
+    Args:
+        workers (int): Worker processes; 0 runs analysis in the request thread
+        max_pending (int): Analyses queued or running before new ones are rejected
+        timeout (float): Seconds to wait for a single analysis
+        retry_after (int): Seconds clients are told to wait when the pool is full
+        start (bool): Start the pool now; a pre-fork server master passes False
+            and each worker starts its own, after forking or on first use
+    """
+    with _lock:
+        _stop_pool()
+        _settings.update({
+            'workers': max(0, int(workers)),
+            'max_pending': max(1, int(max_pending)),
+            'timeout': float(timeout),
+            'retry_after': int(retry_after)
+        })
+
+    if start:
+        ensure_analysis_pool()
+
+    logger.info(f"Analysis pool configured with {_settings['workers']} workers")
+
+def ensure_analysis_pool():
+    """Start the configured pool in this process; a pool inherited across fork belongs to the parent."""
+    global _executor, _pool_pid, _slots, _buffers
+    from services.image_processing import SKIN_MODEL_INPUT_SHAPE
+
+    with _lock:
+        if _pool_pid == os.getpid():
+            return
+        _stop_pool()
+
+        _slots = threading.BoundedSemaphore(_settings['max_pending'])
+        if _settings['workers'] > 0:
+            _buffers = SharedTensorBufferPool(SKIN_MODEL_INPUT_SHAPE, slots=_settings['max_pending'])
+            # Spawned workers do not inherit the parent's threads or locks
+            _executor = ProcessPoolExecutor(
+                max_workers=_settings['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(SKIN_MODEL_INPUT_SHAPE, _settings['max_pending'], _buffers.names)
+            )
+        _pool_pid = os.getpid()
+
+def shutdown_analysis_pool():
+    """Stop the worker processes."""
+    with _lock:
+        _stop_pool(wait=True)
+
+def _stop_pool(wait=False):
+    # Called with _lock held
+    global _executor, _pool_pid, _buffers
+
+    if _executor is not None:
+        # An executor inherited across fork belongs to the parent; just drop it
+        if _pool_pid == os.getpid():
+            _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+    if _buffers is not None:
+        # close only frees the segments in the process that created them
+        _buffers.close()
+        _buffers = None
+    _pool_pid = None
+
+def _init_worker(shape, slots, names):
+    global _worker_buffers
+    _worker_buffers = SharedTensorBufferPool.attach(shape, slots, names)
+
+def _prepare_in_slot(image_bytes, index):
+    # Only the measurements are pickled back; the model input stays in the shared slot
+    return prepare_image_bytes(image_bytes, _worker_buffers.slot_at(index))
+
+def prepare_image_bytes(image_bytes, slot):
+    """
+    Decode an encoded image, crop the face into slot, and measure its regions.
+
+    Runs inside a pool worker on a shared memory slot, or inline when the
+    pool has no workers.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+        slot (InputSlot): Buffers for the crop and model input
+
+    Returns:
+        dict: 'measured' region metrics, 'darkCircles' score and 'faceDetected';
+        the model input is left in slot.tensor
+    """
+    from services.face_regions import prepare_face_inputs
+    from services.image_processing import compute_region_metrics
+    from services.skin_analysis import measure_dark_circles
+
+    face = prepare_face_inputs(io.BytesIO(image_bytes), slot=slot)
+    return {
+        'measured': compute_region_metrics(face['regions']),
+        'darkCircles': measure_dark_circles(face['input'], face['regions']),
+        'faceDetected': face['faceDetected']
+    }
+
+def analyze_prepared_image(tensor, prepared, timeout=30):
+    """
+    Run the skin model on a prepared image and interpret its heads.
+
+    The model call goes through the request batcher, so analyses finishing
+    in the pool at the same time share one forward pass.
+
+    Args:
+        tensor (numpy.ndarray): Model input written by prepare_image_bytes
+        prepared (dict): Output of prepare_image_bytes
+        timeout (float, optional): Seconds to wait for the model
+
+    Returns:
+        dict: Skin analysis results
+    """
+    from services.image_processing import predict_skin_heads
+    from services.skin_analysis import analyze_skin_image
+
+    heads = predict_skin_heads(tensor, timeout=timeout)
+    results = analyze_skin_image(
+        tensor,
+        heads=heads,
+        measured=prepared['measured'],
+        dark_circles=prepared['darkCircles']
+    )
+    results['faceDetected'] = prepared['faceDetected']
+    return results
+
+def analyze_image_bytes(image_bytes, timeout=30):
+    """
+    Decode, crop and analyze an encoded image in the calling thread.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+        timeout (float, optional): Seconds to wait for the model
+
+    Returns:
+        dict: Skin analysis results
+    """
+    from services.image_processing import input_slot
+
+    # The model input lives in a reused buffer; results never reference it
+    with input_slot() as slot:
+        return analyze_prepared_image(slot.tensor, prepare_image_bytes(image_bytes, slot), timeout=timeout)
+
+def run_analysis(image_bytes, use_cache=True):
+    """
+    Analyze an encoded image off the request thread.
+
+    Identical uploads are answered from the analysis cache without
+    touching the pool.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+        use_cache (bool, optional): Look up and store results in the analysis cache
+
+    Returns:
+        dict: Skin analysis results
+
+    Raises:
+        AnalysisPoolBusy: If too many analyses are already queued
+        AnalysisTimeout: If the analysis does not finish in time
+    """
+    if use_cache:
+        cache_key = analysis_cache_key(image_bytes)
+        cached = get_cached_analysis(cache_key)
+        if cached is not None:
+            return cached
+
+    result = _run_in_pool(image_bytes)
+
+    if use_cache:
+        cache_analysis(cache_key, result)
+    return result
+
+def _run_in_pool(image_bytes):
+    if _pool_pid != os.getpid():
+        # First use, or first use in a forked server worker
+        ensure_analysis_pool()
+
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        _count('rejected')
+        raise AnalysisPoolBusy(_settings['retry_after'])
+
+    _count('submitted')
+    _count('inFlight')
+
+    def release(_=None):
+        _count('inFlight', -1)
+        slots.release()
+
+    if _executor is None:
+        try:
+            result = analyze_image_bytes(image_bytes, timeout=_settings['timeout'])
+            _count('completed')
+            return result
+        except Exception:
+            _count('failed')
+            raise
+        finally:
+            release()
+
+    # One shared buffer per pending slot, so holding a slot guarantees a buffer
+    buffers = _buffers
+    buffer = buffers.acquire()
+
+    def release_with_buffer(_=None):
+        buffers.release(buffer)
+        release()
+
+    deadline = time.monotonic() + _settings['timeout']
+    future = _executor.submit(_prepare_in_slot, image_bytes, buffer.index)
+
+    try:
+        prepared = future.result(timeout=_settings['timeout'])
+    except FutureTimeoutError:
+        future.cancel()
+        # Hold the slot until the worker is done writing, even though the caller stops waiting
+        future.add_done_callback(release_with_buffer)
+        _count('timeouts')
+        raise AnalysisTimeout(f"Image analysis exceeded {_settings['timeout']}s")
+    except Exception:
+        release_with_buffer()
+        _count('failed')
+        raise
+
+    # The model runs here rather than in the worker, so requests waiting on
+    # it at the same time are batched together. The slot and the timeout
+    # cover this stage too, so inference cannot pile up in this process.
+    try:
+        result = analyze_prepared_image(buffer.tensor, prepared, timeout=max(0.0, deadline - time.monotonic()))
+        _count('completed')
+        return result
+    except FutureTimeoutError:
+        _count('timeouts')
+        raise AnalysisTimeout(f"Image analysis exceeded {_settings['timeout']}s")
+    except Exception:
+        _count('failed')
+        raise
+    finally:
+        release_with_buffer()
+
+def get_analysis_pool_stats():
+    """
+    Get analysis pool metrics.
+
+    Returns:
+        dict: Pool size, queue limit, in-flight count and outcome counters
+    """
+    with _lock:
+        stats = dict(_stats)
+
+    buffers = _buffers
+    if buffers is not None:
+        stats['sharedBuffers'] = buffers.stats()
+
+    stats.update({
+        'workers': _settings['workers'],
+        'maxPending': _settings['max_pending'],
+        'timeoutSeconds': _settings['timeout']
+    })
+    return stats
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
@@ -0,0 +1,171 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models.product import Product
+from services.knowledge_base import stem
+from services.user_context import get_user_context
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Cache state, configured once per process by init_chatbot_cache. Responses
+# that depend on the product catalog or on a user's profile and routine are
+# keyed on a catalog generation, bumped by the model events below whenever
+# a process writes products, and on the version of the user's context. Each
+# process only sees its own writes, so ttl bounds how long another process
+# can serve a stale response.
+_entries = OrderedDict()
+_lock = threading.Lock()
+_catalog_generation = 0
+_settings = {
+    'max_entries': 2048,
+    'ttl': 300.0
+}
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'invalidations': 0
+}
+
+def init_chatbot_cache(max_entries=2048, ttl=300.0):
+    """
+    Configure the chatbot response cache.
+
+    Args:
+        max_entries (int): Responses kept before the least recently used is evicted; 0 disables
+        ttl (float): Seconds a response may be served
+    """
+    with _lock:
+        _entries.clear()
+        _settings.update({
+            'max_entries': max(0, int(max_entries)),
+            'ttl': float(ttl)
+        })
+
+    logger.info(f"Chatbot cache configured for {max_entries} responses")
+
+def normalize_query(query):
+    """
+    Reduce a message to the form used as its cache key: lowercase words,
+    punctuation dropped, each word stemmed.
+
+    Args:
+        query (str): User message
+
+    Returns:
+        str: Normalized message
+    """
+    return ' '.join(stem(word) for word in _WORD_PATTERN.findall(query.lower()))
+
+def get_cached_response(normalized, user_id=None):
+    """
+    Look up a response, first one shared by all users and then one
+    personalized for this user's current context and catalog generation.
+
+    Must be called inside an application context for signed-in users, whose
+    context may need loading.
+
+    Args:
+        normalized (str): Message from normalize_query
+        user_id (int, optional): User ID if authenticated
+
+    Returns:
+        str: Cached response, or None on a miss
+    """
+    now = time.monotonic()
+    personal_key = _personal_key(normalized, user_id)
+    with _lock:
+        for key in (('shared', normalized), personal_key):
+            entry = _entries.get(key)
+            if entry is None:
+                continue
+            response, expires_at = entry
+            if expires_at <= now:
+                del _entries[key]
+                continue
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return response
+
+        _stats['misses'] += 1
+        return None
+
+def cache_response(normalized, response, user_id=None, personalized=False):
+    """
+    Store a response.
+
+    Args:
+        normalized (str): Message from normalize_query
+        response (str): Response to the message
+        user_id (int, optional): User ID if authenticated
+        personalized (bool): Whether the response depends on the catalog or the user's profile and routine
+    """
+    if _settings['max_entries'] == 0:
+        return
+
+    key = _personal_key(normalized, user_id) if personalized else ('shared', normalized)
+    with _lock:
+        _entries[key] = (response, time.monotonic() + _settings['ttl'])
+        _entries.move_to_end(key)
+        while len(_entries) > _settings['max_entries']:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+
+def invalidate_catalog():
+    """Stop serving personalized responses built from the current product catalog."""
+    global _catalog_generation
+    with _lock:
+        _catalog_generation += 1
+        _stats['invalidations'] += 1
+
+def get_chatbot_cache_stats():
+    """
+    Get chatbot cache metrics.
+
+    Returns:
+        dict: Hit, miss, eviction and invalidation counters, hit rate and entry count
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_entries)
+        stats['maxEntries'] = _settings['max_entries']
+
+    lookups = stats['hits'] + stats['misses']
+    stats['hitRate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+def _personal_key(normalized, user_id):
+    # Dead keys from older versions and generations age out of the LRU
+    if user_id is None:
+        return ('personal', normalized, None, None, _catalog_generation)
+    return ('personal', normalized, str(user_id), get_user_context(user_id).version, _catalog_generation)
+
+# Product writes are applied when their transaction commits, so a
+# concurrent request cannot cache a response read before the commit under
+# the new generation.
+_PENDING_KEY = 'chatbot_cache_catalog_changed'
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def _product_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        invalidate_catalog()
+    else:
+        session.info[_PENDING_KEY] = True
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    if session.info.pop(_PENDING_KEY, False):
+        invalidate_catalog()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop(_PENDING_KEY, None)
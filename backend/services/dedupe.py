@@ -0,0 +1,120 @@
+import logging
+from datetime import timedelta
+from PIL import Image
+from sqlalchemy import and_, or_
+from models.user import ProgressImage, ProgressImageHashBand
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+# dHash compares each pixel with its right neighbour on a 9x8 grayscale thumbnail
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+HASH_BITS = (HASH_WIDTH - 1) * HASH_HEIGHT
+
+# The hash is indexed as this many equal bands. Two hashes within
+# HASH_BANDS - 1 bits of each other must share at least one band exactly,
+# so looking up each band finds every near-duplicate up to that distance.
+HASH_BANDS = 8
+BAND_BITS = HASH_BITS // HASH_BANDS
+MAX_INDEXED_DISTANCE = HASH_BANDS - 1
+
+def perceptual_hash(image):
+    """
+    Compute a 64-bit difference hash (dHash) of a decoded image.
+
+    Near-identical photos, such as burst shots or re-encodes, hash to
+    values a few bits apart.
+
+    Args:
+        image (PIL.Image.Image): Upright image, such as from storage.decode_preview
+
+    Returns:
+        int: 64-bit hash
+    """
+    pixels = list(image.convert('L').resize((HASH_WIDTH, HASH_HEIGHT), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for col in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_to_hex(value):
+    return f"{value:016x}"
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def hash_bands(value):
+    """Split a hash into HASH_BANDS integers of BAND_BITS bits each."""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (band * BAND_BITS)) & mask for band in range(HASH_BANDS)]
+
+def find_near_duplicate(user_id, value, max_distance, taken_at, window):
+    """
+    Find the user's closest analyzed progress image to a perceptual hash.
+
+    Only photos taken within window of the new one are considered, so a
+    retake or burst shot matches but the same pose weeks later, which is
+    the point of progress tracking, does not.
+
+    Each band is an indexed equality lookup, so the cost grows with the
+    number of candidates sharing a band rather than with the user's
+    history.
+
+    Args:
+        user_id (int): Owner of the progress images
+        value (int): Perceptual hash of the new upload
+        max_distance (int): Largest Hamming distance treated as a duplicate,
+            at most MAX_INDEXED_DISTANCE
+        taken_at (datetime): Date of the new upload
+        window (timedelta): Largest time apart treated as a duplicate
+
+    Returns:
+        ProgressImage: Closest match within max_distance, or None
+    """
+    max_distance = min(max_distance, MAX_INDEXED_DISTANCE)
+    if max_distance < 0 or window <= timedelta(0):
+        return None
+
+    band_matches = or_(*[
+        and_(ProgressImageHashBand.band == band, ProgressImageHashBand.value == band_value)
+        for band, band_value in enumerate(hash_bands(value))
+    ])
+    candidates = (
+        ProgressImage.query
+        .join(ProgressImageHashBand, ProgressImageHashBand.progress_image_id == ProgressImage.id)
+        .filter(ProgressImageHashBand.user_id == user_id, band_matches)
+        .filter(ProgressImage.skin_score.isnot(None))
+        .filter(ProgressImage.date.between(taken_at - window, taken_at + window))
+        .distinct()
+        .all()
+    )
+
+    best, best_distance = None, max_distance + 1
+    for candidate in candidates:
+        distance = hamming_distance(value, int(candidate.phash, 16))
+        if distance < best_distance:
+            best, best_distance = candidate, distance
+    return best
+
+def index_progress_image(progress_image, value):
+    """
+    Record a progress image's hash and add its bands to the lookup index.
+
+    The image must already have an id; the caller commits.
+
+    Args:
+        progress_image (ProgressImage): Flushed progress image
+        value (int): Its perceptual hash
+    """
+    progress_image.phash = hash_to_hex(value)
+    for band, band_value in enumerate(hash_bands(value)):
+        db.session.add(ProgressImageHashBand(
+            user_id=progress_image.user_id,
+            progress_image_id=progress_image.id,
+            band=band,
+            value=band_value
+        ))
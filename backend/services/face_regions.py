@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+import logging
+import math
+from PIL import Image, ImageOps
+from ml.tensor_buffers import to_model_input
+from services.image_processing import detect_face_boxes, get_eye_cascade
+
+logger = logging.getLogger(__name__)
+
+# Side of the square face crop fed to the skin model
+FACE_INPUT_SIZE = 224
+
+# The face crop is a square this much larger than the detected box, so the
+# forehead and jawline are included
+FACE_CROP_SCALE = 1.2
+
+# Named regions as (x0, y0, x1, y1) fractions of the aligned face box, and
+# the (width, height) each crop is resized to
+FACE_REGIONS = {
+    'forehead': ((0.2, -0.05, 0.8, 0.2), (160, 64)),
+    't_zone': ((0.4, 0.25, 0.6, 0.75), (64, 160)),
+    'left_under_eye': ((0.18, 0.45, 0.42, 0.55), (96, 40)),
+    'right_under_eye': ((0.58, 0.45, 0.82, 0.55), (96, 40)),
+    'left_cheek': ((0.1, 0.55, 0.35, 0.8), (96, 96)),
+    'right_cheek': ((0.65, 0.55, 0.9, 0.8), (96, 96))
+}
+
+# Eyes are searched for on a copy of the upper face this wide
+EYE_SEARCH_WIDTH = 200
+# Rotations beyond this are more likely a bad eye match than a tilted head
+MAX_ALIGNMENT_ANGLE = 30
+
+def prepare_face_inputs(image_file, slot=None):
+    """
+    Decode an image and crop the face and named skin regions.
+
+    Args:
+        image_file: Path or file object with an encoded image
+        slot (InputSlot, optional): Preallocated buffers for the face crop and model input
+
+    Returns:
+        dict: Model input, face crop, region crops and detection details
+    """
+    with Image.open(image_file) as img:
+        # Phone photos are often stored sideways with an EXIF orientation tag
+        img = ImageOps.exif_transpose(img)
+        rgb = np.asarray(img.convert('RGB'))
+
+    return extract_face_regions(rgb, slot=slot)
+
+def extract_face_regions(rgb, slot=None):
+    """
+    Detect and align the face, then crop it and its named regions.
+
+    Without a detectable face, the centered square of the photo is used as
+    the face box so the analysis can still run.
+
+    Args:
+        rgb (numpy.ndarray): Full-resolution uint8 RGB image
+        slot (InputSlot, optional): Preallocated buffers; 'face' and 'input'
+            are then views into it, valid while the slot is held
+
+    Returns:
+        dict: 'input' (model batch of one), 'face' (uint8 crop), 'regions'
+        (uint8 crop per FACE_REGIONS name), 'faceDetected', 'box' and 'angle'
+    """
+    height, width = rgb.shape[:2]
+
+    boxes = detect_face_boxes(rgb)
+    face_detected = len(boxes) > 0
+    if face_detected:
+        box = max(boxes, key=lambda b: b[2] * b[3])
+    else:
+        side = min(height, width)
+        box = ((width - side) // 2, (height - side) // 2, side, side)
+
+    # Work on a padded region of interest so rotation never touches the whole photo
+    x, y, w, h = box
+    pad = int(max(w, h) * 0.5)
+    roi_x0, roi_y0 = max(0, x - pad), max(0, y - pad)
+    roi_x1, roi_y1 = min(width, x + w + pad), min(height, y + h + pad)
+    roi = rgb[roi_y0:roi_y1, roi_x0:roi_x1]
+    face_box = (x - roi_x0, y - roi_y0, w, h)
+
+    angle = _eye_angle(roi, face_box) if face_detected else 0.0
+    if angle:
+        center = (face_box[0] + w / 2.0, face_box[1] + h / 2.0)
+        rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+        roi = cv2.warpAffine(roi, rotation, (roi.shape[1], roi.shape[0]),
+                             flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+
+    face = _crop_face(roi, face_box, out=slot.pixels if slot is not None else None)
+    regions = {
+        name: _crop_relative(roi, face_box, relative_box, size)
+        for name, (relative_box, size) in FACE_REGIONS.items()
+    }
+
+    return {
+        'input': to_model_input(face, slot.tensor if slot is not None else np.empty((1,) + face.shape, dtype=np.float32)),
+        'face': face,
+        'regions': regions,
+        'faceDetected': face_detected,
+        'box': box,
+        'angle': angle
+    }
+
+def _eye_angle(roi, face_box):
+    """Angle in degrees that levels the eyes, or 0 if two eyes are not found."""
+    x, y, w, h = face_box
+    upper_face = roi[y:y + h // 2, x:x + w]
+    if upper_face.size == 0:
+        return 0.0
+
+    scale = min(1.0, EYE_SEARCH_WIDTH / float(upper_face.shape[1]))
+    gray = cv2.cvtColor(upper_face, cv2.COLOR_RGB2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    eyes = get_eye_cascade().detectMultiScale(gray, 1.1, 5)
+    if len(eyes) < 2:
+        return 0.0
+
+    # The two largest detections, left to right
+    eyes = sorted(sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2], key=lambda e: e[0])
+    (lx, ly, lw, lh), (rx, ry, rw, rh) = eyes
+    dx = (rx + rw / 2.0) - (lx + lw / 2.0)
+    dy = (ry + rh / 2.0) - (ly + lh / 2.0)
+    if dx <= 0:
+        return 0.0
+
+    angle = math.degrees(math.atan2(dy, dx))
+    return angle if abs(angle) <= MAX_ALIGNMENT_ANGLE else 0.0
+
+def _crop_face(roi, face_box, out=None):
+    x, y, w, h = face_box
+    side = int(max(w, h) * FACE_CROP_SCALE)
+    cx, cy = x + w // 2, y + h // 2
+    x0, y0 = cx - side // 2, cy - side // 2
+    x1, y1 = x0 + side, y0 + side
+    crop = roi[max(0, y0):min(roi.shape[0], y1), max(0, x0):min(roi.shape[1], x1)]
+    # Near an edge, replicate border pixels so the crop stays square rather than stretching the face
+    pad = (max(0, -y0), max(0, y1 - roi.shape[0]), max(0, -x0), max(0, x1 - roi.shape[1]))
+    if any(pad):
+        crop = cv2.copyMakeBorder(crop, *pad, cv2.BORDER_REPLICATE)
+    return cv2.resize(crop, (FACE_INPUT_SIZE, FACE_INPUT_SIZE), dst=out, interpolation=cv2.INTER_AREA)
+
+def _crop_relative(roi, face_box, relative_box, size):
+    x, y, w, h = face_box
+    rx0, ry0, rx1, ry1 = relative_box
+    x0 = int(np.clip(x + rx0 * w, 0, roi.shape[1] - 1))
+    y0 = int(np.clip(y + ry0 * h, 0, roi.shape[0] - 1))
+    x1 = int(np.clip(x + rx1 * w, x0 + 1, roi.shape[1]))
+    y1 = int(np.clip(y + ry1 * h, y0 + 1, roi.shape[0]))
+    return cv2.resize(roi[y0:y1, x0:x1], size, interpolation=cv2.INTER_AREA)
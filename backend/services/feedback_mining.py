@@ -0,0 +1,154 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from models.product import Product
+from models.user import UserFeedback
+from utils.database import db
+from utils.helpers import extract_concerns_from_feedback
+
+logger = logging.getLogger(__name__)
+
+def mine_feedback_concerns(batch_size=1000, workers=2, max_rows_per_second=0.0, after_id=0,
+                           force=False, progress_interval=10.0):
+    """
+    Tag every feedback with the skin concerns mentioned in its text, then
+    aggregate the tags per product.
+
+    Rows are read in primary key order, one batch at a time, and each batch
+    is written in its own transaction, so the job can be stopped and
+    restarted at any point. Rows already tagged are skipped unless force is
+    set, which makes a plain rerun resume where the last one stopped. Must
+    be called inside an application context.
+
+    Args:
+        batch_size (int): Rows per read and per write transaction
+        workers (int): Processes extracting concerns
+        max_rows_per_second (float): Throttle so live traffic keeps its share of CPU and DB; 0 disables
+        after_id (int): Only rows with a larger id are tagged
+        force (bool): Also re-tag rows that already have tags, e.g. after the keywords change
+        progress_interval (float): Seconds between progress log lines
+
+    Returns:
+        dict: Rows tagged, last id, products whose counts changed, elapsed time and rows per second
+    """
+    query = UserFeedback.query
+    if not force:
+        query = query.filter(UserFeedback._concern_tags.is_(None))
+    total = query.filter(UserFeedback.id > after_id).count()
+
+    logger.info(f"Mining concerns from {total} feedback rows")
+
+    summary = {'total': total, 'tagged': 0, 'lastId': after_id}
+    started = time.monotonic()
+    last_report = started
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context, initializer=_init_worker) as pool:
+        while True:
+            batch_started = time.monotonic()
+
+            # Keyset pagination: never OFFSET, so each batch is an index range scan
+            rows = (
+                query.with_entities(UserFeedback.id, UserFeedback.feedback_text)
+                .filter(UserFeedback.id > summary['lastId'])
+                .order_by(UserFeedback.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            summary['lastId'] = rows[-1].id
+
+            # A few large chunks per worker keep pickling overhead low
+            chunksize = max(1, len(rows) // (4 * max(1, workers)))
+            tags = pool.map(extract_concerns_from_feedback, [row.feedback_text for row in rows], chunksize=chunksize)
+            updates = [{'id': row.id, '_concern_tags': json.dumps(row_tags)} for row, row_tags in zip(rows, tags)]
+
+            # One transaction per batch keeps write locks short
+            db.session.bulk_update_mappings(UserFeedback, updates)
+            db.session.commit()
+            summary['tagged'] += len(updates)
+
+            now = time.monotonic()
+            if now - last_report >= progress_interval:
+                _log_progress(summary, now - started)
+                last_report = now
+
+            if max_rows_per_second > 0:
+                time.sleep(max(0.0, len(rows) / max_rows_per_second - (time.monotonic() - batch_started)))
+
+    summary['products'] = aggregate_review_concerns(batch_size=batch_size)
+
+    elapsed = time.monotonic() - started
+    summary['elapsedSeconds'] = round(elapsed, 1)
+    summary['rowsPerSecond'] = round(summary['tagged'] / elapsed, 2) if elapsed else 0.0
+    _log_progress(summary, elapsed)
+    return summary
+
+def aggregate_review_concerns(batch_size=1000):
+    """
+    Count, for every product, the tagged reviews mentioning each concern.
+
+    Tags are streamed from the database, so memory grows with the number of
+    products rather than of reviews. Products are written through the ORM,
+    one batch per transaction, and only when their counts changed, so the
+    product index and the chatbot cache see the update through their
+    Product listeners. Must be called inside an application context.
+
+    Args:
+        batch_size (int): Rows fetched per round trip, and products per write transaction
+
+    Returns:
+        int: Number of products whose counts changed
+    """
+    concern_counts = {}
+    review_counts = Counter()
+    rows = (
+        db.session.query(UserFeedback.product_id, UserFeedback._concern_tags)
+        .filter(UserFeedback._concern_tags.isnot(None))
+        .execution_options(yield_per=batch_size)
+    )
+    for product_id, tags in rows:
+        review_counts[product_id] += 1
+        concern_counts.setdefault(product_id, Counter()).update(json.loads(tags))
+
+    changed = 0
+    last_id = 0
+    while True:
+        products = (
+            Product.query
+            .filter(Product.id > last_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not products:
+            break
+
+        for product in products:
+            # Products without tagged reviews are reset, so removed reviews stop counting
+            counts = dict(concern_counts.get(product.id, {}))
+            if product.review_concerns != counts or product.mined_review_count != review_counts[product.id]:
+                product.review_concerns = counts
+                product.mined_review_count = review_counts[product.id]
+                changed += 1
+        last_id = products[-1].id
+        db.session.commit()
+
+    return changed
+
+def _init_worker():
+    """Keep mining workers behind live request handling for the CPU."""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+def _log_progress(summary, elapsed):
+    rate = summary['tagged'] / elapsed if elapsed else 0.0
+    logger.info(
+        f"Concern mining {summary['tagged']}/{summary['total']} rows, {rate:.1f} rows/s, "
+        f"resume with --after-id {summary['lastId']}"
+    )
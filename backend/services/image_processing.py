@@ -4,29 +4,159 @@ import logging
 from PIL import Image
 import io
 import os
-import tensorflow as tf
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from tensorflow.keras.preprocessing import image as keras_image
+import threading
+from functools import partial
+from ml.batching import MicroBatcher
+from ml.inference_backends import load_backend
+from ml.model_registry import model_registry
+from ml.tensor_buffers import TensorBufferPool, to_model_input
+from ml.concern_detector import CONCERN_NAMES
+from ml.skin_model import SkinAnalysisModel, decode_heads
 
 logger = logging.getLogger(__name__)
 
 # Load models (in a real application, these would be actual trained models)
-# For this example, we'll simulate the models
-class MockModel:
-    def predict(self, img):
-        # Return random predictions for demonstration
-        return np.random.random((1, 5))
+# For this example, the skin model simulates a backbone with one head per attribute
+# Bump whenever the mock model changes so cached analyses are invalidated
+MOCK_MODEL_VERSION = 'mock-2'
 
-# Initialize mock models
-skin_type_model = MockModel()
-skin_concern_model = MockModel()
+# Shape of one skin model input, without the batch axis
+SKIN_MODEL_INPUT_SHAPE = (224, 224, 3)
 
-def preprocess_image(image_file):
+def load_skin_model(backend='mock', model_path=None, threads=1):
+    """
+    Load the skin analysis model with the requested inference backend.
+    
+    Args:
+        backend (str): 'mock', 'numpy' (memory-mapped SkinAnalysisModel.save
+            weights), or an exported-model runtime ('onnx', 'tflite', 'tensorflow')
+        model_path (str, optional): Exported model file or weights directory
+        threads (int, optional): Intra-op threads for the runtime
+        
+    Returns:
+        object: Model with a predict(batch) method returning HEAD_LAYOUT rows
+    """
+    if backend == 'mock':
+        return SkinAnalysisModel()
+    if backend == 'numpy':
+        return SkinAnalysisModel.load(model_path, mmap=True)
+    return load_backend(backend, model_path, threads=threads)
+
+# One backbone pass per image feeds every analysis head. The registry owns the
+# loaded model; the handle always calls the instance current in this process.
+model_registry.register('skin_model', load_skin_model, version=MOCK_MODEL_VERSION)
+skin_model = model_registry.handle('skin_model')
+
+# Concurrent requests share forward passes through this batcher
+skin_model_batcher = MicroBatcher(skin_model, name='skin_model')
+
+# Reusable input tensors, one slot per analysis running concurrently in this process
+input_buffers = TensorBufferPool(SKIN_MODEL_INPUT_SHAPE, slots=8)
+
+def configure_inference(max_batch_size=None, max_wait_ms=None, backend=None, model_path=None,
+                        threads=1, model_version=None, warm_up_batch_sizes=None, input_buffer_slots=None):
+    """
+    Configure the image model and its batching limits.
+    
+    Args:
+        max_batch_size (int, optional): Maximum images per forward pass
+        max_wait_ms (float, optional): Maximum time a request waits for a batch to fill
+        backend (str, optional): Inference backend to load; keeps the current model if None
+        model_path (str, optional): Exported model file for the backend
+        threads (int, optional): Intra-op threads for the runtime
+        model_version (str, optional): Version recorded with results; derived from the backend if None
+        warm_up_batch_sizes (list, optional): Load the model now and run these batch sizes once,
+            so the first request does not pay for loading or graph optimization
+        input_buffer_slots (int, optional): Preallocated input tensors for concurrent analyses
+    
+    Raises:
+        ValueError: If a backend other than 'mock' is requested without a model path
+    """
+    global input_buffers
+    
+    if backend is not None:
+        if backend != 'mock' and not model_path:
+            raise ValueError(f"SKIN_MODEL_PATH is required for the {backend} backend")
+        if not model_version:
+            model_version = MOCK_MODEL_VERSION if backend == 'mock' else f"{backend}:{os.path.basename(model_path)}"
+        model_registry.register(
+            'skin_model',
+            partial(load_skin_model, backend, model_path, threads=threads),
+            version=model_version
+        )
+    
+    skin_model_batcher.configure(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    
+    if input_buffer_slots and input_buffer_slots != input_buffers.slots:
+        input_buffers = TensorBufferPool(SKIN_MODEL_INPUT_SHAPE, slots=input_buffer_slots)
+    
+    if warm_up_batch_sizes:
+        model_registry.warm_up('skin_model', SKIN_MODEL_INPUT_SHAPE, batch_sizes=warm_up_batch_sizes)
+
+def get_model_version():
+    """
+    Get the version of the loaded image model.
+    
+    Returns:
+        str: Model version, used to key cached and stored analyses
+    """
+    return model_registry.version('skin_model')
+
+def get_inference_stats():
+    """
+    Get batching and input buffer metrics for the image model.
+    
+    Returns:
+        dict: Batch size, queue wait and model time metrics per model, and input buffer usage
+    """
+    return {
+        skin_model_batcher.name: skin_model_batcher.stats(),
+        'inputBuffers': input_buffers.stats()
+    }
+
+def input_slot():
+    """
+    Borrow a preallocated input tensor for one analysis.
+    
+    Returns:
+        contextmanager: Yields an InputSlot with uint8 pixels and a float32 tensor
+    """
+    return input_buffers.slot()
+
+def predict_skin_heads(image, timeout=30):
+    """
+    Run the skin model once on a preprocessed image.
+    
+    Args:
+        image: Preprocessed image with a leading batch axis
+        timeout (float, optional): Seconds to wait for a batch to run it
+        
+    Returns:
+        dict: Output of every analysis head, see ml.skin_model.HEAD_LAYOUT
+    """
+    return decode_heads(skin_model_batcher.predict(image, timeout=timeout)[0])
+
+def predict_skin_heads_batch(images):
+    """
+    Run the skin model on a batch that is already assembled, bypassing the
+    request batcher.
+    
+    Args:
+        images (numpy.ndarray): Preprocessed images stacked on the batch axis
+        
+    Returns:
+        list: Output of every analysis head, one dict per image
+    """
+    return [decode_heads(row) for row in skin_model.predict(images)]
+
+def preprocess_image(image_file, out=None):
     """
     Preprocess image for analysis.
     
     Args:
         image_file: Image file from request or path to image
+        out (numpy.ndarray, optional): float32 (1, 224, 224, 3) buffer to write into,
+            such as an InputSlot tensor; allocated if None
         
     Returns:
         numpy.ndarray: Preprocessed image ready for model input
@@ -47,48 +177,117 @@ def preprocess_image(image_file):
         # Resize image to standard size
         img = img.resize((224, 224))
         
-        # Convert to numpy array
-        img_array = keras_image.img_to_array(img)
-        
-        # Expand dimensions for model input
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        # Preprocess for model
-        preprocessed_img = preprocess_input(img_array)
-        
-        return preprocessed_img
+        # Scale pixels to [-1, 1] as MobileNetV2 expects, in place in the output batch of one
+        if out is None:
+            out = np.empty((1,) + SKIN_MODEL_INPUT_SHAPE, dtype=np.float32)
+        return to_model_input(np.asarray(img), out)
         
     except Exception as e:
         logger.error(f"Error preprocessing image: {str(e)}")
         raise
 
-def detect_face(image):
+# Face detection runs on a copy no larger than this on its longest side
+FACE_DETECTION_MAX_DIM = 320
+FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+EYE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_eye.xml'
+
+# CascadeClassifier is not safe to share between concurrent detectMultiScale
+# calls, so each thread loads each cascade once and keeps reusing it
+_cascade_local = threading.local()
+
+def _get_cascade(path):
+    """Get this thread's cascade for path, loading it on first use."""
+    cascades = getattr(_cascade_local, 'cascades', None)
+    if cascades is None:
+        cascades = _cascade_local.cascades = {}
+    cascade = cascades.get(path)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(path)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load cascade from {path}")
+        cascades[path] = cascade
+    return cascade
+
+def _get_face_cascade():
+    """Get this thread's face cascade, loading it on first use."""
+    return _get_cascade(FACE_CASCADE_PATH)
+
+def get_eye_cascade():
+    """Get this thread's eye cascade, loading it on first use."""
+    return _get_cascade(EYE_CASCADE_PATH)
+
+def _to_uint8(image):
+    """Convert a PIL image or model input array to a uint8 RGB or grayscale array."""
+    if isinstance(image, Image.Image):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        return np.asarray(image)
+    
+    image = np.asarray(image)
+    if image.ndim == 4:
+        image = image[0]
+    if image.dtype != np.uint8:
+        # Model inputs are scaled to [-1, 1]; bring them back to pixel range
+        if image.min() < 0:
+            image = (image + 1.0) * 127.5
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    return image
+
+def _to_grayscale(image):
+    """Convert a PIL image or RGB/grayscale array to a uint8 grayscale array."""
+    image = _to_uint8(image)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return image
+
+def _to_rgb(image):
+    """Convert a PIL image or RGB/grayscale array to a contiguous uint8 RGB array."""
+    image = _to_uint8(image)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    return np.ascontiguousarray(image)
+
+def detect_face_boxes(image, max_dim=FACE_DETECTION_MAX_DIM):
+    """
+    Detect every face in the image.
+    
+    Args:
+        image: PIL image or RGB/grayscale array
+        max_dim (int, optional): Longest side of the copy used for detection
+        
+    Returns:
+        list: (x, y, w, h) boxes in full-resolution coordinates
+    """
+    gray = _to_grayscale(image)
+    
+    # Detect on a downscaled copy and map the boxes back to full resolution
+    height, width = gray.shape[:2]
+    scale = min(1.0, float(max_dim) / max(height, width))
+    if scale < 1.0:
+        small = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    
+    faces = _get_face_cascade().detectMultiScale(small, 1.1, 4)
+    return [tuple(int(round(v / scale)) for v in face) for face in faces]
+
+def detect_face(image, max_dim=FACE_DETECTION_MAX_DIM):
     """
     Detect face in the image.
     
     Args:
-        image: Preprocessed image
+        image: PIL image or RGB/grayscale array
+        max_dim (int, optional): Longest side of the copy used for detection
         
     Returns:
         tuple: (x, y, w, h) coordinates of face or None if no face detected
     """
     try:
-        # Convert to numpy array if it's not already
-        if isinstance(image, Image.Image):
-            image = np.array(image)
-        
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
-        # Load face detector (using Haar Cascade for simplicity)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        faces = detect_face_boxes(image, max_dim=max_dim)
         
         # Return the first face found
         if len(faces) > 0:
-            return faces[0]  # (x, y, w, h)
+            return faces[0]
         else:
             return None
             
@@ -96,6 +295,19 @@ def detect_face(image):
         logger.error(f"Error detecting face: {str(e)}")
         return None
 
+def detect_faces(images, max_dim=FACE_DETECTION_MAX_DIM):
+    """
+    Detect faces in many images.
+    
+    Args:
+        images (list): PIL images or RGB/grayscale arrays
+        max_dim (int, optional): Longest side of the copy used for detection
+        
+    Returns:
+        list: (x, y, w, h) or None for each image, in input order
+    """
+    return [detect_face(image, max_dim=max_dim) for image in images]
+
 def detect_skin_concerns(image):
     """
     Detect skin concerns in the image.
@@ -109,20 +321,8 @@ def detect_skin_concerns(image):
     try:
         logger.info("Detecting skin concerns")
         
-        # In a real application, this would use a trained model
-        # For this example, we'll return simulated results
-        
-        # Simulate model prediction
-        concerns = {
-            "acne": np.random.uniform(0.2, 0.8),
-            "wrinkles": np.random.uniform(0.1, 0.7),
-            "dark_spots": np.random.uniform(0.2, 0.9),
-            "redness": np.random.uniform(0.1, 0.6),
-            "dryness": np.random.uniform(0.2, 0.8),
-            "oiliness": np.random.uniform(0.2, 0.7),
-            "large_pores": np.random.uniform(0.3, 0.8),
-            "dullness": np.random.uniform(0.2, 0.7)
-        }
+        heads = predict_skin_heads(image)
+        concerns = {name: float(score) for name, score in zip(CONCERN_NAMES, heads['concerns'])}
         
         # Filter to include only concerns with confidence above threshold
         threshold = 0.4
@@ -134,10 +334,102 @@ def detect_skin_concerns(image):
         logger.error(f"Error detecting skin concerns: {str(e)}")
         return {}
 
+# Skin is segmented in YCrCb; a mask covering less than this share of the
+# crop is treated as unreliable and the whole crop is used instead
+SKIN_CR_RANGE = (133, 173)
+SKIN_CB_RANGE = (77, 127)
+MIN_SKIN_FRACTION = 0.05
+
+class _SkinPlanes:
+    """Color planes and skin mask shared by the metric functions for one image."""
+    __slots__ = ('gray', 'lab_l', 'lab_a', 'mask', 'skin_pixels')
+
+    def __init__(self, image):
+        rgb = _to_rgb(image)
+        
+        ycrcb = cv2.cvtColor(rgb, cv2.COLOR_RGB2YCrCb)
+        mask = cv2.inRange(
+            ycrcb,
+            (0, SKIN_CR_RANGE[0], SKIN_CB_RANGE[0]),
+            (255, SKIN_CR_RANGE[1], SKIN_CB_RANGE[1])
+        )
+        if cv2.countNonZero(mask) < MIN_SKIN_FRACTION * mask.size:
+            mask[:] = 255
+        
+        lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
+        self.lab_l = lab[:, :, 0]
+        self.lab_a = lab[:, :, 1]
+        self.gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        self.mask = mask
+        self.skin_pixels = cv2.countNonZero(mask)
+
+    def masked_mean(self, values):
+        return cv2.mean(values, mask=self.mask)[0]
+
+    def masked_fraction(self, binary):
+        return cv2.countNonZero(cv2.bitwise_and(binary, self.mask)) / self.skin_pixels
+
+def _skin_planes(image):
+    return image if isinstance(image, _SkinPlanes) else _SkinPlanes(image)
+
+def _scale_to_score(value, low, high):
+    """Map value linearly from [low, high] onto a 0-100 score."""
+    return float(np.clip((value - low) / (high - low), 0.0, 1.0) * 100)
+
+def compute_skin_metrics(image):
+    """
+    Compute all colorimetric skin metrics for an image in one pass.
+    
+    The color conversions and skin mask are computed once and shared by
+    every metric.
+    
+    Args:
+        image: Face crop as a PIL image, RGB array or preprocessed model input
+        
+    Returns:
+        dict: Texture, redness, pores, wrinkles and spots results
+    """
+    planes = _SkinPlanes(image)
+    return {
+        "texture": analyze_skin_texture(planes),
+        "redness": measure_redness(planes),
+        "pores": detect_pores(planes),
+        "wrinkles": detect_wrinkles(planes),
+        "spots": detect_spots(planes)
+    }
+
+def compute_region_metrics(regions):
+    """
+    Compute skin metrics on the face regions where each one is meaningful.
+    
+    Texture and redness are read from the cheeks, pores from the cheeks and
+    T-zone, wrinkles from the forehead and spots from cheeks and forehead.
+    
+    Args:
+        regions (dict): RGB crops keyed by region name, as produced by
+            services.face_regions.extract_face_regions
+        
+    Returns:
+        dict: Same keys as compute_skin_metrics
+    """
+    cheeks = _SkinPlanes(np.hstack([regions['left_cheek'], regions['right_cheek']]))
+    forehead = _SkinPlanes(regions['forehead'])
+    t_zone = _SkinPlanes(regions['t_zone'])
+    return {
+        "texture": analyze_skin_texture(cheeks),
+        "redness": measure_redness(cheeks),
+        "pores": (detect_pores(cheeks) + detect_pores(t_zone)) / 2,
+        "wrinkles": detect_wrinkles(forehead),
+        "spots": (detect_spots(cheeks) + detect_spots(forehead)) / 2
+    }
+
 def analyze_skin_texture(image):
     """
     Analyze skin texture from image.
     
+    Smoothness comes from local variance of the luminance, uniformity from
+    its spread across the skin, and roughness from Laplacian energy.
+    
     Args:
         image: Preprocessed image
         
@@ -145,17 +437,21 @@ def analyze_skin_texture(image):
         dict: Texture analysis results
     """
     try:
-        # Convert to numpy array if it's not already
-        if not isinstance(image, np.ndarray):
-            image = np.array(image)
+        planes = _skin_planes(image)
+        gray = planes.gray.astype(np.float32)
         
-        # In a real application, this would use texture analysis algorithms
-        # For this example, we'll return simulated results
+        # Local variance: E[x^2] - E[x]^2 over a 5x5 window
+        mean = cv2.boxFilter(gray, -1, (5, 5))
+        mean_sq = cv2.boxFilter(gray * gray, -1, (5, 5))
+        local_std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+        
+        _, lightness_std = cv2.meanStdDev(planes.lab_l, mask=planes.mask)
+        laplacian = np.abs(cv2.Laplacian(gray, cv2.CV_32F, ksize=3))
         
         texture_analysis = {
-            "smoothness": np.random.uniform(0.4, 0.9),
-            "uniformity": np.random.uniform(0.3, 0.8),
-            "roughness": np.random.uniform(0.2, 0.7)
+            "smoothness": 1 - _scale_to_score(planes.masked_mean(local_std), 2, 20) / 100,
+            "uniformity": 1 - _scale_to_score(float(lightness_std[0][0]), 5, 40) / 100,
+            "roughness": _scale_to_score(planes.masked_mean(laplacian), 5, 60) / 100
         }
         
         return texture_analysis
@@ -168,6 +464,9 @@ def measure_redness(image):
     """
     Measure redness in the skin.
     
+    Uses the mean of the LAB a* channel over the skin mask; 128 is neutral
+    and higher values are redder.
+    
     Args:
         image: Preprocessed image
         
@@ -175,14 +474,9 @@ def measure_redness(image):
         float: Redness score (0-100)
     """
     try:
-        # Convert to numpy array if it's not already
-        if not isinstance(image, np.ndarray):
-            image = np.array(image)
-        
-        # In a real application, this would analyze the red channel
-        # For this example, we'll return a simulated score
+        planes = _skin_planes(image)
         
-        redness_score = np.random.uniform(30, 70)
+        redness_score = _scale_to_score(planes.masked_mean(planes.lab_a), 135, 165)
         
         return redness_score
         
@@ -194,17 +488,23 @@ def detect_pores(image):
     """
     Detect and analyze pores in the image.
     
+    Pores show up as small dark points, isolated with a black-hat transform
+    and counted as a share of the skin area.
+    
     Args:
         image: Preprocessed image
         
     Returns:
-        float: Pore score (0-100)
+        float: Pore score (0-100), higher means more visible pores
     """
     try:
-        # In a real application, this would use image processing to detect pores
-        # For this example, we'll return a simulated score
+        planes = _skin_planes(image)
+        
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        blackhat = cv2.morphologyEx(planes.gray, cv2.MORPH_BLACKHAT, kernel)
+        _, pores = cv2.threshold(blackhat, 12, 255, cv2.THRESH_BINARY)
         
-        pore_score = np.random.uniform(40, 80)
+        pore_score = _scale_to_score(planes.masked_fraction(pores), 0.0, 0.12)
         
         return pore_score
         
@@ -216,6 +516,9 @@ def detect_wrinkles(image):
     """
     Detect and analyze wrinkles in the image.
     
+    Measures oriented edge energy on a band-passed luminance image. Wrinkles
+    are long lines, so the dominant orientation's energy is what counts.
+    
     Args:
         image: Preprocessed image
         
@@ -223,10 +526,17 @@ def detect_wrinkles(image):
         float: Wrinkle score (0-100)
     """
     try:
-        # In a real application, this would use edge detection algorithms
-        # For this example, we'll return a simulated score
+        planes = _skin_planes(image)
+        gray = planes.gray.astype(np.float32)
+        
+        # Band-pass to drop both sensor noise and broad shading
+        band = cv2.GaussianBlur(gray, (3, 3), 0) - cv2.GaussianBlur(gray, (15, 15), 0)
+        grad_x = cv2.Sobel(band, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(band, cv2.CV_32F, 0, 1, ksize=3)
         
-        wrinkle_score = np.random.uniform(20, 70)
+        energy = max(planes.masked_mean(np.abs(grad_x)), planes.masked_mean(np.abs(grad_y)))
+        
+        wrinkle_score = _scale_to_score(energy, 2, 25)
         
         return wrinkle_score
         
@@ -238,6 +548,9 @@ def detect_spots(image):
     """
     Detect dark spots and hyperpigmentation.
     
+    Adaptive thresholding of the LAB L* channel marks patches clearly darker
+    than their surroundings; the score reflects their share of the skin.
+    
     Args:
         image: Preprocessed image
         
@@ -245,10 +558,14 @@ def detect_spots(image):
         float: Spots score (0-100)
     """
     try:
-        # In a real application, this would use color analysis
-        # For this example, we'll return a simulated score
+        planes = _skin_planes(image)
+        
+        lightness = cv2.medianBlur(planes.lab_l, 3)
+        spots = cv2.adaptiveThreshold(
+            lightness, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 10
+        )
         
-        spots_score = np.random.uniform(30, 80)
+        spots_score = _scale_to_score(planes.masked_fraction(spots), 0.0, 0.15)
         
         return spots_score
         
@@ -271,8 +588,8 @@ def calculate_skin_health_score(results):
         # For this example, we'll use a simple average
         
         scores = [
-            results.get("pores", 50),
-            results.get("redness", 50),
+            100 - results.get("pores", 50),  # Invert so lower is better
+            100 - results.get("redness", 50),  # Invert so lower is better
             results.get("texture", {}).get("smoothness", 0.5) * 100,
             100 - results.get("spots", 50),  # Invert so lower is better
             100 - results.get("wrinkles", 50)  # Invert so lower is better
@@ -0,0 +1,174 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary for routing chatbot messages. Each family maps a value to the
+# terms that signal it; the order of values is their precedence when a
+# family takes a single value. A trailing '*' matches any word ending, and
+# every other term also matches its plural.
+
+INTENT_TERMS = {
+    'recommendation': ['recommend*', 'suggestion', 'what should i use for'],
+    'routine': ['routine', 'regimen', 'steps', 'order'],
+    'ingredient': ['ingredient', 'what is', 'purpose of', 'benefits of'],
+    'frequency': ['how often', 'frequency', 'daily', 'weekly'],
+    'compatibility': ['can i use', 'mix', 'combine', 'together']
+}
+
+CONCERN_TERMS = {
+    'acne': ['acne', 'pimple', 'breakout', 'blemish'],
+    'aging': ['wrinkle', 'aging', 'fine line', 'anti-aging'],
+    'dryness': ['dry', 'dehydrat*', 'flak*'],
+    'oiliness': ['oily', 'shine', 'greasy'],
+    'sensitivity': ['sensitive', 'irritat*', 'redness', 'react*'],
+    'dark spots': ['dark spot', 'hyperpigment*', 'discolor*', 'melasma'],
+    'dullness': ['dull', 'uneven', 'tone', 'brightening', 'glow']
+}
+
+PRODUCT_TYPE_TERMS = {
+    'cleanser': ['cleanser', 'face wash', 'cleaning'],
+    'moisturizer': ['moisturizer', 'cream', 'lotion', 'hydrat*'],
+    'serum': ['serum', 'treatment'],
+    'sunscreen': ['sunscreen', 'spf', 'sun protection'],
+    'toner': ['toner', 'essence'],
+    'mask': ['mask', 'masque'],
+    'exfoliator': ['exfoliat*', 'scrub', 'peel']
+}
+
+SKIN_TYPE_TERMS = {
+    'dry': ['dry skin', 'dry'],
+    'oily': ['oily skin', 'oily'],
+    'combination': ['combination', 'combo'],
+    'sensitive': ['sensitive skin', 'sensitive'],
+    'normal': ['normal skin', 'normal']
+}
+
+TIME_OF_DAY_TERMS = {
+    'morning': ['morning', 'am', 'day', 'daytime'],
+    'evening': ['evening', 'night', 'pm', 'bedtime']
+}
+
+FREQUENCY_TOPIC_TERMS = {
+    'retinol': ['retinol', 'vitamin a', 'tretinoin'],
+    'exfoliation': ['exfoliat*', 'scrub', 'peel', 'aha', 'bha', 'glycolic', 'salicylic'],
+    'vitamin c': ['vitamin c', 'ascorbic'],
+    'mask': ['face mask', 'sheet mask', 'clay mask', 'masque'],
+    'cleanser': ['cleanser', 'cleanse', 'wash'],
+    'moisturizer': ['moisturizer', 'moisturize', 'cream', 'lotion'],
+    'sunscreen': ['sunscreen', 'spf', 'sun protection']
+}
+
+INGREDIENT_TERMS = {
+    'retinol': ['retinol'],
+    'vitamin c': ['vitamin c'],
+    'niacinamide': ['niacinamide'],
+    'aha': ['aha'],
+    'bha': ['bha'],
+    'hyaluronic acid': ['hyaluronic acid'],
+    'peptides': ['peptides'],
+    'vitamin e': ['vitamin e'],
+    'benzoyl peroxide': ['benzoyl peroxide'],
+    'hydroquinone': ['hydroquinone'],
+    'acids': ['acids'],
+    'salicylic acid': ['salicylic acid'],
+    'glycolic acid': ['glycolic acid'],
+    'ceramides': ['ceramides'],
+    'azelaic acid': ['azelaic acid'],
+    'squalane': ['squalane']
+}
+
+FAMILIES = {
+    'intent': INTENT_TERMS,
+    'concern': CONCERN_TERMS,
+    'product_type': PRODUCT_TYPE_TERMS,
+    'skin_type': SKIN_TYPE_TERMS,
+    'time_of_day': TIME_OF_DAY_TERMS,
+    'frequency_topic': FREQUENCY_TOPIC_TERMS,
+    'ingredient': INGREDIENT_TERMS
+}
+
+def _term_pattern(term):
+    if term.endswith('*'):
+        return re.escape(term[:-1]) + r'\w*'
+    return re.escape(term) + r'(?:e?s)?'
+
+def _trie_pattern(node):
+    # Longer continuations come before the term ending at this node, so the
+    # longest term wins; the \b after the alternation backtracks to shorter ones
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node['children'].items())]
+    alternatives += [suffix + f'(?P<{group}>)' for suffix, group in node['ends']]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+def _build_router():
+    """
+    Compile every term into one pattern, factored into a prefix trie so a
+    position that starts no term fails on its first character. Each term
+    ends in its own empty named group, so match.lastgroup names the term.
+
+    A matched term carries the tags of every family value it signals,
+    including values of shorter terms it contains ('face mask' is also a
+    'mask'), since the pattern consumes the longest term at each position.
+    """
+    tags_by_term = {}
+    for family, values in FAMILIES.items():
+        for value, terms in values.items():
+            for term in terms:
+                tags_by_term.setdefault(term, set()).add((family, value))
+
+    terms = list(tags_by_term)
+    for term in terms:
+        literal = term.rstrip('*')
+        for other in terms:
+            if other != term and re.search(r'\b' + _term_pattern(other) + r'\b', literal):
+                tags_by_term[term] |= tags_by_term[other]
+
+    root = {'children': {}, 'ends': []}
+    group_tags = {}
+    for i, term in enumerate(terms):
+        node = root
+        for char in term.rstrip('*'):
+            node = node['children'].setdefault(char, {'children': {}, 'ends': []})
+        node['ends'].append((r'\w*' if term.endswith('*') else r'(?:e?s)?', f't{i}'))
+        group_tags[f't{i}'] = frozenset(tags_by_term[term])
+
+    pattern = re.compile(r'\b' + _trie_pattern(root) + r'\b')
+    return pattern, group_tags
+
+_ROUTER_PATTERN, _GROUP_TAGS = _build_router()
+
+class RoutedQuery:
+    """Intent and entities extracted from one chatbot message."""
+    __slots__ = ('intent', 'concerns', 'product_type', 'skin_type', 'time_of_day',
+                 'frequency_topic', 'ingredients')
+
+    def __init__(self, found):
+        self.intent = _first(INTENT_TERMS, found['intent'])
+        self.concerns = [value for value in CONCERN_TERMS if value in found['concern']]
+        self.product_type = _first(PRODUCT_TYPE_TERMS, found['product_type'])
+        self.skin_type = _first(SKIN_TYPE_TERMS, found['skin_type'])
+        self.time_of_day = found['time_of_day']
+        self.frequency_topic = _first(FREQUENCY_TOPIC_TERMS, found['frequency_topic'])
+        self.ingredients = [value for value in INGREDIENT_TERMS if value in found['ingredient']]
+
+def _first(values, found):
+    return next((value for value in values if value in found), None)
+
+def route_query(query):
+    """
+    Extract the intent and entities of a message in a single regex pass.
+
+    Args:
+        query (str): Lowercased user message
+
+    Returns:
+        RoutedQuery: Intent (None if no intent term matched), concerns,
+        product type, skin type, time of day, frequency topic and ingredients
+    """
+    found = {family: set() for family in FAMILIES}
+    for match in _ROUTER_PATTERN.finditer(query):
+        for family, value in _GROUP_TAGS[match.lastgroup]:
+            found[family].add(value)
+    return RoutedQuery(found)
@@ -0,0 +1,303 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KNOWLEDGE_BASE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'knowledge_base.json'
+)
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# FAQ questions are short next to their answers, so they count this many
+# times in an FAQ entry's indexed text
+FAQ_QUESTION_BOOST = 3
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how',
+    'i', 'if', 'in', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'should', 'so', 'that',
+    'the', 'this', 'to', 'what', 'when', 'which', 'with', 'you', 'your'
+])
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Levels in the ingredient compatibility matrix; 0 means no advice on the pair
+COMPATIBILITY_LEVELS = ('unknown', 'compatible', 'caution', 'avoid')
+CAUTION = COMPATIBILITY_LEVELS.index('caution')
+
+def stem(word):
+    """
+    Strip common English inflections so that variants of a word share a
+    token ('exfoliate', 'exfoliating', 'exfoliation' -> 'exfoliat').
+
+    Args:
+        word (str): Lowercase word
+
+    Returns:
+        str: Stem, never shorter than three characters
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        word = word[:-3] + 'y'
+    elif word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+
+    for suffix in ('ing', 'ed'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+
+    if word.endswith('tion') and len(word) > 5:
+        word = word[:-3]
+    if word.endswith('e') and len(word) > 3:
+        word = word[:-1]
+    return word
+
+def tokenize(text):
+    """
+    Split text into stemmed, lowercase tokens without stopwords.
+
+    Args:
+        text (str): Any text
+
+    Returns:
+        list: Tokens in order of appearance
+    """
+    return [stem(word) for word in _WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+class BM25Index:
+    """
+    Inverted index ranking documents with Okapi BM25.
+
+    The BM25 weight of every (term, document) pair depends only on the
+    corpus, so it is computed once when the index is built; a search only
+    sums the weights in the postings of the query terms.
+    """
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        """
+        Args:
+            documents (list): Token lists, one per document
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        self.size = len(documents)
+        average_length = sum(len(tokens) for tokens in documents) / self.size if self.size else 0
+
+        term_counts = []
+        document_frequency = {}
+        for tokens in documents:
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            term_counts.append(counts)
+            for token in counts:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        self.postings = {}
+        for doc_id, (tokens, counts) in enumerate(zip(documents, term_counts)):
+            length_norm = k1 * (1 - b + b * len(tokens) / average_length) if average_length else k1
+            for token, tf in counts.items():
+                df = document_frequency[token]
+                idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+                self.postings.setdefault(token, []).append((doc_id, idf * tf * (k1 + 1) / (tf + length_norm)))
+
+    def search(self, tokens, k=5):
+        """
+        Rank documents against query tokens.
+
+        Args:
+            tokens (list): Query tokens from tokenize
+            k (int): Number of results
+
+        Returns:
+            list: Up to k (score, document index) tuples, best first
+        """
+        scores = {}
+        for token in set(tokens):
+            for doc_id, weight in self.postings.get(token, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        return heapq.nlargest(k, ((score, doc_id) for doc_id, score in scores.items()))
+
+class KnowledgeBase:
+    """
+    Chatbot knowledge loaded from a JSON file: FAQ entries, ingredient
+    descriptions and ingredient compatibility notes, each kind with its
+    own BM25 index and the latter two also addressable by name.
+
+    Compatibility levels also form a symmetric matrix over the active
+    ingredients, and ingredient lists are resolved to those actives
+    through their aliases ('sodium hyaluronate' is hyaluronic acid).
+    """
+
+    KINDS = ('faq', 'ingredient', 'compatibility')
+
+    def __init__(self, data):
+        """
+        Args:
+            data (dict): 'faq' ({question, answer}), 'ingredients' ({name,
+                description}) and 'compatibility' ({ingredients, level, note})
+                lists, and 'ingredientAliases' mapping each active to its names
+        """
+        self.passages = {
+            'faq': [
+                {'kind': 'faq', 'title': entry['question'], 'text': entry['answer']}
+                for entry in data.get('faq', [])
+            ],
+            'ingredient': [
+                {'kind': 'ingredient', 'title': entry['name'].lower(), 'text': entry['description']}
+                for entry in data.get('ingredients', [])
+            ],
+            'compatibility': [
+                {'kind': 'compatibility', 'title': ' + '.join(entry['ingredients']).lower(), 'text': entry['note'],
+                 'ingredients': [name.lower() for name in entry['ingredients']],
+                 'level': entry.get('level', 'unknown')}
+                for entry in data.get('compatibility', [])
+            ]
+        }
+
+        self.indexes = {
+            'faq': BM25Index([
+                tokenize(p['title']) * FAQ_QUESTION_BOOST + tokenize(p['text']) for p in self.passages['faq']
+            ]),
+            'ingredient': BM25Index([tokenize(p['title'] + ' ' + p['text']) for p in self.passages['ingredient']]),
+            'compatibility': BM25Index([tokenize(p['title'] + ' ' + p['text']) for p in self.passages['compatibility']])
+        }
+
+        self.ingredients = {p['title']: p for p in self.passages['ingredient']}
+        self.compatibility = {frozenset(p['ingredients']): p for p in self.passages['compatibility']}
+        self._build_compatibility_matrix(data.get('ingredientAliases', {}))
+
+    def _build_compatibility_matrix(self, aliases):
+        actives = set(aliases)
+        for passage in self.passages['compatibility']:
+            actives.update(passage['ingredients'])
+        self.actives = sorted(actives)
+        self.active_index = {name: i for i, name in enumerate(self.actives)}
+
+        self.compatibility_matrix = np.zeros((len(self.actives), len(self.actives)), dtype=np.int8)
+        for passage in self.passages['compatibility']:
+            first, second = (self.active_index[name] for name in passage['ingredients'])
+            level = COMPATIBILITY_LEVELS.index(passage['level'])
+            self.compatibility_matrix[first, second] = self.compatibility_matrix[second, first] = level
+
+        alias_to_active = {name: name for name in self.actives}
+        for name, names in aliases.items():
+            for alias in names:
+                alias_to_active[alias.lower()] = name.lower()
+        self._alias_to_active = alias_to_active
+        # Longest aliases first, so 'l-ascorbic acid' wins over 'ascorbic acid'
+        self._alias_pattern = re.compile(
+            r'\b(' + '|'.join(re.escape(alias) for alias in sorted(alias_to_active, key=len, reverse=True)) + r')s?\b'
+        )
+
+    @classmethod
+    def load(cls, path=DEFAULT_KNOWLEDGE_BASE_PATH):
+        """
+        Load and index a knowledge base file.
+
+        Args:
+            path (str): JSON knowledge base file
+
+        Returns:
+            KnowledgeBase: Indexed knowledge base
+        """
+        started = time.perf_counter()
+        with open(path, encoding='utf-8') as f:
+            knowledge_base = cls(json.load(f))
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Indexed {knowledge_base.size} knowledge base passages from {path} in {elapsed_ms}ms")
+        return knowledge_base
+
+    @property
+    def size(self):
+        return sum(len(passages) for passages in self.passages.values())
+
+    def search(self, query, kind, k=5):
+        """
+        Find the passages of one kind that best match a query.
+
+        Args:
+            query (str): Free text
+            kind (str): 'faq', 'ingredient' or 'compatibility'
+            k (int): Number of results
+
+        Returns:
+            list: Up to k passages (dicts with kind, title, text and score), best first
+        """
+        passages = self.passages[kind]
+        return [
+            dict(passages[doc_id], score=round(score, 4))
+            for score, doc_id in self.indexes[kind].search(tokenize(query), k)
+        ]
+
+    def ingredient(self, name):
+        """Get the passage describing an ingredient, or None."""
+        return self.ingredients.get(name.lower())
+
+    def compatibility_note(self, first, second):
+        """Get the passage on combining two ingredients, in either order, or None."""
+        return self.compatibility.get(frozenset((first.lower(), second.lower())))
+
+    def resolve_actives(self, text):
+        """
+        Find the active ingredients named in an ingredient list or description.
+
+        Args:
+            text (str): Ingredient list or free text
+
+        Returns:
+            tuple: Sorted indexes into actives
+        """
+        return tuple(sorted({
+            self.active_index[self._alias_to_active[match.group(1)]]
+            for match in self._alias_pattern.finditer(text.lower())
+        }))
+
+    def stats(self):
+        stats = {kind: len(passages) for kind, passages in self.passages.items()}
+        stats['actives'] = len(self.actives)
+        return stats
+
+# Loaded once per process, by init_knowledge_base or on first use
+_knowledge_base = None
+_lock = threading.Lock()
+
+def init_knowledge_base(path=None):
+    """
+    Load the chatbot knowledge base, replacing any loaded one.
+
+    Args:
+        path (str, optional): JSON knowledge base file; the bundled one if None
+    """
+    global _knowledge_base
+    knowledge_base = KnowledgeBase.load(path or DEFAULT_KNOWLEDGE_BASE_PATH)
+    with _lock:
+        _knowledge_base = knowledge_base
+
+def get_knowledge_base():
+    """
+    Get the loaded knowledge base, loading the bundled one if none is.
+
+    Returns:
+        KnowledgeBase: Indexed knowledge base
+    """
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _lock:
+            if _knowledge_base is None:
+                _knowledge_base = KnowledgeBase.load(DEFAULT_KNOWLEDGE_BASE_PATH)
+    return _knowledge_base
@@ -0,0 +1,382 @@
+import bisect
+import logging
+import threading
+import time
+from itertools import product as cartesian
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models.product import Product
+from services.intent_router import route_query
+from services.knowledge_base import get_knowledge_base
+from utils.helpers import concern_masks, mask_words, calculate_product_relevance_batch
+
+logger = logging.getLogger(__name__)
+
+# Index state, built lazily once per process from a single catalog scan.
+# Product writes in this process are applied when they commit; writes by
+# other processes are picked up when the index is rebuilt after max_age.
+_index = None
+_lock = threading.Lock()
+_settings = {
+    'max_age': 300.0
+}
+_stats = {
+    'builds': 0,
+    'updates': 0,
+    'lookups': 0
+}
+
+def init_product_index(max_age=300.0):
+    """
+    Configure the top-rated product index.
+
+    Args:
+        max_age (float): Seconds before the index is rebuilt from the database
+    """
+    global _index
+    with _lock:
+        _settings['max_age'] = float(max_age)
+        _index = None
+
+def product_keys(product):
+    """
+    Get the skin types, concerns and product types a product is indexed under.
+
+    Concerns and product types are indexed under their own lowercased names
+    and under the chatbot vocabulary names they map to, so 'wrinkles' is
+    found as 'aging' and 'treatment' as 'serum'. Matching is by whole name,
+    so 'dry' does not match 'dryness'.
+
+    Args:
+        product (Product): Catalog product
+
+    Returns:
+        tuple: (frozenset skin types, frozenset concerns, frozenset product types)
+    """
+    skin_types = frozenset(s.strip().lower() for s in product.suitable_skin_types if s)
+
+    concerns = set()
+    for concern in product.concerns:
+        if concern:
+            concerns.add(concern.strip().lower())
+            concerns.update(route_query(concern.lower()).concerns)
+
+    product_types = set()
+    if product.product_type:
+        product_types.add(product.product_type.strip().lower())
+        routed_type = route_query(product.product_type.lower()).product_type
+        if routed_type:
+            product_types.add(routed_type)
+
+    return skin_types, frozenset(concerns), frozenset(product_types)
+
+def product_snapshot(product):
+    """
+    Capture what the index needs from a product, so it can be applied after
+    the instance is expired.
+
+    Args:
+        product (Product): Catalog product
+
+    Returns:
+        dict: Sort key, concerns, relevance concerns, bucket keys, active
+        ingredients and display summary
+    """
+    skin_types, concerns, product_types = product_keys(product)
+    return {
+        'sort_key': (-(product.rating or 0.0), product.id),
+        'concerns': concerns,
+        # The product's own concern names, as concern_masks compares them for relevance
+        'relevance_concerns': frozenset(c.strip().lower() for c in product.concerns if c),
+        'actives': get_knowledge_base().resolve_actives(
+            ', '.join([product.ingredients or ''] + list(product.key_ingredients))
+        ),
+        'keys': list(cartesian((None,) + tuple(skin_types), (None,) + tuple(concerns), (None,) + tuple(product_types))),
+        'summary': {
+            'id': product.id,
+            'name': product.name,
+            'brand': product.brand,
+            'product_type': product.product_type,
+            'rating': product.rating,
+            'review_count': product.review_count,
+            'key_ingredients': product.key_ingredients
+        }
+    }
+
+class ProductIndex:
+    """
+    Top-rated products per (skin type, concern, product type).
+
+    Every combination of a product's keys, with None standing for "any", is
+    a bucket of product ids kept sorted by rating, so the best products for
+    any single-concern query are the head of one bucket. Each entry keeps
+    the fields the chatbot shows, so lookups do not touch the database.
+
+    Each product's concerns are also kept as a bitmask row, with bit
+    positions that stay fixed for the life of the index, so scoring
+    relevance only has to encode the user's concerns.
+    """
+
+    def __init__(self, products=()):
+        self.built_at = time.monotonic()
+        self._entries = {}
+        self._buckets = {}
+        # Concern name -> bit, product id -> row of _mask_values, and rows freed by removals
+        self._concern_bits = {}
+        self._mask_rows = {}
+        self._mask_values = []
+        self._free_mask_rows = []
+        # _mask_values packed into uint64 words, rebuilt after a change
+        self._mask_array = None
+        for p in products:
+            self.upsert(product_snapshot(p))
+
+    def upsert(self, snapshot):
+        """Add a product snapshot, or re-index a changed product."""
+        self.remove(snapshot['summary']['id'])
+        self._entries[snapshot['summary']['id']] = snapshot
+        for key in snapshot['keys']:
+            bisect.insort(self._buckets.setdefault(key, []), snapshot['sort_key'])
+
+        mask = 0
+        for concern in snapshot['relevance_concerns']:
+            mask |= 1 << self._concern_bits.setdefault(concern, len(self._concern_bits))
+        row = self._free_mask_rows.pop() if self._free_mask_rows else len(self._mask_values)
+        if row == len(self._mask_values):
+            self._mask_values.append(mask)
+        else:
+            self._mask_values[row] = mask
+        self._mask_rows[snapshot['summary']['id']] = row
+        self._mask_array = None
+
+    def remove(self, product_id):
+        """Drop a product from the index if present."""
+        entry = self._entries.pop(product_id, None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            bucket = self._buckets[key]
+            del bucket[bisect.bisect_left(bucket, entry['sort_key'])]
+            if not bucket:
+                del self._buckets[key]
+        self._free_mask_rows.append(self._mask_rows.pop(product_id))
+
+    def top_rated(self, skin_type=None, concerns=(), product_type=None, limit=3):
+        """
+        Get the highest rated products matching every given filter.
+
+        Args:
+            skin_type (str, optional): Skin type the products must suit
+            concerns (list, optional): Concerns the products must all address
+            product_type (str, optional): Product type
+            limit (int): Maximum number of products
+
+        Returns:
+            list: Product summaries, best rated first
+        """
+        concerns = [c.lower() for c in concerns]
+        bucket = self._buckets.get((
+            skin_type.lower() if skin_type else None,
+            concerns[0] if concerns else None,
+            product_type.lower() if product_type else None
+        ), [])
+
+        # Further concerns filter the bucket of the first one
+        results = []
+        for _, product_id in bucket:
+            entry = self._entries[product_id]
+            if all(c in entry['concerns'] for c in concerns[1:]):
+                results.append(entry['summary'])
+                if len(results) == limit:
+                    break
+        return results
+
+    def actives(self, product_ids):
+        """
+        Get the active ingredients of indexed products.
+
+        Args:
+            product_ids (list): Product ids
+
+        Returns:
+            dict: Product id to (summary, active indexes) for the ids that are indexed
+        """
+        return {
+            product_id: (self._entries[product_id]['summary'], self._entries[product_id]['actives'])
+            for product_id in product_ids if product_id in self._entries
+        }
+
+    def concern_masks(self, products, user_concerns):
+        """
+        Get the concern masks of products and a user, for calculate_product_relevance_batch.
+
+        Args:
+            products (list): Product objects
+            user_concerns (list): The user's concern names
+
+        Returns:
+            numpy.ndarray: uint64 masks, one row per product and the user's last,
+            or None if a product is not indexed
+        """
+        rows = [self._mask_rows.get(p.id) for p in products]
+        if None in rows:
+            return None
+
+        # A concern no product lists still makes the user's mask non-empty, so it
+        # gets the first unused bit; it matches nothing
+        unknown_bit = len(self._concern_bits)
+        user_mask = 0
+        for concern in user_concerns or ():
+            if concern:
+                user_mask |= 1 << self._concern_bits.get(concern.strip().lower(), unknown_bit)
+
+        if self._mask_array is None:
+            self._mask_array = mask_words(self._mask_values, unknown_bit + 1)
+        user_row = mask_words([user_mask], unknown_bit + 1)
+        return np.concatenate([self._mask_array[rows], user_row])
+
+    def stats(self):
+        return {
+            'products': len(self._entries),
+            'buckets': len(self._buckets),
+            'ageSeconds': round(time.monotonic() - self.built_at, 1)
+        }
+
+def top_rated_products(skin_type=None, concerns=(), product_type=None, limit=3):
+    """
+    Get the highest rated products for a skin type, concerns and product type.
+
+    Must be called inside an application context the first time, and after
+    the index expires, so the catalog can be read.
+
+    Args:
+        skin_type (str, optional): Skin type the products must suit
+        concerns (list, optional): Concerns the products must all address
+        product_type (str, optional): Product type
+        limit (int): Maximum number of products
+
+    Returns:
+        list: Product summaries (id, name, brand, product_type, rating,
+        review_count, key_ingredients), best rated first
+    """
+    index = _current_index()
+    with _lock:
+        _stats['lookups'] += 1
+        return index.top_rated(skin_type, concerns, product_type, limit)
+
+def product_actives(product_ids):
+    """
+    Get the active ingredients of catalog products, as indexes into the
+    knowledge base's actives.
+
+    Must be called inside an application context the first time, and after
+    the index expires, so the catalog can be read.
+
+    Args:
+        product_ids (list): Product ids
+
+    Returns:
+        dict: Product id to (summary, active indexes) for ids in the catalog
+    """
+    index = _current_index()
+    with _lock:
+        _stats['lookups'] += 1
+        return index.actives(product_ids)
+
+def score_relevance(products, user_concerns):
+    """
+    Calculate the relevance of products to a user's concerns.
+
+    Product concern masks come from the index, so only the user's concerns
+    are encoded per call. Products the index has not seen yet, such as ones
+    another process added since it was built, are encoded from their
+    concerns instead. Must be called inside an application context the
+    first time, and after the index expires, so the catalog can be read.
+
+    Args:
+        products (list): Product objects
+        user_concerns (list): Concern names
+
+    Returns:
+        numpy.ndarray: Relevance scores (0-100), in product order
+    """
+    index = _current_index()
+    with _lock:
+        _stats['lookups'] += 1
+        masks = index.concern_masks(products, user_concerns)
+    if masks is None:
+        masks, _ = concern_masks([p.concerns for p in products] + [user_concerns])
+
+    ratings = np.array([p.rating or 0.0 for p in products], dtype=np.float64)
+    return calculate_product_relevance_batch(masks[:-1], ratings, masks[-1])
+
+def get_product_index_stats():
+    """
+    Get product index metrics.
+
+    Returns:
+        dict: Build, update and lookup counters and the size of the current index
+    """
+    with _lock:
+        stats = dict(_stats)
+        if _index is not None:
+            stats.update(_index.stats())
+    return stats
+
+def _current_index():
+    global _index
+    index = _index
+    if index is not None and time.monotonic() - index.built_at < _settings['max_age']:
+        return index
+
+    # Build outside the lock; a concurrent build just wins or loses the swap
+    started = time.perf_counter()
+    index = ProductIndex(Product.query.all())
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    with _lock:
+        _index = index
+        _stats['builds'] += 1
+    logger.info(f"Indexed {index.stats()['products']} products in {elapsed_ms}ms")
+    return index
+
+# Product changes wait in the session until their transaction commits
+_PENDING_KEY = 'product_index_changes'
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _product_saved(mapper, connection, target):
+    # Nothing to keep current until the index is built, e.g. while seeding
+    if _index is None:
+        return
+    # Snapshot the flushed values; the instance is expired by the commit
+    _defer_change(target, product_snapshot(target))
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    if _index is None:
+        return
+    _defer_change(target, None)
+
+def _defer_change(target, snapshot):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, {})[target.id] = snapshot
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes or _index is None:
+        return
+
+    with _lock:
+        for product_id, snapshot in changes.items():
+            if snapshot is None:
+                _index.remove(product_id)
+            else:
+                _index.upsert(snapshot)
+            _stats['updates'] += 1
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
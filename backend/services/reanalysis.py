@@ -0,0 +1,166 @@
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from sqlalchemy import or_
+from models.user import ProgressImage
+from services.image_processing import get_model_version, predict_skin_heads_batch
+from services.skin_analysis import analyze_skin_image
+from services.storage import get_storage, original_key
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+# Blob downloads are I/O bound and run on threads; decoding runs in processes
+FETCH_THREADS = 8
+
+def reanalyze_progress_images(batch_size=32, workers=2, max_rows_per_second=10.0, after_id=0,
+                              force=False, progress_interval=10.0, upload_folder=None):
+    """
+    Recompute skin analysis for stored progress images with the current model.
+
+    Rows are read in primary key order, one batch at a time, so the job can
+    be stopped and restarted at any point. Rows already analyzed by the
+    current model version are skipped unless force is set, which makes a
+    plain rerun resume where the last one stopped. Must be called inside an
+    application context.
+
+    Args:
+        batch_size (int): Rows per inference batch and per write transaction
+        workers (int): Processes decoding and cropping images
+        max_rows_per_second (float): Throttle so live traffic keeps its share of CPU and DB; 0 disables
+        after_id (int): Only rows with a larger id are processed
+        force (bool): Also re-analyze rows already at the current model version
+        progress_interval (float): Seconds between progress log lines
+        upload_folder (str, optional): Directory holding images uploaded before they were
+            content addressed; rows without a digest are skipped if not given
+
+    Returns:
+        dict: Rows updated, skipped and failed, last id, elapsed time and rows per second
+    """
+    model_version = get_model_version()
+    storage = get_storage()
+
+    query = ProgressImage.query
+    if not force:
+        query = query.filter(or_(
+            ProgressImage.analysis_version.is_(None),
+            ProgressImage.analysis_version != model_version
+        ))
+    total = query.filter(ProgressImage.id > after_id).count()
+
+    logger.info(f"Re-analyzing {total} progress images with model {model_version}")
+
+    summary = {'modelVersion': model_version, 'total': total, 'updated': 0, 'skipped': 0, 'failed': 0, 'lastId': after_id}
+    started = time.monotonic()
+    last_report = started
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context, initializer=_init_worker) as decoder, \
+            ThreadPoolExecutor(max_workers=FETCH_THREADS) as fetcher:
+        while True:
+            batch_started = time.monotonic()
+
+            # Keyset pagination: never OFFSET, so each batch is an index range scan
+            rows = (
+                query.with_entities(ProgressImage.id, ProgressImage.image_digest, ProgressImage.image_url)
+                .filter(ProgressImage.id > summary['lastId'])
+                .order_by(ProgressImage.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            summary['lastId'] = rows[-1].id
+
+            # Rows saved before images were content addressed are read from the upload folder
+            located = [row for row in rows if row.image_digest or upload_folder]
+            summary['skipped'] += len(rows) - len(located)
+
+            blobs = list(fetcher.map(lambda row: _fetch_image(storage, row, upload_folder), located))
+            decoded = list(decoder.map(_decode_image, blobs))
+
+            ready = [(row, face) for row, face in zip(located, decoded) if face is not None]
+            summary['failed'] += len(located) - len(ready)
+
+            updates = []
+            if ready:
+                all_heads = predict_skin_heads_batch(np.concatenate([face['input'] for _, face in ready]))
+                for (row, face), heads in zip(ready, all_heads):
+                    try:
+                        results = analyze_skin_image(face['input'], regions=face['regions'], heads=heads)
+                    except Exception:
+                        summary['failed'] += 1
+                        continue
+                    updates.append({
+                        'id': row.id,
+                        'skin_score': results.get('skinScore'),
+                        '_skin_analysis': json.dumps(results.get('skinHealthMetrics')),
+                        'analysis_version': model_version
+                    })
+
+            # One transaction per batch keeps write locks short
+            db.session.bulk_update_mappings(ProgressImage, updates)
+            db.session.commit()
+            summary['updated'] += len(updates)
+
+            now = time.monotonic()
+            if now - last_report >= progress_interval:
+                _log_progress(summary, now - started)
+                last_report = now
+
+            if max_rows_per_second > 0:
+                time.sleep(max(0.0, len(rows) / max_rows_per_second - (time.monotonic() - batch_started)))
+
+    elapsed = time.monotonic() - started
+    summary['elapsedSeconds'] = round(elapsed, 1)
+    done = summary['updated'] + summary['failed'] + summary['skipped']
+    summary['rowsPerSecond'] = round(done / elapsed, 2) if elapsed else 0.0
+    _log_progress(summary, elapsed)
+    return summary
+
+def _init_worker():
+    """Keep decode workers behind live request handling for the CPU."""
+    import cv2
+    cv2.setNumThreads(1)
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+def _fetch_image(storage, row, upload_folder=None):
+    try:
+        if row.image_digest:
+            extension = row.image_url.rsplit('.', 1)[-1].lower()
+            return storage.get(original_key(row.image_digest, extension))
+
+        # Older uploads were saved as <upload folder>/<name> and linked as /uploads/<name>
+        with open(os.path.join(upload_folder, os.path.basename(row.image_url)), 'rb') as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Could not read progress image {row.id}: {str(e)}")
+        return None
+
+def _decode_image(image_bytes):
+    """Decode and crop one image in a worker process; None if it is unreadable."""
+    if image_bytes is None:
+        return None
+
+    from services.face_regions import prepare_face_inputs
+    try:
+        face = prepare_face_inputs(io.BytesIO(image_bytes))
+    except Exception:
+        return None
+
+    # Only send back what the analysis needs
+    return {'input': face['input'], 'regions': face['regions']}
+
+def _log_progress(summary, elapsed):
+    done = summary['updated'] + summary['failed'] + summary['skipped']
+    rate = done / elapsed if elapsed else 0.0
+    logger.info(
+        f"Re-analysis {done}/{summary['total']} rows, {rate:.1f} rows/s, "
+        f"{summary['failed']} failed, resume with --after-id {summary['lastId']}"
+    )
@@ -1,7 +1,9 @@
 import logging
+import numpy as np
 from models.product import Product
 from models.user import UserProfile
 from ml.recommendation_models import content_based_filtering, collaborative_filtering
+from services.product_index import score_relevance
 
 logger = logging.getLogger(__name__)
 
@@ -52,11 +54,13 @@ def get_personalized_recommendations(user_data, limit=20):
         # If user is logged in, get user_id for collaborative filtering
         user_id = user_data.get('user_id')
         
+        concern_names = [c['name'] for c in skin_concerns] if isinstance(skin_concerns, list) and skin_concerns and isinstance(skin_concerns[0], dict) else skin_concerns
+        
         # Generate recommendations using content-based filtering
         recommended_products = content_based_filtering(
             filtered_products,
             skin_type=skin_type,
-            skin_concerns=[c['name'] for c in skin_concerns] if isinstance(skin_concerns, list) and skin_concerns and isinstance(skin_concerns[0], dict) else skin_concerns
+            skin_concerns=concern_names
         )
         
         # If user_id is available, enhance with collaborative filtering
@@ -81,23 +85,21 @@ def get_personalized_recommendations(user_data, limit=20):
             
             recommended_products = merged_recs
         
-        # Limit number of recommendations
-        recommended_products = recommended_products[:limit]
+        # Score every candidate's relevance to the user's concerns in one pass
+        relevance = score_relevance(recommended_products, concern_names)
+        
+        # Rank by relevance; the stable sort keeps the order above for equal scores
+        ranking = np.argsort(-relevance, kind='stable')[:limit]
         
         # Convert to dictionaries and add match scores
         products_with_scores = []
-        for i, product in enumerate(recommended_products):
-            product_dict = product.to_dict()
-            
-            # Calculate match score (decreasing with position)
-            match_score = 100 - (i * (100 / (len(recommended_products) or 1)))
-            product_dict['matchScore'] = int(match_score)
-            
+        for i in ranking:
+            product_dict = recommended_products[i].to_dict()
+            product_dict['matchScore'] = int(round(relevance[i]))
             products_with_scores.append(product_dict)
         
         # Get recommended ingredients based on skin type and concerns
         from services.skin_analysis import get_recommended_ingredients
-        concern_names = [c['name'] for c in skin_concerns] if isinstance(skin_concerns, list) and skin_concerns and isinstance(skin_concerns[0], dict) else skin_concerns
         recommended_ingredients = get_recommended_ingredients(skin_type, [{'name': c} for c in concern_names])
         
         return {
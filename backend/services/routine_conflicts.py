@@ -0,0 +1,123 @@
+import logging
+
+import numpy as np
+
+from services.knowledge_base import get_knowledge_base, COMPATIBILITY_LEVELS, CAUTION
+from services.product_index import product_actives
+
+logger = logging.getLogger(__name__)
+
+def routine_products(routine):
+    """
+    List the products of a saved routine in step order as stored.
+
+    Args:
+        routine (dict): Step name to product dict, as saved by the routine planner
+
+    Returns:
+        list: Product dicts
+    """
+    return [product for product in (routine or {}).values() if product]
+
+def find_routine_conflicts(routines):
+    """
+    Find every pair of products in the same routine whose active
+    ingredients should not be combined.
+
+    Products are resolved to their actives through the product index; a
+    product that is not in the catalog is resolved from the ingredients in
+    the request. Each routine's actives are then compared all at once
+    against the compatibility matrix.
+
+    Must be called inside an application context.
+
+    Args:
+        routines (dict): Routine name (such as 'morning') to a list of
+            products, each a product id or a product dict
+
+    Returns:
+        dict: conflicts (worst first), number of products checked and the
+        products whose ingredients could not be resolved
+    """
+    knowledge_base = get_knowledge_base()
+
+    product_ids = [
+        _product_id(product) for products in routines.values() for product in products
+        if _product_id(product) is not None
+    ]
+    indexed = product_actives(product_ids)
+
+    conflicts = []
+    unresolved = []
+    checked = 0
+    for name, products in routines.items():
+        resolved = []
+        for product in products:
+            summary, actives = _resolve(product, indexed, knowledge_base)
+            if actives is None:
+                unresolved.append(summary)
+            else:
+                resolved.append((summary, actives))
+        checked += len(products)
+        conflicts.extend(_pairwise_conflicts(name, resolved, knowledge_base))
+
+    conflicts.sort(key=lambda c: -COMPATIBILITY_LEVELS.index(c['level']))
+    return {
+        'conflicts': conflicts,
+        'checkedProducts': checked,
+        'unresolvedProducts': unresolved
+    }
+
+def _product_id(product):
+    if isinstance(product, dict):
+        product = product.get('id')
+    try:
+        return int(product) if product is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _resolve(product, indexed, knowledge_base):
+    product_id = _product_id(product)
+    if product_id in indexed:
+        summary, actives = indexed[product_id]
+        return {'id': product_id, 'name': summary['name']}, actives
+
+    if not isinstance(product, dict):
+        return {'id': product_id, 'name': None}, None
+
+    summary = {'id': product_id, 'name': product.get('name')}
+    text = ', '.join([product.get('ingredients') or ''] + list(product.get('keyIngredients') or []))
+    if not text.strip(', '):
+        return summary, None
+    return summary, knowledge_base.resolve_actives(text)
+
+def _pairwise_conflicts(routine_name, resolved, knowledge_base):
+    # One row per (product, active); pairs are compared across products only,
+    # since actives formulated into one product are meant to be together
+    owners = np.array([i for i, (_, actives) in enumerate(resolved) for _ in actives], dtype=np.intp)
+    actives = np.array([a for _, active_ids in resolved for a in active_ids], dtype=np.intp)
+    if len(actives) < 2:
+        return []
+
+    levels = knowledge_base.compatibility_matrix[actives[:, None], actives[None, :]]
+    flagged = np.argwhere((levels >= CAUTION) & (owners[:, None] < owners[None, :]))
+
+    conflicts = []
+    seen = set()
+    for i, j in flagged:
+        first, second = resolved[owners[i]][0], resolved[owners[j]][0]
+        ingredients = sorted((knowledge_base.actives[actives[i]], knowledge_base.actives[actives[j]]))
+        key = (owners[i], owners[j], tuple(ingredients))
+        if key in seen:
+            continue
+        seen.add(key)
+
+        passage = knowledge_base.compatibility_note(*ingredients)
+        conflicts.append({
+            'routine': routine_name,
+            'level': COMPATIBILITY_LEVELS[levels[i, j]],
+            'ingredients': ingredients,
+            'products': [first, second],
+            'advice': passage['text'] if passage else None
+        })
+    return conflicts
@@ -1,10 +1,24 @@
 import numpy as np
 import logging
-from ml.skin_classifier import classify_skin_type
-from ml.concern_detector import detect_concerns
+from ml.skin_classifier import (
+    classify_skin_type, predict_skin_age, analyze_skin_tone,
+    estimate_hydration_level, estimate_oil_production
+)
+from ml.concern_detector import CONCERN_NAMES, detect_concerns, analyze_concern_severity, detect_dark_circles
+from services.image_processing import predict_skin_heads, compute_skin_metrics, compute_region_metrics
 
 logger = logging.getLogger(__name__)
 
+# UV sensitivity (0-100) by skin tone, shared by quiz and image analysis
+UV_SENSITIVITY_BY_TONE = {
+    'very fair': 90,
+    'fair': 80,
+    'medium': 60,
+    'olive': 50,
+    'tan': 40,
+    'deep': 30
+}
+
 def analyze_quiz_results(quiz_data):
     """
     Analyze skin quiz responses to determine skin type, concerns, and properties.
@@ -102,19 +116,7 @@ def analyze_quiz_results(quiz_data):
             oil_production = 90
             
         # UV sensitivity based on skin tone
-        uv_sensitivity = 50  # Default
-        if skin_tone == 'very_fair':
-            uv_sensitivity = 90
-        elif skin_tone == 'fair':
-            uv_sensitivity = 80
-        elif skin_tone == 'medium':
-            uv_sensitivity = 60
-        elif skin_tone == 'olive':
-            uv_sensitivity = 50
-        elif skin_tone == 'tan':
-            uv_sensitivity = 40
-        elif skin_tone == 'deep':
-            uv_sensitivity = 30
+        uv_sensitivity = UV_SENSITIVITY_BY_TONE.get(skin_tone.replace('_', ' '), 50)
             
         # Sensitivity
         sensitivity_level = 50  # Default
@@ -174,12 +176,37 @@ def analyze_quiz_results(quiz_data):
         logger.error(f"Error analyzing quiz results: {str(e)}")
         raise
 
-def analyze_skin_image(image):
+def measure_dark_circles(image, regions):
+    """
+    Score dark circles from the under-eye and cheek crops of one face.
+    
+    Args:
+        image: Preprocessed image data
+        regions (dict): Face region crops from services.face_regions
+        
+    Returns:
+        float: Confidence score (0-1)
+    """
+    return detect_dark_circles(
+        image,
+        under_eye=np.hstack([regions['left_under_eye'], regions['right_under_eye']]),
+        cheek=np.hstack([regions['left_cheek'], regions['right_cheek']])
+    )
+
+def analyze_skin_image(image, regions=None, heads=None, measured=None, dark_circles=None):
     """
     Analyze skin image to determine skin type, concerns, and properties.
     
     Args:
         image: Preprocessed image data
+        regions (dict, optional): Face region crops from
+            services.face_regions; metrics are measured on them when given
+        heads (dict, optional): Skin model output for this image, when it
+            was already run as part of a batch
+        measured (dict, optional): Skin metrics already computed for this
+            image, as returned by compute_region_metrics
+        dark_circles (float, optional): Dark circle score already measured
+            on the under-eye regions, as returned by measure_dark_circles
         
     Returns:
         dict: Analysis results including skin type, concerns, and properties
@@ -187,38 +214,45 @@ def analyze_skin_image(image):
     try:
         logger.info("Analyzing skin image")
         
-        # Use ML models to classify skin type and detect concerns
-        skin_type = classify_skin_type(image)
-        detected_concerns = detect_concerns(image)
+        # One skin model pass produces every head; the ML functions interpret them
+        if heads is None:
+            heads = predict_skin_heads(image)
+        skin_type = classify_skin_type(image, scores=heads['skin_type'])
+        concern_head = heads['concerns']
+        if dark_circles is None and regions:
+            dark_circles = measure_dark_circles(image, regions)
+        if dark_circles is not None:
+            # Dark circles are measured directly on the under-eye region
+            concern_head = concern_head.copy()
+            concern_head[CONCERN_NAMES.index('dark_circles')] = dark_circles
+        detected_concerns = detect_concerns(image, scores=concern_head)
+        concern_scores = dict(zip(CONCERN_NAMES, concern_head))
+        severity_scores = dict(zip(CONCERN_NAMES, heads['severity']))
         
         # Convert detected concerns to the required format
         skin_concerns = []
-        for concern, severity_score in detected_concerns.items():
-            severity = 'low'
-            if severity_score > 0.7:
-                severity = 'high'
-            elif severity_score > 0.4:
-                severity = 'medium'
-                
+        for concern in detected_concerns:
             skin_concerns.append({
                 'name': concern.replace('_', ' ').title(),
-                'severity': severity
+                'severity': analyze_concern_severity(image, concern, score=float(severity_scores[concern]))
             })
         
-        # Calculate skin properties based on image analysis
-        # These would normally come from the ML model
-        hydration = np.random.randint(40, 90)
-        oil_production = np.random.randint(40, 90)
-        uv_sensitivity = np.random.randint(40, 90)
-        sensitivity_level = np.random.randint(40, 90)
+        # Calculate skin properties from the model heads
+        skin_tone = analyze_skin_tone(image, scores=heads['tone'])
+        hydration = int(round(estimate_hydration_level(image, value=heads['hydration'])))
+        oil_production = int(round(estimate_oil_production(image, value=heads['oil'])))
+        uv_sensitivity = UV_SENSITIVITY_BY_TONE.get(skin_tone, 50)
+        sensitivity_level = int(round(float(concern_scores['sensitivity']) * 100))
         
-        # Calculate skin health metrics
+        # Measure skin health metrics from the image (higher is healthier)
+        if measured is None:
+            measured = compute_region_metrics(regions) if regions else compute_skin_metrics(image)
         skin_health_metrics = {
-            'texture': np.random.randint(40, 90),
-            'pores': np.random.randint(40, 90),
-            'redness': np.random.randint(40, 90),
-            'pigmentation': np.random.randint(40, 90),
-            'wrinkles': np.random.randint(40, 90),
+            'texture': int(round(measured['texture'].get('smoothness', 0.5) * 100)),
+            'pores': int(round(100 - measured['pores'])),
+            'redness': int(round(100 - measured['redness'])),
+            'pigmentation': int(round(100 - measured['spots'])),
+            'wrinkles': int(round(100 - measured['wrinkles'])),
             'hydration': hydration
         }
         
@@ -226,8 +260,7 @@ def analyze_skin_image(image):
         skin_score = int(np.mean(list(skin_health_metrics.values())))
         
         # Estimate skin age
-        # In a real app, this would be based on more sophisticated analysis
-        skin_age = np.random.randint(20, 45)  # Random for demo purposes
+        skin_age = predict_skin_age(image, value=heads['age'])
         
         # Generate recommended ingredients based on concerns
         recommended_ingredients = get_recommended_ingredients(skin_type, skin_concerns)
@@ -235,6 +268,7 @@ def analyze_skin_image(image):
         # Compile results
         results = {
             'skinType': skin_type,
+            'skinTone': skin_tone,
             'skinConcerns': skin_concerns,
             'skinProperties': {
                 'hydration': hydration,
@@ -0,0 +1,349 @@
+import abc
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# File extension for each image format PIL can identify from the header
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'MPO': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+    'GIF': 'gif',
+    'BMP': 'bmp',
+    'TIFF': 'tiff'
+}
+
+# Longest side in pixels of each generated thumbnail, and the encodings written for each
+THUMBNAIL_SIZES = (160, 480)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+# Thumbnail used for list and grid previews
+PREVIEW_THUMBNAIL = (480, 'webp')
+
+class UploadTooLarge(Exception):
+    """Raised when an uploaded file exceeds the configured size limit."""
+
+class UnsupportedImage(Exception):
+    """Raised when an uploaded file is not an image format we accept."""
+
+class StorageBackend(abc.ABC):
+    """
+    Interface for blob storage. Keys are relative paths such as
+    'originals/ab/cd/<sha256>.jpg'.
+    """
+
+    @abc.abstractmethod
+    def put(self, key, data, content_type=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def exists(self, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def url(self, key):
+        raise NotImplementedError
+
+class LocalStorageBackend(StorageBackend):
+    """Store blobs under a local directory, served by the app at base_url."""
+
+    def __init__(self, root, base_url='/uploads'):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data, content_type=None):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # Rename last so the blob only appears once it is complete
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+class S3StorageBackend(StorageBackend):
+    """
+    Store blobs in an S3-compatible bucket. endpoint_url points the client
+    at a local stand-in such as MinIO; public_url is the base URL clients
+    use to fetch objects.
+    """
+
+    def __init__(self, bucket, endpoint_url=None, public_url=None, prefix=''):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('The S3 storage backend requires boto3')
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        if public_url:
+            self.public_url = public_url.rstrip('/')
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data, content_type=None):
+        extra = {
+            # Keys are content addressed, so objects never change
+            'CacheControl': 'public, max-age=31536000, immutable'
+        }
+        if content_type:
+            extra['ContentType'] = content_type
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, **extra)
+
+    def get(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response['Body'].read()
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def url(self, key):
+        return f"{self.public_url}/{self._object_key(key)}"
+
+# Active backend, configured once per process by init_storage
+_backend = None
+
+# Blob writes and thumbnail encoding run here so responses do not wait on them
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+
+def init_storage(backend):
+    """
+    Set the storage backend used for uploads.
+
+    Args:
+        backend (StorageBackend): Backend instance
+    """
+    global _backend
+    _backend = backend
+    logger.info(f"Upload storage using {type(backend).__name__}")
+
+def get_storage():
+    """
+    Get the configured storage backend.
+
+    Returns:
+        StorageBackend: Active backend
+    """
+    if _backend is None:
+        raise RuntimeError('Upload storage has not been initialized')
+    return _backend
+
+def read_upload(file_storage, max_bytes):
+    """
+    Read an uploaded file into memory in chunks, enforcing a size limit.
+
+    Args:
+        file_storage: Uploaded file from request.files
+        max_bytes (int): Maximum accepted file size
+
+    Returns:
+        bytes: File contents
+
+    Raises:
+        UploadTooLarge: If the file is larger than max_bytes
+    """
+    buffer = io.BytesIO()
+    stream = file_storage.stream
+
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        buffer.write(chunk)
+
+    return buffer.getvalue()
+
+def detect_image_extension(image_bytes):
+    """
+    Identify the image format from the file header without decoding pixels.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+
+    Returns:
+        str: File extension for the image format
+
+    Raises:
+        UnsupportedImage: If the bytes are not a supported image
+    """
+    try:
+        # Image.open only parses the header; pixel data is decoded lazily
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image_format = img.format
+    except Exception:
+        raise UnsupportedImage('File is not a readable image')
+
+    if image_format not in IMAGE_EXTENSIONS:
+        raise UnsupportedImage(f"Unsupported image format: {image_format}")
+
+    return IMAGE_EXTENSIONS[image_format]
+
+def decode_preview(image_bytes):
+    """
+    Decode an upload once, at the smallest size that still covers the
+    largest thumbnail, for perceptual hashing and thumbnail generation.
+
+    JPEG decoders scale by 1/2, 1/4 or 1/8 while decoding, so a large
+    photo is never decoded at full resolution here.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+
+    Returns:
+        PIL.Image.Image: Upright RGB image
+
+    Raises:
+        UnsupportedImage: If the pixel data cannot be decoded
+    """
+    largest = max(THUMBNAIL_SIZES)
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft('RGB', (largest, largest))
+            # Phone photos are often stored sideways with an EXIF orientation tag
+            return ImageOps.exif_transpose(img).convert('RGB')
+    except Exception:
+        raise UnsupportedImage('File is not a readable image')
+
+def content_digest(data):
+    """
+    Compute the content address for a blob.
+
+    Args:
+        data (bytes): Blob contents
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def original_key(digest, extension):
+    """Key for an uploaded original, sharded by hash prefix."""
+    return f"originals/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+def thumbnail_key(digest, size, extension):
+    """Key for a generated thumbnail, sharded by hash prefix."""
+    return f"thumbnails/{digest[:2]}/{digest[2:4]}/{digest}_{size}.{extension}"
+
+def thumbnail_urls(digest):
+    """
+    Build the URLs of every thumbnail for an original.
+
+    Args:
+        digest (str): Content digest of the original
+
+    Returns:
+        dict: URL per size and extension, e.g. {'160': {'webp': ..., 'jpg': ...}}
+    """
+    storage = get_storage()
+    return {
+        str(size): {
+            extension: storage.url(thumbnail_key(digest, size, extension))
+            for extension in THUMBNAIL_FORMATS
+        }
+        for size in THUMBNAIL_SIZES
+    }
+
+def store_image(image_bytes, extension, preview=None):
+    """
+    Store an uploaded image and its thumbnails under its content address.
+
+    Keys and URLs are deterministic, so they are returned immediately while
+    the writes and thumbnail encoding happen in the background. Uploading
+    the same bytes again reuses the existing blobs.
+
+    Args:
+        image_bytes (bytes): Encoded image file contents
+        extension (str): File extension from detect_image_extension
+        preview (PIL.Image.Image, optional): The upload from decode_preview, reused
+            for the thumbnails; taken over by the writer, which resizes it in place
+
+    Returns:
+        dict: Content digest, original URL and thumbnail URLs
+    """
+    storage = get_storage()
+    digest = content_digest(image_bytes)
+
+    _writer.submit(_write_image_blobs, storage, digest, image_bytes, extension, preview)
+
+    return {
+        'digest': digest,
+        'url': storage.url(original_key(digest, extension)),
+        'thumbnails': thumbnail_urls(digest)
+    }
+
+def _write_image_blobs(storage, digest, image_bytes, extension, preview=None):
+    try:
+        key = original_key(digest, extension)
+        if storage.exists(key):
+            return
+
+        for thumb_key, data, content_type in _render_thumbnails(digest, image_bytes, preview):
+            storage.put(thumb_key, data, content_type=content_type)
+
+        # Write the original last; its presence marks the whole set as complete
+        storage.put(key, image_bytes, content_type=mimetypes.guess_type(key)[0])
+
+    except Exception as e:
+        logger.error(f"Error storing image {digest}: {str(e)}")
+
+def _render_thumbnails(digest, image_bytes, preview=None):
+    img = preview if preview is not None else decode_preview(image_bytes)
+
+    # Resize from the largest size down so each step starts from fewer pixels
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        img.thumbnail((size, size), Image.LANCZOS)
+        for extension, (image_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = io.BytesIO()
+            img.save(buffer, format=image_format, **options)
+            yield (
+                thumbnail_key(digest, size, extension),
+                buffer.getvalue(),
+                mimetypes.guess_type(f"x.{extension}")[0]
+            )
@@ -0,0 +1,187 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models.user import User, UserProfile, UserRoutine, UserFeedback
+from utils.database import db
+
+logger = logging.getLogger(__name__)
+
+# Context state, configured once per process by init_user_context. A commit
+# that writes a user's account, profile, routine or feedback drops their
+# context in the process that made it; other processes reload it after ttl.
+_contexts = OrderedDict()
+_lock = threading.Lock()
+_versions = itertools.count(1)
+_invalidation_epoch = 0
+_settings = {
+    'max_entries': 10000,
+    'ttl': 60.0
+}
+_stats = {
+    'hits': 0,
+    'loads': 0,
+    'invalidations': 0
+}
+
+class UserContext:
+    """
+    Everything personalized endpoints read about one user, decoded once.
+
+    Shared between requests, so callers must treat it as read-only. The
+    version identifies this snapshot; a reload or a write yields a new one.
+    """
+    __slots__ = ('user_id', 'version', 'loaded_at', 'user', 'has_profile', 'skin_type', 'concerns',
+                 'allergies', 'lifestyle', 'has_routine', 'morning_routine', 'evening_routine', 'ratings')
+
+    def __init__(self, user_id, user, profile, routine, ratings):
+        self.user_id = user_id
+        self.version = next(_versions)
+        self.loaded_at = time.monotonic()
+        self.user = {
+            'id': user.id,
+            'email': user.email,
+            'name': user.name,
+            'created_at': user.created_at
+        } if user is not None else None
+        self.has_profile = profile is not None
+        self.skin_type = profile.skin_type if profile else None
+        self.concerns = profile.concerns if profile else []
+        self.allergies = profile.allergies if profile else []
+        self.lifestyle = profile.lifestyle_factors if profile else {}
+        self.has_routine = routine is not None
+        self.morning_routine = routine.morning_routine if routine else {}
+        self.evening_routine = routine.evening_routine if routine else {}
+        self.ratings = ratings
+
+    @property
+    def rating_summary(self):
+        """Number and average of the user's product ratings."""
+        count = len(self.ratings)
+        return {
+            'count': count,
+            'average': round(sum(self.ratings.values()) / count, 2) if count else None
+        }
+
+def init_user_context(max_entries=10000, ttl=60.0):
+    """
+    Configure the per-user context cache.
+
+    Args:
+        max_entries (int): Contexts kept before the least recently used is evicted
+        ttl (float): Seconds before a context is reloaded from the database
+    """
+    with _lock:
+        _contexts.clear()
+        _settings.update({
+            'max_entries': max(1, int(max_entries)),
+            'ttl': float(ttl)
+        })
+
+    logger.info(f"User context cache configured for {max_entries} users")
+
+def get_user_context(user_id):
+    """
+    Get a user's context, loading it if it is not cached or has expired.
+
+    Must be called inside an application context.
+
+    Args:
+        user_id (int): User ID; JWT identities given as strings are accepted
+
+    Returns:
+        UserContext: Context whose user is None if the user does not exist
+    """
+    # Token identities may be strings while model ids are integers
+    key = str(user_id)
+    now = time.monotonic()
+    with _lock:
+        context = _contexts.get(key)
+        if context is not None and now - context.loaded_at < _settings['ttl']:
+            _contexts.move_to_end(key)
+            _stats['hits'] += 1
+            return context
+        epoch = _invalidation_epoch
+
+    context = _load(user_id)
+    with _lock:
+        _stats['loads'] += 1
+        # A write committed while loading may not be in what was read
+        if epoch != _invalidation_epoch:
+            return context
+        _contexts[key] = context
+        _contexts.move_to_end(key)
+        while len(_contexts) > _settings['max_entries']:
+            _contexts.popitem(last=False)
+    return context
+
+def invalidate_user_context(user_id):
+    """Drop a user's cached context so the next reader reloads it."""
+    global _invalidation_epoch
+    with _lock:
+        _invalidation_epoch += 1
+        if _contexts.pop(str(user_id), None) is not None:
+            _stats['invalidations'] += 1
+
+def get_user_context_stats():
+    """
+    Get user context cache metrics.
+
+    Returns:
+        dict: Hit, load and invalidation counters and the number of cached users
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_contexts)
+    return stats
+
+def _load(user_id):
+    user = db.session.get(User, int(user_id))
+    profile = UserProfile.query.filter_by(user_id=user_id).first()
+    routine = UserRoutine.query.filter_by(user_id=user_id).first()
+    ratings = dict(
+        db.session.query(UserFeedback.product_id, UserFeedback.rating)
+        .filter(UserFeedback.user_id == user_id)
+        .all()
+    )
+    return UserContext(user_id, user, profile, routine, ratings)
+
+# Changed users wait in the session until the transaction commits, so a
+# concurrent reader cannot cache what it read before the commit
+_PENDING_KEY = 'user_context_invalidations'
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    _defer_invalidation(target, target.id)
+
+@event.listens_for(UserProfile, 'after_insert')
+@event.listens_for(UserProfile, 'after_update')
+@event.listens_for(UserProfile, 'after_delete')
+@event.listens_for(UserRoutine, 'after_insert')
+@event.listens_for(UserRoutine, 'after_update')
+@event.listens_for(UserRoutine, 'after_delete')
+@event.listens_for(UserFeedback, 'after_insert')
+@event.listens_for(UserFeedback, 'after_update')
+@event.listens_for(UserFeedback, 'after_delete')
+def _user_data_changed(mapper, connection, target):
+    _defer_invalidation(target, target.user_id)
+
+def _defer_invalidation(target, user_id):
+    session = object_session(target)
+    if session is None:
+        invalidate_user_context(user_id)
+    else:
+        session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        invalidate_user_context(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import models.product  # noqa: F401  Registers the tables user_feedbacks refers to
+from models.analysis_job import AnalysisJob
+from services import analysis_jobs
+from services.analysis_jobs import (
+    init_analysis_jobs, submit_analysis_job, IdempotencyConflict, _claim_next_job, _execute
+)
+from services.analysis_pool import AnalysisPoolBusy
+from utils.database import db
+
+IMAGE = b'first image bytes'
+OTHER_IMAGE = b'second image bytes'
+
+@pytest.fixture
+def app(monkeypatch):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    # Jobs are claimed and executed by the tests, never by background threads
+    monkeypatch.setattr(analysis_jobs, 'ensure_job_dispatchers', lambda: None)
+
+    with app.app_context():
+        db.create_all()
+        init_analysis_jobs(app, max_attempts=2, retry_backoff=2.0, lease_seconds=60, start_dispatchers=False)
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def fail_analysis(error):
+    def run_analysis(image_bytes):
+        raise error
+    return run_analysis
+
+def reload_job(job_id):
+    db.session.expire_all()
+    return db.session.get(AnalysisJob, job_id)
+
+def make_runnable(job_id):
+    job = reload_job(job_id)
+    job.run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_claim_takes_a_job_only_once(app):
+    job, created = submit_analysis_job(IMAGE)
+    assert created
+
+    assert _claim_next_job() == job.id
+    assert _claim_next_job() is None
+
+    job = reload_job(job.id)
+    assert job.status == 'running'
+    assert job.attempts == 1
+    assert job.lease_expires_at > datetime.utcnow()
+
+def test_expired_lease_is_reclaimed(app):
+    job, _ = submit_analysis_job(IMAGE)
+    assert _claim_next_job() == job.id
+
+    job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert _claim_next_job() == job.id
+    assert reload_job(job.id).attempts == 2
+
+def test_successful_run_stores_result_and_drops_image(app, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, 'run_analysis', lambda image_bytes: {'skinScore': 72})
+    job, _ = submit_analysis_job(IMAGE)
+
+    _execute(_claim_next_job())
+
+    job = reload_job(job.id)
+    assert job.status == 'succeeded'
+    assert job.result == {'skinScore': 72}
+    assert job.image_data is None
+    assert job.finished_at is not None
+
+def test_failure_is_retried_with_backoff_until_max_attempts(app, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, 'run_analysis', fail_analysis(RuntimeError('model crashed')))
+    job, _ = submit_analysis_job(IMAGE)
+
+    before = datetime.utcnow()
+    _execute(_claim_next_job())
+
+    job = reload_job(job.id)
+    assert job.status == 'queued'
+    assert job.error == 'model crashed'
+    assert job.run_after >= before + timedelta(seconds=2)
+    # Not claimable until the backoff has passed
+    assert _claim_next_job() is None
+
+    make_runnable(job.id)
+    _execute(_claim_next_job())
+
+    job = reload_job(job.id)
+    assert job.status == 'failed'
+    assert job.attempts == 2
+    assert job.image_data is None
+    assert _claim_next_job() is None
+
+def test_busy_pool_requeues_without_spending_an_attempt(app, monkeypatch):
+    monkeypatch.setattr(analysis_jobs, 'run_analysis', fail_analysis(AnalysisPoolBusy(5)))
+    job, _ = submit_analysis_job(IMAGE)
+
+    before = datetime.utcnow()
+    _execute(_claim_next_job())
+
+    job = reload_job(job.id)
+    assert job.status == 'queued'
+    assert job.attempts == 0
+    assert job.error is None
+    assert job.run_after >= before + timedelta(seconds=5)
+
+def test_idempotency_key_replays_the_original_job(app):
+    job, created = submit_analysis_job(IMAGE, user_id=1, idempotency_key='upload-1')
+    replayed, replay_created = submit_analysis_job(IMAGE, user_id=1, idempotency_key='upload-1')
+
+    assert created and not replay_created
+    assert replayed.id == job.id
+    assert AnalysisJob.query.count() == 1
+
+def test_idempotency_key_reused_for_another_image_conflicts(app):
+    submit_analysis_job(IMAGE, user_id=1, idempotency_key='upload-1')
+
+    with pytest.raises(IdempotencyConflict):
+        submit_analysis_job(OTHER_IMAGE, user_id=1, idempotency_key='upload-1')
+
+def test_idempotency_keys_are_per_user(app):
+    first, _ = submit_analysis_job(IMAGE, user_id=1, idempotency_key='upload-1')
+    second, created = submit_analysis_job(OTHER_IMAGE, user_id=2, idempotency_key='upload-1')
+
+    assert created
+    assert second.id != first.id
+
+def test_anonymous_idempotency_key_is_ignored(app):
+    first, _ = submit_analysis_job(IMAGE, idempotency_key='upload-1')
+    second, created = submit_analysis_job(OTHER_IMAGE, idempotency_key='upload-1')
+
+    assert created
+    assert second.id != first.id
+    assert second.idempotency_key is None
@@ -0,0 +1,84 @@
+import pytest
+from flask import Flask
+
+import models.user  # noqa: F401  Registers the tables products refers to
+from models.product import Product
+from services import product_index
+from services.product_index import init_product_index, score_relevance
+from utils.database import db
+from utils.helpers import calculate_product_relevance
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        init_product_index()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        init_product_index()
+
+def add_product(name, concerns, rating=0.0):
+    product = Product(name=name, rating=rating)
+    product.concerns = concerns
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+@pytest.fixture
+def products(app):
+    return [
+        add_product('Acne Gel', ['Acne', 'Oiliness'], rating=4.5),
+        add_product('Night Cream', ['Aging', 'dryness'], rating=3.0),
+        add_product('Plain Cleanser', [], rating=5.0),
+        add_product('Unrated Serum', ['acne', 'redness'])
+    ]
+
+@pytest.mark.parametrize('user_concerns', [
+    ['acne'],
+    ['ACNE ', 'dryness', 'aging'],
+    ['rosacea'],
+    ['acne', 'rosacea'],
+    []
+])
+def test_scores_match_single_product_relevance(products, user_concerns):
+    scores = score_relevance(products, user_concerns)
+
+    assert list(scores) == [calculate_product_relevance(p, user_concerns) for p in products]
+
+def test_product_masks_come_from_the_index(products, monkeypatch):
+    expected = [calculate_product_relevance(p, ['aging']) for p in products]
+    score_relevance(products, ['acne'])
+
+    # Per call, only the user's concerns are encoded
+    monkeypatch.setattr(Product, 'concerns', property(lambda self: pytest.fail('product concerns decoded')))
+    assert list(score_relevance(products, ['aging'])) == expected
+
+def test_committed_concern_changes_are_scored(products):
+    score_relevance(products, ['redness'])
+
+    products[1].concerns = ['redness']
+    db.session.commit()
+
+    assert list(score_relevance(products, ['redness'])) == [calculate_product_relevance(p, ['redness']) for p in products]
+
+def test_products_missing_from_the_index_are_encoded_directly(products):
+    score_relevance(products, ['acne'])
+
+    # Another process's insert reaches this one only when the index is rebuilt
+    product_index._index.remove(products[0].id)
+
+    assert list(score_relevance(products, ['acne'])) == [calculate_product_relevance(p, ['acne']) for p in products]
+
+def test_more_concerns_than_one_mask_word(app):
+    products = [add_product(f'Product {i}', [f'concern {i}', 'shared'], rating=4.0) for i in range(70)]
+
+    scores = score_relevance(products, ['concern 69', 'shared'])
+
+    assert scores[69] == calculate_product_relevance(products[69], ['concern 69', 'shared'])
+    assert scores[0] == calculate_product_relevance(products[0], ['concern 69', 'shared'])
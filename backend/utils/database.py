@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
 import logging
 import json
 import os
@@ -9,6 +11,15 @@ db = SQLAlchemy()
 
 logger = logging.getLogger(__name__)
 
+# Columns added to tables after they were first released, by table name.
+# create_all only creates missing tables, so upgrade_schema adds these to
+# databases created by an earlier version.
+ADDED_COLUMNS = {
+    'progress_images': ('image_digest', 'analysis_version', 'phash', 'duplicate_of_id'),
+    'products': ('_review_concerns', 'mined_review_count'),
+    'user_feedbacks': ('_concern_tags',)
+}
+
 def init_db():
     """
     Initialize database and create tables if they don't exist.
@@ -19,6 +30,7 @@ def init_db():
         
         # Create all tables
         db.create_all()
+        upgrade_schema()
         
         # Check if we need to seed the database
         if should_seed_database():
@@ -30,6 +42,40 @@ def init_db():
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
+def upgrade_schema():
+    """
+    Add any columns listed in ADDED_COLUMNS that an existing table lacks,
+    along with their indexes.
+    
+    Returns:
+        list: 'table.column' names that were added
+    """
+    inspector = inspect(db.engine)
+    added = []
+    
+    with db.engine.begin() as connection:
+        for table_name, column_names in ADDED_COLUMNS.items():
+            table = db.metadata.tables.get(table_name)
+            if table is None or not inspector.has_table(table_name):
+                continue
+            
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name in existing:
+                    continue
+                
+                column = table.c[name]
+                definition = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {definition}')
+                for index in table.indexes:
+                    if name in index.columns:
+                        index.create(connection, checkfirst=True)
+                added.append(f'{table_name}.{name}')
+    
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+    return added
+
 def should_seed_database():
     """
     Check if the database should be seeded with initial data.
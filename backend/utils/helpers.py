@@ -2,6 +2,7 @@ import re
 import logging
 import json
 from datetime import datetime, date
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -89,6 +90,31 @@ def sanitize_input(text):
     sanitized = re.sub(r'[<>\'";]', '', text)
     return sanitized
 
+# Keywords for common skin concerns in feedback, in the order concerns are reported
+FEEDBACK_CONCERN_KEYWORDS = {
+    "acne": ["acne", "pimple", "breakout", "blemish", "zit"],
+    "wrinkles": ["wrinkle", "fine line", "aging", "anti-aging", "age"],
+    "dryness": ["dry", "flaky", "dehydrated", "tight", "parched"],
+    "oiliness": ["oily", "greasy", "shiny", "sebum"],
+    "sensitivity": ["sensitive", "irritation", "irritated", "reaction", "redness"],
+    "dark spots": ["dark spot", "hyperpigmentation", "discoloration", "melasma", "sun spot"],
+    "dullness": ["dull", "tired", "glow", "radiance", "bright"],
+    "texture": ["texture", "rough", "smooth", "bumpy", "uneven"]
+}
+
+def _build_feedback_concern_pattern(concern_keywords):
+    # One named group per concern, so a single scan reports every concern
+    groups = {}
+    alternatives = []
+    for i, (concern, keywords) in enumerate(concern_keywords.items()):
+        groups[f'c{i}'] = concern
+        # Longest first, so 'anti-aging' is taken whole rather than as 'anti' + 'aging'
+        keywords = sorted(keywords, key=len, reverse=True)
+        alternatives.append(f'(?P<c{i}>' + '|'.join(re.escape(keyword) for keyword in keywords) + ')')
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')\b'), groups
+
+_FEEDBACK_CONCERN_PATTERN, _FEEDBACK_CONCERN_GROUPS = _build_feedback_concern_pattern(FEEDBACK_CONCERN_KEYWORDS)
+
 def extract_concerns_from_feedback(feedback_text):
     """
     Extract skin concerns from user feedback text.
@@ -97,30 +123,19 @@ def extract_concerns_from_feedback(feedback_text):
         feedback_text (str): User feedback text
         
     Returns:
-        list: Extracted skin concerns
-    """
-    concerns = []
-    
-    # Define keywords for common skin concerns
-    concern_keywords = {
-        "acne": ["acne", "pimple", "breakout", "blemish", "zit"],
-        "wrinkles": ["wrinkle", "fine line", "aging", "anti-aging", "age"],
-        "dryness": ["dry", "flaky", "dehydrated", "tight", "parched"],
-        "oiliness": ["oily", "greasy", "shiny", "sebum"],
-        "sensitivity": ["sensitive", "irritation", "irritated", "reaction", "redness"],
-        "dark spots": ["dark spot", "hyperpigmentation", "discoloration", "melasma", "sun spot"],
-        "dullness": ["dull", "tired", "glow", "radiance", "bright"],
-        "texture": ["texture", "rough", "smooth", "bumpy", "uneven"]
-    }
+        list: Extracted skin concerns, in FEEDBACK_CONCERN_KEYWORDS order
+    """
+    if not feedback_text:
+        return []
     
-    # Check for each concern in the feedback text
-    for concern, keywords in concern_keywords.items():
-        for keyword in keywords:
-            if re.search(r'\b' + re.escape(keyword) + r'\b', feedback_text.lower()):
-                concerns.append(concern)
-                break  # Found one keyword for this concern, no need to check others
+    # Scan the text once, stopping early if every concern has been found
+    found = set()
+    for match in _FEEDBACK_CONCERN_PATTERN.finditer(feedback_text.lower()):
+        found.add(match.lastgroup)
+        if len(found) == len(_FEEDBACK_CONCERN_GROUPS):
+            break
     
-    return concerns
+    return [concern for group, concern in _FEEDBACK_CONCERN_GROUPS.items() if group in found]
 
 def calculate_product_relevance(product, user_concerns):
     """
@@ -133,35 +148,87 @@ def calculate_product_relevance(product, user_concerns):
     Returns:
         float: Relevance score (0-100)
     """
-    if not user_concerns:
-        return 50  # Neutral score if no concerns specified
+    masks, _ = concern_masks([product.concerns, user_concerns])
+    return float(calculate_product_relevance_batch(masks[:1], np.array([product.rating or 0.0]), masks[1])[0])
+
+def concern_masks(concern_lists):
+    """
+    Encode concern lists as bitmasks, giving every distinct concern a bit.
+    Concerns are compared case-insensitively.
     
-    # Base score starts at 50
-    score = 50
+    Args:
+        concern_lists (list): Concern lists, e.g. every candidate product's and the user's
+        
+    Returns:
+        tuple: (numpy.ndarray uint64 masks shaped (len(concern_lists), words)
+        with 64 concerns per word, dict lowercase concern to bit position)
+    """
+    vocabulary = {}
+    row_masks = []
+    for concerns in concern_lists:
+        mask = 0
+        for concern in concerns or ():
+            if concern:
+                mask |= 1 << vocabulary.setdefault(concern.strip().lower(), len(vocabulary))
+        row_masks.append(mask)
     
-    # Check if product addresses user concerns
-    product_concerns = product.concerns
-    if not product_concerns:
-        return score
+    return mask_words(row_masks, len(vocabulary)), vocabulary
+
+def mask_words(row_masks, bits):
+    """
+    Pack integer bitmasks into uint64 words, 64 bits per word.
     
-    # Count matching concerns
-    matching_concerns = set(user_concerns).intersection(set(product_concerns))
-    match_count = len(matching_concerns)
+    Args:
+        row_masks (list): Integer masks, one per row
+        bits (int): Highest bit position in use plus one
+        
+    Returns:
+        numpy.ndarray: uint64 masks shaped (len(row_masks), words)
+    """
+    words = max(1, (bits + 63) // 64)
+    if words == 1:
+        masks = np.fromiter(row_masks, dtype=np.uint64, count=len(row_masks))
+    else:
+        masks = np.array([
+            [(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(words)] for mask in row_masks
+        ], dtype=np.uint64)
+    return masks.reshape(len(row_masks), words)
+
+def calculate_product_relevance_batch(product_masks, ratings, user_mask):
+    """
+    Calculate the relevance score of many products for a user's concerns at once.
     
-    # Adjust score based on matches
-    if match_count > 0:
-        # More matches = higher score
-        score += min(match_count * 10, 40)  # Cap at +40 points
+    Scores match calculate_product_relevance: 50 when the user or the
+    product has no concerns, otherwise 50 plus 10 per shared concern (at
+    most 40) plus (rating - 2.5) * 5 for rated products, within 0-100.
     
-    # Consider product rating
-    if product.rating:
-        # Adjust score by up to 10 points based on rating
-        score += (product.rating - 2.5) * 5  # Rating from 0-5 maps to -12.5 to +12.5
+    Args:
+        product_masks (numpy.ndarray): Product concern masks from concern_masks
+        ratings (numpy.ndarray): Product ratings, 0 for unrated
+        user_mask (numpy.ndarray): The user's concern mask, encoded in the same
+            concern_masks call as the products
+        
+    Returns:
+        numpy.ndarray: float64 relevance scores (0-100), one per product
+    """
+    if not user_mask.any():
+        return np.full(len(product_masks), 50.0)
+    
+    match_count = _popcount(product_masks & user_mask).sum(axis=1)
+    ratings = np.asarray(ratings, dtype=np.float64)
     
-    # Ensure score is within 0-100 range
-    score = max(0, min(100, score))
+    scores = 50.0 + np.minimum(match_count * 10, 40) + np.where(ratings > 0, (ratings - 2.5) * 5, 0.0)
+    scores = np.clip(scores, 0, 100)
     
-    return score
+    # Products that list no concerns stay neutral
+    return np.where(product_masks.any(axis=1), scores, 50.0)
+
+def _popcount(masks):
+    # numpy 2.0 has a native popcount; older versions count the unpacked bits
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks).astype(np.int64)
+    bits = np.unpackbits(np.ascontiguousarray(masks).view(np.uint8), axis=-1)
+    return bits.reshape(masks.shape + (64,)).sum(axis=-1)
 
 def find_alternative_ingredients(ingredient):
     """
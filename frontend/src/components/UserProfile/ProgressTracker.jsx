@@ -465,7 +465,7 @@ const ProgressTracker = () => {
                 >
                   <Box position="relative" h="200px">
                     <Image
-                      src={item.imageUrl}
+                      src={item.thumbnailUrl || item.imageUrl}
                       alt={`Progress photo from ${item.date}`}
                       objectFit="cover"
                       w="100%"
@@ -578,7 +578,7 @@ const ProgressTracker = () => {
                       onClick={() => handleImageClick(item)}
                     >
                       <Image
-                        src={item.imageUrl}
+                        src={item.thumbnailUrl || item.imageUrl}
                         alt={`Progress photo from ${item.date}`}
                         objectFit="cover"
                         w="100%"